@@ -1,9 +1,13 @@
 import os
-import joblib
 import numpy as np
 import pandas as pd
 from functools import lru_cache
-from influxdb_client import InfluxDBClient
+from model_registry import Calibration, ModelRegistry
+from influx_client import INFLUXDB_BUCKET, get_query_api
+from live_window import LIVE_WINDOWS
+from history_cache import HISTORY_CACHE, hold_readings
+from window_features import WindowAggregator, scale_aggregates
+from response_format import epoch_ms
 import json
 
 # ───────────────────────── Load Normal Range JSON ─────────────────────────
@@ -56,12 +60,8 @@ def compute_severity_score(feature, value, brand, model):
         print(f"[severity_score] ⚠️ Cannot compute severity score for {feature}: {e}")
         return -1
 
-# ───────────────────────── InfluxDB Config ─────────────────────────
-# InfluxDB settings - update these with your real values
-INFLUXDB_URL = "http://localhost:8086"
-INFLUXDB_TOKEN = "rLaEXQUWJ2R71NQIEFVfhw18L9xC4knKBf7bPAymrJtz6nukc5NIfPPdoc2dlk0c8n_gGm6kiwi7aDAl-uCmWA=="
-INFLUXDB_ORG = "MotorcycleMaintenance"
-INFLUXDB_BUCKET = "MotorcycleOBDData"
+# ───────────────────────── Config ─────────────────────────
+# InfluxDB settings live in influx_client.py
 
 MODEL_BASE_DIR = "models"
 
@@ -95,34 +95,119 @@ SENSOR_SUGGESTIONS = {
                     "Voltage too low – weak battery, alternator problem, or electrical drain."),
 }
 
+# ───────────────────────── Vectorized Row Classification ─────────────────────────
+# Status codes used by the classification matrices, indexed into STATUS_LABELS.
+STATUS_NORMAL, STATUS_WARNING, STATUS_CRITICAL, STATUS_UNKNOWN = 0, 1, 2, 3
+STATUS_LABELS = np.array(["normal", "warning", "critical", "unknown"], dtype=object)
+
 @lru_cache(maxsize=None)
+def _compile_ranges(brand: str, model: str):
+    """
+    Compile NORMAL_RANGES[brand][model] into threshold arrays ordered like FEATURES.
+    Returns (critical_min, warning_min, warning_max, critical_max, known) where
+    `known` marks the features that have a reference range.
+    """
+    entry = NORMAL_RANGES.get(brand, {}).get(model, {})
+    thresholds = np.full((4, len(FEATURES)), np.nan)
+    known = np.zeros(len(FEATURES), dtype=bool)
+    for j, f in enumerate(FEATURES):
+        r = entry.get(f)
+        if r is None:
+            continue
+        thresholds[:, j] = [r["critical_min"], r["warning_min"], r["warning_max"], r["critical_max"]]
+        known[j] = True
+    if not known.all():
+        missing = [f for f, k in zip(FEATURES, known) if not k]
+        print(f"[classify_matrix] ⚠️ Missing reference for {brand} → {model} → {missing}")
+    return (*thresholds, known)
+
+def classify_matrix(values: np.ndarray, brand: str, model: str):
+    """
+    Vectorized equivalent of classify_value / compute_severity_score.
+    `values` is an (n_rows, len(FEATURES)) array; returns (status, score) matrices
+    of the same shape, where status holds STATUS_* codes and score is 0–100
+    (-1 when the score is undefined, like compute_severity_score).
+    """
+    crit_min, warn_min, warn_max, crit_max, known = _compile_ranges(normalize(brand), normalize(model))
+    values = np.asarray(values, dtype=float)
+
+    critical = (values <= crit_min) | (values >= crit_max)
+    warning = (values <= warn_min) | (values >= warn_max)
+    status = np.where(critical, STATUS_CRITICAL, np.where(warning, STATUS_WARNING, STATUS_NORMAL))
+    status = np.where(known, status, STATUS_UNKNOWN).astype(np.int8)
+
+    low = values < warn_min
+    high = values > warn_max
+    low_span = warn_min - crit_min
+    high_span = crit_max - warn_max
+    with np.errstate(divide="ignore", invalid="ignore"):
+        raw = np.where(low, (warn_min - values) / low_span,
+                       np.where(high, (values - warn_max) / high_span, 0.0))
+    score = np.clip(np.nan_to_num(raw * 100, nan=0.0), 0, 100).astype(np.int16)
+    # A zero-width band between warning and critical has no defined score
+    undefined = (low & (low_span == 0)) | (high & (high_span == 0)) | ~known
+    score[undefined] = -1
+    return status, score
+
+def classify_rows(df: pd.DataFrame, brand: str, model: str) -> list:
+    """Build the `row_anomalies` list for every row with a warning or critical reading."""
+    values = df[FEATURES].to_numpy(dtype=float)
+    status, _ = classify_matrix(values, brand, model)
+    flagged = (status == STATUS_WARNING) | (status == STATUS_CRITICAL)
+    return _describe_rows(df, values, status, flagged, np.flatnonzero(flagged.any(axis=1)))
+
+def _describe_rows(df, values, status, flagged, rows) -> list:
+    """`row_anomalies` entries for the given row positions of `df`."""
+    if rows.size == 0:
+        return []
+
+    index = df.index.to_numpy()[rows].tolist()
+    times = df["_time"].iloc[rows].tolist()
+    row_values = values[rows].tolist()
+    row_labels = STATUS_LABELS[status[rows]].tolist()
+    row_flags = flagged[rows].tolist()
+
+    row_anomalies = []
+    for i, t, vals, labels, flags in zip(index, times, row_values, row_labels, row_flags):
+        row_anomalies.append({
+            "row_index": i,
+            "time": t,
+            "issues": [f"{f}={v:.2f} → {sev}" for f, v, sev, hit in zip(FEATURES, vals, labels, flags) if hit],
+            "values": {**dict(zip(FEATURES, vals)), "_time": t},
+            "severity": dict(zip(FEATURES, labels)),
+        })
+    return row_anomalies
+
+# Bounded LRU of loaded models, revalidated against the .pkl on every lookup
+MODEL_REGISTRY = ModelRegistry(
+    MODEL_BASE_DIR,
+    max_models=int(os.environ.get("MODEL_CACHE_SIZE", "64")),
+    validate=os.environ.get("MODEL_VALIDATE", "mtime"),     # "mtime" or "checksum"
+    mmap=os.environ.get("MODEL_MMAP", "0") == "1",
+    engine=os.environ.get("FOREST_ENGINE", "compiled"),     # "compiled" or "sklearn"
+    max_calibrations=int(os.environ.get("MODEL_CALIBRATION_CACHE_SIZE", "10000")),
+)
+
 def _load_model(brand: str, moto_id: str, mode="idle"):
-    brand = normalize(brand)
-    path = os.path.join(MODEL_BASE_DIR, brand, f"{mode}_{moto_id}.pkl")
-    if not os.path.exists(path):
-        raise FileNotFoundError(path)
-    bundle = joblib.load(path)
-    if not {"model", "scaler"} <= bundle.keys():
-        raise ValueError(f"{path} missing model/scaler keys")
-    return bundle["model"], bundle["scaler"]
+    return MODEL_REGISTRY.get(normalize(brand), str(moto_id), mode)
 
-def _get_window_df(motorcycle_id: str, minutes: int = 30) -> pd.DataFrame:
-    flux = f"""
-    from(bucket: "{INFLUXDB_BUCKET}")
-      |> range(start: -{minutes}m)
-      |> filter(fn: (r) => r._measurement == "obd_data")
-      |> filter(fn: (r) => r.motorcycle_id == "{motorcycle_id}")
-      |> filter(fn: (r) => { " or ".join([f'r._field == "{f}"' for f in FEATURES]) })
-      |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
-      |> keep(columns: [{', '.join([f'"{f}"' for f in ["_time"] + FEATURES]) }])
-    """
+def _load_bundle(brand: str, moto_id: str, mode="idle", model=None):
+    # With `model`, bikes without their own .pkl fall back to the shared brand/model forest
+    return MODEL_REGISTRY.get_bundle(normalize(brand), str(moto_id), mode,
+                                     None if model is None else normalize(model))
 
-    client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
-    df = client.query_api().query_data_frame(flux)
-    client.close()
+def _get_window_df(motorcycle_id: str, minutes: int = 30) -> pd.DataFrame:
+    # Serve hot windows from the MQTT-fed ring buffer, cold/partial ones from InfluxDB
+    df = LIVE_WINDOWS.window_df(motorcycle_id, minutes)
+    if df is not None:
+        print(f"[DEBUG] Window served from live buffer ({len(df)} rows)")
+    else:
+        df = _query_window_df(motorcycle_id, minutes)
+    return _clean_window(df)
+
+def _clean_window(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
-        return pd.DataFrame()
-    df = df.drop(columns=["result", "table"], errors="ignore")
+        return pd.DataFrame(columns=["_time"] + FEATURES)
 
     # Show how many nulls per feature for debugging
     print("[DEBUG] Null count per column:")
@@ -134,120 +219,250 @@ def _get_window_df(motorcycle_id: str, minutes: int = 30) -> pd.DataFrame:
     df = df.sort_values("_time").reset_index(drop=True)
     return df
 
-def detect_anomalies(motorcycle_id: str, brand: str, model: str, mode="idle", minutes=30):
-    try:
-        print(f"\n[INFO] Detecting anomalies for Motorcycle ID: {motorcycle_id}, Brand: {brand}, Model: {model}, Mode: {mode}")
+def _query_window_df(motorcycle_id: str, minutes: int) -> pd.DataFrame:
+    # Windows reaching back past midnight read the finished day from the local cache
+    df = HISTORY_CACHE.read_frame(motorcycle_id, pd.Timestamp.now(tz="UTC") - pd.Timedelta(minutes=minutes))
+    if df is not None:
+        return df
 
-        brand = normalize(brand)
-        model = normalize(model)
+    flux = f"""
+    from(bucket: "{INFLUXDB_BUCKET}")
+      |> range(start: -{minutes}m)
+      |> filter(fn: (r) => r._measurement == "obd_data")
+      |> filter(fn: (r) => r.motorcycle_id == "{motorcycle_id}")
+      |> filter(fn: (r) => { " or ".join([f'r._field == "{f}"' for f in FEATURES]) })
+      |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+      |> keep(columns: [{', '.join([f'"{f}"' for f in ["_time"] + FEATURES]) }])
+    """
 
-        # Step 1: Fetch data from InfluxDB
-        df = _get_window_df(motorcycle_id, minutes)
-        print(f"[DEBUG] Raw data rows from InfluxDB: {len(df)}")
+    df = get_query_api().query_data_frame(flux)
+    if df.empty:
+        return pd.DataFrame()
+    return hold_readings(df.drop(columns=["result", "table"], errors="ignore"))
+
+def _get_window_dfs(motorcycle_ids, minutes: int = 30) -> dict:
+    """
+    Windows for many motorcycles at once: live buffers where they cover the window,
+    one Flux query (grouped by motorcycle_id) for all the rest.
+    """
+    windows = {}
+    cold = []
+    for moto_id in motorcycle_ids:
+        df = LIVE_WINDOWS.window_df(moto_id, minutes)
+        if df is None:
+            cold.append(moto_id)
+        else:
+            windows[moto_id] = df
+
+    if cold:
+        id_set = ", ".join(f'"{m}"' for m in cold)
+        flux = f"""
+        from(bucket: "{INFLUXDB_BUCKET}")
+          |> range(start: -{minutes}m)
+          |> filter(fn: (r) => r._measurement == "obd_data")
+          |> filter(fn: (r) => contains(value: r.motorcycle_id, set: [{id_set}]))
+          |> filter(fn: (r) => { " or ".join([f'r._field == "{f}"' for f in FEATURES]) })
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> keep(columns: [{', '.join([f'"{f}"' for f in ["_time", "motorcycle_id"] + FEATURES]) }])
+        """
+        result = get_query_api().query_data_frame(flux)
+        if isinstance(result, list):        # one frame per table schema
+            result = pd.concat(result, ignore_index=True) if result else pd.DataFrame()
+        if not result.empty:
+            result = result.drop(columns=["result", "table"], errors="ignore")
+            for col in FEATURES:            # a bike may be missing a field entirely
+                if col not in result:
+                    result[col] = np.nan
+            for moto_id, group in result.groupby("motorcycle_id"):
+                windows[str(moto_id)] = hold_readings(group.drop(columns="motorcycle_id"))
+
+    return {m: _clean_window(windows.get(m, pd.DataFrame())) for m in motorcycle_ids}
+
+# ───────────────────────── Streaming Detection ─────────────────────────
+MIN_ROWS = 30       # fewer rows than this → "Not enough data"
+# Above this many window vectors per call sklearn's Cython tree walk overtakes the
+# NumPy traversal of forest_compiler (see bench_forest_compiler.py)
+FOREST_COMPILED_MAX_ROWS = int(os.environ.get("FOREST_COMPILED_MAX_ROWS", "4000"))
+
+class StreamingDetector:
+    """
+    The detect_anomalies pipeline as an accumulator: feed row chunks in order
+    (DataFrames with FEATURES, or (n, len(FEATURES)) arrays) and call result().
+
+    Memory stays bounded by the chunk size whatever the total length:
+      • model windows come from a WindowAggregator and are scored per chunk,
+        only the anomalous-window count is kept
+      • the whole-window aggregate (legacy models) and the per-feature means
+        are running statistics
+      • row classification runs per chunk; `max_row_anomalies` caps how many
+        flagged rows are kept in full (all of them are still counted)
+
+    `row_format="columnar"` keeps the flagged rows as arrays and returns
+    row_anomalies as parallel lists (see response_format.py) instead of one
+    dict per row.
+
+    Feeding one DataFrame gives exactly what detect_anomalies always returned.
+    """
 
-        # Step 2: Clean data — remove rows where all feature values are 0
-        df = df[(df[FEATURES] != 0).any(axis=1)]
-        print(f"[DEBUG] Rows after removing all-zero rows: {len(df)}")
+    def __init__(self, motorcycle_id, brand, model, mode="idle", max_row_anomalies=None, row_format="records"):
+        self.motorcycle_id = motorcycle_id
+        self.brand = normalize(brand)
+        self.model = normalize(model)
+        self.mode = mode
+        self.max_row_anomalies = max_row_anomalies
+        self.row_format = row_format
+        self.rows = 0
+        self.flagged_rows = 0
+        self.kept_rows = 0
+        self.row_anomalies = []     # records, or (row_index, time_ms, values, status) array chunks
+        self._next_index = 0        # RangeIndex offset for array chunks
+        self._pending = []          # rows seen before MIN_ROWS; the model is only loaded once there's enough
+        self._bundle = None
+        self._windows = None        # WindowAggregator, for models trained on sliding windows
+        self._scored = 0
+        self._anomalous = 0
+        n = len(FEATURES)
+        # Whole-window aggregate (NaN propagates, like whole_window_aggregate)
+        self._n = 0
+        self._mean = np.zeros(n)
+        self._m2 = np.zeros(n)
+        self._max = np.full(n, -np.inf)
+        self._min = np.full(n, np.inf)
+        # Per-feature means for the explanations (NaN skipped, like Series.mean)
+        self._sum = np.zeros(n)
+        self._count = np.zeros(n)
+
+    def feed(self, chunk):
+        df = self._as_frame(chunk)
+        df = df[(df[FEATURES] != 0).any(axis=1)]       # drop rows where every feature is 0
+        if df.empty:
+            return
+        X = df[FEATURES].to_numpy(dtype=float)
+        self.rows += len(X)
+        self._update_stats(X)
+        self._classify(df, X)
+        if self._bundle is not None:
+            self._score(X)
+            return
+        self._pending.append(X)
+        if self.rows >= MIN_ROWS:
+            self._bundle = _load_bundle(self.brand, self.motorcycle_id, self.mode, self.model)
+            window_rows = self._bundle.get("window_rows")
+            if window_rows:
+                self._windows = WindowAggregator(window_rows, self._bundle.get("window_step", window_rows))
+            for pending in self._pending:
+                self._score(pending)
+            self._pending = []
+
+    def _as_frame(self, chunk):
+        if isinstance(chunk, pd.DataFrame):
+            return chunk if "_time" in chunk else chunk.assign(_time=None)
+        values = np.asarray(chunk, dtype=float)
+        if values.ndim != 2 or values.shape[1] != len(FEATURES):
+            raise ValueError(f"Array source must have shape (n, {len(FEATURES)}) in FEATURES order")
+        df = pd.DataFrame(values, columns=FEATURES,
+                          index=pd.RangeIndex(self._next_index, self._next_index + len(values)))
+        df.insert(0, "_time", None)
+        self._next_index += len(values)
+        return df
+
+    def _update_stats(self, X):
+        # Chan et al. merge of (count, mean, M2) with this chunk's
+        n_b = len(X)
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+        n = self._n + n_b
+        delta = mean_b - self._mean
+        self._mean = self._mean + delta * (n_b / n)
+        self._m2 = self._m2 + m2_b + delta ** 2 * (self._n * n_b / n)
+        self._n = n
+        self._max = np.maximum(self._max, X.max(axis=0))
+        self._min = np.minimum(self._min, X.min(axis=0))
+        present = ~np.isnan(X)
+        self._sum += np.where(present, X, 0.0).sum(axis=0)
+        self._count += present.sum(axis=0)
+
+    def _classify(self, df, X):
+        status, _ = classify_matrix(X, self.brand, self.model)
+        flagged = (status == STATUS_WARNING) | (status == STATUS_CRITICAL)
+        rows = np.flatnonzero(flagged.any(axis=1))
+        self.flagged_rows += rows.size
+        if self.max_row_anomalies is not None:
+            rows = rows[:max(0, self.max_row_anomalies - self.kept_rows)]
+        self.kept_rows += rows.size
+        if self.row_format == "columnar":
+            if rows.size:
+                self.row_anomalies.append((df.index.to_numpy()[rows], epoch_ms(df["_time"].iloc[rows]),
+                                           X[rows], status[rows]))
+        else:
+            self.row_anomalies.extend(_describe_rows(df, X, status, flagged, rows))
 
-        # Step 3: Check if we have enough data to continue
-        if df.empty or len(df) < 30:
+    def _columnar_rows(self):
+        chunks = self.row_anomalies
+        values = np.vstack([c[2] for c in chunks]) if chunks else np.empty((0, len(FEATURES)))
+        return {
+            "features": FEATURES,
+            "status_labels": STATUS_LABELS.tolist(),
+            "row_index": np.concatenate([c[0] for c in chunks]).tolist() if chunks else [],
+            "time": np.concatenate([c[1] for c in chunks]).tolist() if chunks else [],
+            "values": {f: values[:, j].tolist() for j, f in enumerate(FEATURES)},
+            "status": np.vstack([c[3] for c in chunks]).tolist() if chunks else [],
+        }
+
+    def _score(self, X):
+        if self._windows is None:
+            return                  # scored once in result(), from the whole-window aggregate
+        aggs = self._windows.feed(X)
+        if len(aggs):
+            self._predict(aggs)
+
+    def _predict(self, raw_aggs):
+        scaler = self._bundle["scaler"]
+        if self._bundle.get("source") == "shared":
+            # Cold start on a shared forest: no calibration yet, so centre on this bike's own rows
+            # (range checks still judge absolute levels) with the fleet's typical per-bike spread
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = self._sum / self._count
+            scaler = Calibration(self.model, means, self._bundle.get("bike_scale", scaler.scale_))
+        X = scale_aggregates(raw_aggs, scaler)
+        forest = self._bundle.get("forest")
+        if forest is None or len(X) > FOREST_COMPILED_MAX_ROWS:
+            forest = self._bundle["model"]
+        offset = self._bundle.get("offset")
+        if offset is None:
+            pred = forest.predict(X)
+        else:
+            # Calibrated bike on a shared forest: its own threshold instead of the forest's offset_
+            pred = np.where(forest.score_samples(X) - offset < 0, -1, 1)
+        self._scored += len(pred)
+        self._anomalous += int(np.sum(pred == -1))
+
+    def result(self):
+        print(f"[DEBUG] Rows after removing all-zero rows: {self.rows}")
+        if self.rows < MIN_ROWS:
             print("[WARN] Not enough data to analyze.")
             return {
                 "status": "ok",
-                "motorcycle_id": motorcycle_id,
+                "motorcycle_id": self.motorcycle_id,
                 "message": "Not enough data",
                 "explanations": []
             }
 
-        # Step 4: Load model and scale data
-        model_obj, scaler = _load_model(brand, motorcycle_id, mode)
-        X_scaled = scaler.transform(df[FEATURES].values)
-        print(f"[DEBUG] Scaled input shape: {X_scaled.shape}")
-
-        # Step 5: Aggregate features for prediction
-        agg_features = np.hstack([
-            np.mean(X_scaled, axis=0),
-            np.std(X_scaled, axis=0),
-            np.max(X_scaled, axis=0),
-            np.min(X_scaled, axis=0)
-        ]).reshape(1, -1)
-        print(f"[DEBUG] Aggregated features shape: {agg_features.shape}")
-
-        # Step 6: Make prediction
-        pred = model_obj.predict(agg_features)
-        is_anomaly = (pred[0] == -1)
-        print(f"[RESULT] Model Prediction: {'Anomaly' if is_anomaly else 'Normal'}")
-
-        # Step 7: Interpret sensor values
-        explanations = []
-        abnormal_features = []
-
-        for f in FEATURES:
-            try:
-                mean_value = float(df[f].mean())
-            except:
-                mean_value = 0.0
-
-            severity = classify_value(f, mean_value, brand, model)
-            severity_score = compute_severity_score(f, mean_value, brand, model)
-            desc, high_tip, low_tip = SENSOR_SUGGESTIONS.get(f, ("", "", ""))
-
-            try:
-                if f == "long_fuel_trim_1":
-                    is_high = mean_value > 0
-                else:
-                    r = NORMAL_RANGES[brand][model][f]
-                    midpoint = (r["warning_min"] + r["warning_max"]) / 2
-                    is_high = mean_value > midpoint
-            except:
-                is_high = True
-
-            if severity != "normal":
-                abnormal_features.append(f)
-
-            tip_base = high_tip if is_high else low_tip
-
-            if severity == "critical":
-                level = "High" if is_high else "Low"
-                tip = f"🔴 CRITICAL ({level}): {tip_base} Please consult a mechanic immediately."
-            elif severity == "warning":
-                level = "High" if is_high else "Low"
-                tip = f"🟡 WARNING ({level}): {tip_base} Monitor this and schedule maintenance."
-            elif severity == "normal":
-                tip = "🟢 Normal: Sensor reading is within expected range."
-            else:
-                tip = "⚠️ Unknown: No reference range found."
-
-            explanations.append({
-                "feature": f,
-                "status": severity,
-                "value": round(mean_value, 2),
-                "severity_score": severity_score,
-                "description": desc,
-                "tip": tip
-            })
-
-        # Step 8: Row-level anomalies
-        row_anomalies = []
-        for i, row in df.iterrows():
-            issues = []
-            for f in FEATURES:
-                v = row[f]
-                sev = classify_value(f, v, brand, model)
-                if sev in ["critical", "warning"]:
-                    issues.append(f"{f}={v:.2f} → {sev}")
-            if issues:
-                row_anomalies.append({
-                    "row_index": i,
-                    "time": row["_time"],
-                    "issues": issues,
-                    "values": {**{f: row[f] for f in FEATURES}, "_time": row["_time"]},
-                    "severity": {f: classify_value(f, row[f], brand, model) for f in FEATURES}
-                })
-
-        anomaly_percent = (len(row_anomalies) / len(df)) * 100
-
-        # Step 9: Final message
+        if self._scored == 0:
+            # Legacy models were trained on one aggregate of the whole window (also used when the
+            # window is shorter than one model window)
+            std = np.sqrt(self._m2 / self._n)
+            self._predict(np.hstack([self._mean, std, self._max, self._min]).reshape(1, -1))
+        window_anomaly_share = self._anomalous / self._scored
+        is_anomaly = window_anomaly_share >= 0.5
+        print(f"[RESULT] Model Prediction: {'Anomaly' if is_anomaly else 'Normal'} "
+              f"({window_anomaly_share:.0%} of {self._scored} windows anomalous)")
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = self._sum / self._count
+        explanations, abnormal_features = _explain(dict(zip(FEATURES, means.tolist())), self.brand, self.model)
+        anomaly_percent = (self.flagged_rows / self.rows) * 100
+
         if any(e["status"] == "critical" for e in explanations):
             suggestion = "⚠️ Critical values detected. Please see a mechanic immediately."
         elif any(e["status"] == "warning" for e in explanations):
@@ -257,20 +472,102 @@ def detect_anomalies(motorcycle_id: str, brand: str, model: str, mode="idle", mi
         else:
             suggestion = "✅ All systems within normal range."
 
-        print(f"[SUMMARY] {len(row_anomalies)} row anomalies found ({anomaly_percent:.2f}% of data)")
+        print(f"[SUMMARY] {self.flagged_rows} row anomalies found ({anomaly_percent:.2f}% of data)")
         print(f"[SUMMARY] Abnormal features: {abnormal_features}")
         print(f"[SUGGESTION] {suggestion}")
 
-        return {
+        result = {
             "status": "ok",
-            "motorcycle_id": motorcycle_id,
-            "anomalies_detected": len(row_anomalies),
+            "motorcycle_id": self.motorcycle_id,
+            "anomalies_detected": self.flagged_rows,
             "anomaly_percent": round(anomaly_percent, 2),
             "abnormal_features": abnormal_features,
             "explanations": explanations,
-            "row_anomalies": row_anomalies,
-            "suggestion": suggestion
+            "row_anomalies": self._columnar_rows() if self.row_format == "columnar" else self.row_anomalies,
+            "suggestion": suggestion,
+            "model_source": self._bundle.get("source", "bike"),
         }
+        if self.row_format == "columnar":
+            result["format"] = "columnar"
+        if self.kept_rows < self.flagged_rows:
+            result["row_anomalies_truncated"] = True
+        return result
+
+def _explain(means: dict, brand: str, model: str):
+    """Per-feature explanation from the window mean of each sensor → (explanations, abnormal_features)."""
+    explanations = []
+    abnormal_features = []
+
+    for f in FEATURES:
+        mean_value = means.get(f, 0.0)
+
+        severity = classify_value(f, mean_value, brand, model)
+        severity_score = compute_severity_score(f, mean_value, brand, model)
+        desc, high_tip, low_tip = SENSOR_SUGGESTIONS.get(f, ("", "", ""))
+
+        try:
+            if f == "long_fuel_trim_1":
+                is_high = mean_value > 0
+            else:
+                r = NORMAL_RANGES[brand][model][f]
+                midpoint = (r["warning_min"] + r["warning_max"]) / 2
+                is_high = mean_value > midpoint
+        except:
+            is_high = True
+
+        if severity != "normal":
+            abnormal_features.append(f)
+
+        tip_base = high_tip if is_high else low_tip
+
+        if severity == "critical":
+            level = "High" if is_high else "Low"
+            tip = f"🔴 CRITICAL ({level}): {tip_base} Please consult a mechanic immediately."
+        elif severity == "warning":
+            level = "High" if is_high else "Low"
+            tip = f"🟡 WARNING ({level}): {tip_base} Monitor this and schedule maintenance."
+        elif severity == "normal":
+            tip = "🟢 Normal: Sensor reading is within expected range."
+        else:
+            tip = "⚠️ Unknown: No reference range found."
+
+        explanations.append({
+            "feature": f,
+            "status": severity,
+            "value": round(mean_value, 2),
+            "severity_score": severity_score,
+            "description": desc,
+            "tip": tip
+        })
+    return explanations, abnormal_features
+
+def _iter_chunks(source):
+    # One DataFrame / array, or any iterable of them (e.g. pd.read_csv(..., chunksize=N))
+    if isinstance(source, (pd.DataFrame, np.ndarray)):
+        yield source
+    else:
+        yield from source
+
+def detect_anomalies(motorcycle_id: str, brand: str, model: str, mode="idle", minutes=30, source=None,
+                     max_row_anomalies=None, row_format="records"):
+    """
+    Analyze the last `minutes` of data for one motorcycle.
+    `source` injects the data instead of querying the live buffer / InfluxDB:
+    a DataFrame (`_time` optional + FEATURES), an (n, len(FEATURES)) array, or
+    an iterable of either, scored chunk by chunk (see StreamingDetector).
+    `row_format="columnar"` returns row_anomalies as parallel arrays.
+    """
+    try:
+        print(f"\n[INFO] Detecting anomalies for Motorcycle ID: {motorcycle_id}, Brand: {brand}, Model: {model}, Mode: {mode}")
+
+        if source is None:
+            source = _get_window_df(motorcycle_id, minutes)
+            print(f"[DEBUG] Raw data rows from InfluxDB: {len(source)}")
+
+        detector = StreamingDetector(motorcycle_id, brand, model, mode, max_row_anomalies, row_format)
+        for chunk in _iter_chunks(source):
+            detector.feed(chunk)
+        return detector.result()
 
     except Exception as e:
         print(f"[ERROR] detect_anomalies failed: {e}")
@@ -0,0 +1,176 @@
+"""
+batch_writer.py
+───────────────
+Batched, asynchronous InfluxDB writer used by obddata.py.
+
+Every sample is queued and sent in batches (batch_size / flush_interval with
+jitter) by the influxdb_client batching WriteApi, which also retries failed
+batches with exponential backoff. Batches that still fail after all retries
+are spooled as line protocol to a bounded local file and replayed once
+InfluxDB accepts writes again, so no samples are lost while it is down.
+
+Once points for an earlier UTC day (a replayed spool) are written, that
+day's local history cache file (history_cache.py) is dropped, so it is
+filled again with the late points instead of staying incomplete.
+"""
+
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from influxdb_client import WriteOptions, WritePrecision
+from influx_client import INFLUXDB_BUCKET, get_write_api
+from history_cache import HISTORY_CACHE
+
+# Precision of the timestamps attached to every point (samples are stamped
+# at read time so batching and spooling never shift them)
+WRITE_PRECISION = WritePrecision.MS
+_DAY_MS = 86_400_000
+_MOTORCYCLE_TAG_RE = re.compile(r",motorcycle_id=((?:[^,\\ ]|\\.)+)")
+
+
+class BatchWriter:
+    def __init__(self,
+                 bucket=INFLUXDB_BUCKET,
+                 batch_size=500,
+                 flush_interval_ms=1000,
+                 jitter_interval_ms=200,
+                 retry_interval_ms=1000,
+                 max_retries=5,
+                 max_retry_delay_ms=30000,
+                 exponential_base=2,
+                 spool_path="influx_spool.lp",
+                 spool_max_bytes=50 * 1024 * 1024):
+        self.bucket = bucket
+        self.spool_path = spool_path
+        self.spool_max_bytes = spool_max_bytes
+
+        self._lock = threading.Lock()
+        self._spool_pending = os.path.exists(spool_path) and os.path.getsize(spool_path) > 0
+        self._replaying = False
+        self._last_batch_ok = False     # replay the spool only once InfluxDB accepts writes again
+        # Updated from the write API's batching threads as well as the caller's
+        self._stats_lock = threading.Lock()
+        self.counters = {"queued": 0, "written": 0, "retries": 0, "failed": 0, "spooled": 0,
+                         "replayed": 0, "spool_dropped": 0}
+
+        self._write_api = get_write_api(WriteOptions(
+            batch_size=batch_size,
+            flush_interval=flush_interval_ms,
+            jitter_interval=jitter_interval_ms,
+            retry_interval=retry_interval_ms,
+            max_retries=max_retries,
+            max_retry_delay=max_retry_delay_ms,
+            exponential_base=exponential_base,
+        ), success_callback=self._on_success, error_callback=self._on_error, retry_callback=self._on_retry)
+
+    # ───────────── public API ─────────────
+    def write(self, point):
+        """Queue one Point (or line-protocol string); returns immediately."""
+        self._write_api.write(bucket=self.bucket, record=point, write_precision=WRITE_PRECISION)
+        self._count("queued")
+        if self._spool_pending and self._last_batch_ok and not self._replaying:
+            self._replay_spool()
+
+    def close(self):
+        """Flush queued batches and stop the background writer."""
+        self._write_api.close()
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self.counters)
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.counters[key] += n
+
+    # ───────────── batching callbacks ─────────────
+    def _on_success(self, conf, data):
+        self._count("written", _count_lines(data))
+        self._last_batch_ok = True
+        self._invalidate_history(data)
+
+    def _on_retry(self, conf, data, exception):
+        self._count("retries")
+        print(f"[InfluxDB] Retrying batch ({_count_lines(data)} points): {exception}")
+
+    def _on_error(self, conf, data, exception):
+        lines = _count_lines(data)
+        self._count("failed", lines)
+        self._last_batch_ok = False
+        print(f"[InfluxDB] ⚠️ Batch of {lines} points failed, spooling to disk: {exception}")
+        self._spool(data)
+
+    def _invalidate_history(self, data):
+        """Drop the cached history days this written batch reached back into."""
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        today_ms = int(time.time() * 1000) // _DAY_MS * _DAY_MS
+        days = set()
+        for line in data.splitlines():
+            ts = line.rpartition(" ")[2]
+            if not ts.isdigit() or int(ts) >= today_ms:
+                continue
+            m = _MOTORCYCLE_TAG_RE.search(line)
+            if m:
+                days.add((re.sub(r"\\(.)", r"\1", m.group(1)), int(ts) // _DAY_MS))
+        for motorcycle_id, day in days:
+            try:
+                HISTORY_CACHE.invalidate(motorcycle_id, datetime.fromtimestamp(day * 86400, timezone.utc))
+            except OSError as e:
+                print(f"[InfluxDB] ⚠️ Could not drop cached history of {motorcycle_id}: {e}")
+
+    # ───────────── disk spool ─────────────
+    def _spool(self, data):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        lines = _count_lines(data)
+        with self._lock:
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                f.write(data if data.endswith("\n") else data + "\n")
+            self._count("spooled", lines)
+            self._spool_pending = True
+            self._trim_spool()
+
+    def _trim_spool(self):
+        """Keep the spool under spool_max_bytes by dropping the oldest lines."""
+        size = os.path.getsize(self.spool_path)
+        if size <= self.spool_max_bytes:
+            return
+        with open(self.spool_path, "rb") as f:
+            data = f.read()
+        # Cut at the first line boundary that brings the file back under the limit
+        cut = data.find(b"\n", size - self.spool_max_bytes) + 1 or len(data)
+        dropped = data[:cut].count(b"\n")
+        with open(self.spool_path, "wb") as f:
+            f.write(data[cut:])
+        self._count("spool_dropped", dropped)
+        print(f"[InfluxDB] ⚠️ Spool full, dropped the {dropped} oldest points")
+
+    def _replay_spool(self):
+        """Re-queue spooled lines; anything that fails again is spooled again."""
+        with self._lock:
+            if not os.path.exists(self.spool_path):
+                self._spool_pending = False
+                return
+            replay_path = self.spool_path + ".replay"
+            os.replace(self.spool_path, replay_path)
+            self._spool_pending = False
+            self._replaying = True
+        try:
+            with open(replay_path, encoding="utf-8") as f:
+                lines = [line.rstrip("\n") for line in f if line.strip()]
+            if lines:
+                self._write_api.write(bucket=self.bucket, record=lines, write_precision=WRITE_PRECISION)
+                self._count("replayed", len(lines))
+                print(f"[InfluxDB] Replaying {len(lines)} spooled points")
+            os.remove(replay_path)
+        finally:
+            self._replaying = False
+
+
+def _count_lines(data):
+    if isinstance(data, bytes):
+        return data.count(b"\n") + 1 if data else 0
+    return data.count("\n") + 1 if data else 0
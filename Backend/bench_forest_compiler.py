@@ -0,0 +1,97 @@
+"""
+bench_forest_compiler.py
+────────────────────────
+Compare IsolationForest scoring through sklearn against forest_compiler's
+flattened node arrays, on a forest shaped like train_idle_model's
+(200 trees, 24-feature window vectors, max_samples 256).
+
+Checks that predictions agree and reports the largest decision_function
+difference, then times both engines per batch size. The last row scores
+--fleet bikes' vectors through one stacked CompiledForest against one sklearn
+predict per bike.
+
+Example:
+    python bench_forest_compiler.py --sizes 1 100 10000 --fleet 20
+"""
+
+import argparse
+import time
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+from forest_compiler import CompiledForest
+
+N_FEATURES = 24
+
+
+def train_forest(seed, n_train=20_000):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_train, N_FEATURES))
+    return IsolationForest(n_estimators=200, contamination=0.05, random_state=seed).fit(X)
+
+
+def synthetic_vectors(n, seed):
+    """Scaled window vectors, about 5% of them far off the training distribution."""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, N_FEATURES))
+    X[rng.random(n) < 0.05] *= 4
+    return X
+
+
+def timed(fn, *args, repeat=1):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def check(reference, compiled, predicted_ref, predicted_compiled, label):
+    if not np.array_equal(predicted_ref, predicted_compiled):
+        raise AssertionError(f"Compiled predictions differ from sklearn ({label})")
+    return float(np.abs(reference - compiled).max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compiled vs sklearn IsolationForest scoring")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10_000])
+    parser.add_argument("--fleet", type=int, default=20, help="Bikes in the stacked-forest case")
+    parser.add_argument("--fleet-rows", type=int, default=1, help="Vectors per bike in the fleet case")
+    args = parser.parse_args()
+
+    model = train_forest(0)
+    forest = CompiledForest.from_sklearn(model)
+    print(f"forest: {len(model.estimators_)} trees, {len(forest.feature):,} nodes, "
+          f"max depth {forest.max_depth}, {forest.nbytes / 1024:.0f} KB compiled")
+
+    print(f"{'batch':>10} {'sklearn (ms)':>13} {'compiled (ms)':>14} {'speedup':>9} {'max |Δ decision|':>17}")
+    for n in args.sizes:
+        X = synthetic_vectors(n, n)
+        repeat = 20 if n <= 1000 else 3
+        ref, ref_t = timed(model.decision_function, X, repeat=repeat)
+        out, out_t = timed(forest.decision_function, X, repeat=repeat)
+        diff = check(ref, out, model.predict(X), forest.predict(X), f"batch {n}")
+        print(f"{n:>10,} {ref_t * 1e3:>13.2f} {out_t * 1e3:>14.2f} {ref_t / out_t:>8.1f}x {diff:>17.1e}")
+
+    # One vector batch per bike: sklearn per bike vs one stacked pass
+    models = [train_forest(seed, n_train=2_000) for seed in range(1, args.fleet + 1)]
+    bank = CompiledForest.stack([CompiledForest.from_sklearn(m) for m in models])
+    X = synthetic_vectors(args.fleet * args.fleet_rows, 7)
+    bike = np.repeat(np.arange(args.fleet), args.fleet_rows)
+
+    def per_bike():
+        out = np.empty(len(X))
+        for i, m in enumerate(models):
+            out[bike == i] = m.decision_function(X[bike == i])
+        return out
+
+    ref, ref_t = timed(per_bike, repeat=5)
+    out, out_t = timed(bank.decision_function, X, bike, repeat=5)
+    diff = check(ref, out, np.where(ref < 0, -1, 1), bank.predict(X, bike), "fleet")
+    label = f"fleet {args.fleet}×{args.fleet_rows}"
+    print(f"{label:>10} {ref_t * 1e3:>13.2f} {out_t * 1e3:>14.2f} {ref_t / out_t:>8.1f}x {diff:>17.1e}")
+
+
+if __name__ == "__main__":
+    main()
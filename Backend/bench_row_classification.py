@@ -0,0 +1,82 @@
+"""
+bench_row_classification.py
+───────────────────────────
+Compare the vectorized row classification (anomaly_model.classify_rows)
+against the original per-row iterrows loop on synthetic windows.
+
+Example:
+    python bench_row_classification.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from anomaly_model import FEATURES, NORMAL_RANGES, classify_rows, classify_value
+
+
+def legacy_row_anomalies(df, brand, model):
+    """The original Step 8 loop from detect_anomalies, kept as the baseline."""
+    row_anomalies = []
+    for i, row in df.iterrows():
+        issues = []
+        for f in FEATURES:
+            v = row[f]
+            sev = classify_value(f, v, brand, model)
+            if sev in ["critical", "warning"]:
+                issues.append(f"{f}={v:.2f} → {sev}")
+        if issues:
+            row_anomalies.append({
+                "row_index": i,
+                "time": row["_time"],
+                "issues": issues,
+                "values": {**{f: row[f] for f in FEATURES}, "_time": row["_time"]},
+                "severity": {f: classify_value(f, row[f], brand, model) for f in FEATURES}
+            })
+    return row_anomalies
+
+
+def synthetic_window(n_rows, brand, model, seed=0):
+    """Random readings spread around the warning/critical bands of brand/model."""
+    rng = np.random.default_rng(seed)
+    data = {"_time": pd.date_range("2025-01-01", periods=n_rows, freq="200ms", tz="UTC")}
+    for f in FEATURES:
+        r = NORMAL_RANGES[brand][model][f]
+        centre = (r["warning_min"] + r["warning_max"]) / 2
+        spread = (r["critical_max"] - r["critical_min"]) / 2
+        data[f] = rng.normal(centre, spread * 0.25, n_rows).round(2)
+    return pd.DataFrame(data)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark row-level anomaly classification")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--brand", default="honda")
+    parser.add_argument("--model", default="click_i125")
+    parser.add_argument("--legacy-max-rows", type=int, default=1_000_000,
+                        help="Skip the iterrows baseline above this many rows")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>9} {'anomalies':>10}")
+    for n in args.sizes:
+        df = synthetic_window(n, args.brand, args.model)
+        fast, fast_t = timed(classify_rows, df, args.brand, args.model)
+
+        if n <= args.legacy_max_rows:
+            slow, slow_t = timed(legacy_row_anomalies, df, args.brand, args.model)
+            if slow != fast:
+                raise AssertionError(f"Vectorized output differs from legacy loop at {n} rows")
+            print(f"{n:>10,} {slow_t:>12.3f} {fast_t:>15.3f} {slow_t / fast_t:>8.1f}x {len(fast):>10,}")
+        else:
+            print(f"{n:>10,} {'skipped':>12} {fast_t:>15.3f} {'-':>9} {len(fast):>10,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+bench_scoring_pool.py
+─────────────────────
+Throughput of concurrent detect_anomalies calls scored in threads (the Flask
+request threads, one GIL) against scoring_pool.ScoringPool worker processes.
+
+Trains a throwaway windowed model like train_idle_model's on synthetic idle
+data (models/yamaha/idle_bench.pkl, removed afterwards), then runs --calls
+predictions of --rows-row windows from --concurrency threads for every
+pool size in --workers (0 = in the calling thread). Run from Backend/.
+
+Example:
+    python bench_scoring_pool.py --workers 0 2 4 --calls 64 --concurrency 8
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from anomaly_model import FEATURES
+from scoring_pool import ScoringPool
+from window_features import WindowAggregator, scale_aggregates
+
+BRAND, MODEL, MOTO_ID = "yamaha", "nmax_155", "bench"
+MEANS = [1500, 25, 12, -2, 88, 13.5]
+STDS = [200, 6, 3, 2, 8, 0.6]
+
+
+def synthetic_window(n, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(MEANS, STDS, size=(n, len(FEATURES))), columns=FEATURES)
+    df.insert(0, "_time", pd.date_range("2025-01-01", periods=n, freq="1s", tz="UTC"))
+    return df
+
+
+def train_bundle(path):
+    X = synthetic_window(20_000, 0)[FEATURES].to_numpy()
+    scaler = StandardScaler().fit(X)
+    model = IsolationForest(n_estimators=200, contamination=0.05, random_state=42)
+    model.fit(scale_aggregates(WindowAggregator(50, 10).feed(X), scaler))
+    joblib.dump({"model": model, "scaler": scaler, "window_rows": 50, "window_step": 10}, path, compress=3)
+
+
+def run(pool, windows, concurrency):
+    def call(df):
+        return pool.detect(MOTO_ID, BRAND, MODEL, source=df)
+
+    with ThreadPoolExecutor(concurrency) as threads:
+        list(threads.map(call, windows[:concurrency]))      # warm-up: worker start and model load
+        start = time.perf_counter()
+        results = list(threads.map(call, windows))
+        elapsed = time.perf_counter() - start
+    if any(r.get("status") != "ok" for r in results):
+        raise AssertionError(f"Prediction failed: {results[0]}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark threaded vs process-pool anomaly scoring")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, os.cpu_count() or 1])
+    parser.add_argument("--calls", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=1800, help="Rows per window (30 min at 1 Hz)")
+    args = parser.parse_args()
+
+    path = os.path.join("models", BRAND, f"idle_{MOTO_ID}.pkl")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    train_bundle(path)
+    windows = [synthetic_window(args.rows, seed) for seed in range(args.calls)]
+    try:
+        print(f"{'workers':>8} {'seconds':>9} {'calls/s':>9}")
+        for workers in args.workers:
+            pool = ScoringPool(workers=workers, max_pending=args.calls, timeout_s=600)
+            elapsed = run(pool, windows, args.concurrency)
+            print(f"{workers:>8} {elapsed:>9.2f} {args.calls / elapsed:>9.1f}")
+            if pool._pool is not None:
+                pool._pool.shutdown()
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+collector_supervisor.py
+───────────────────────
+Runs one obddata.py collector per motorcycle, so a shop bay can collect from
+several bikes at once (/start-obd, /stop-obd, /collectors in server.py).
+
+  • collectors are keyed by motorcycle_id; starting one that is already
+    running is a no-op
+  • a collector that exits on its own is restarted with exponential backoff;
+    after OBD_MAX_RESTARTS crashes within OBD_RESTART_WINDOW_S it is marked
+    "failed" and left alone
+  • the budget is bounded: at most OBD_MAX_COLLECTORS at a time, and a
+    collector whose RSS grows past OBD_COLLECTOR_MAX_RSS_MB is restarted
+  • per-collector status: pid, uptime, restarts, CPU / RSS, samples/s seen
+    on MQTT and the per-PID rates the collector reports
+
+Started PIDs are written to a registry file (collectors.json) with their
+process start time. On server start, collectors left over from a previous
+run are found there and terminated; the start time guards against killing
+an unrelated process that reused the PID. This replaces scanning every
+process on the machine.
+"""
+
+import atexit
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+import psutil
+from live_state import LIVE_STATE, remote
+
+OBD_MAX_COLLECTORS = int(os.environ.get("OBD_MAX_COLLECTORS", "4"))
+OBD_MAX_RESTARTS = int(os.environ.get("OBD_MAX_RESTARTS", "5"))
+OBD_RESTART_WINDOW_S = float(os.environ.get("OBD_RESTART_WINDOW_S", "600"))
+OBD_COLLECTOR_MAX_RSS_MB = float(os.environ.get("OBD_COLLECTOR_MAX_RSS_MB", "512"))
+OBD_REGISTRY_PATH = os.environ.get("OBD_REGISTRY_PATH", "collectors.json")
+
+ACTIVE = ("starting", "running", "restarting")
+_RATE_RE = re.compile(r"^\[PID\] achieved Hz: (.*)$")
+_RATE_ITEM_RE = re.compile(r"(\w+) ([\d.]+)/([\d.]+)")
+_SAFE_NAME_RE = re.compile(r"[^\w.-]")
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Collector:
+    def __init__(self, motorcycle_id, args):
+        self.motorcycle_id = motorcycle_id
+        self.args = args                    # extra obddata.py arguments (--port, --simulate)
+        self.status = "starting"
+        self.proc = None
+        self.ps = None                      # psutil handle of proc; kept so cpu_percent has a baseline
+        self.started_at = None
+        self.restarts = 0
+        self.crash_times = deque()
+        self.next_restart_at = None
+        self.last_exit_code = None
+        self.stop_requested = False
+        self.output = deque(maxlen=200)
+        self.pid_rates = {}                 # PID → {"achieved_hz", "target_hz"} from its own report
+        self.samples = 0                    # MQTT messages seen for this motorcycle
+        self.last_sample_at = None
+        self.sample_hz = 0.0
+        self._samples_prev = 0
+
+    @property
+    def pid(self):
+        if self.proc is not None:
+            return self.proc.pid
+        return self.__dict__.get("_snapshot", {}).get("pid")
+
+    def __getstate__(self):
+        # Pickled for an HTTP worker (live_state.py): a snapshot without the process handle
+        return dict(self.__dict__, proc=None, ps=None, _snapshot=self.to_dict(with_output=True))
+
+    def to_dict(self, with_output=False):
+        snapshot = self.__dict__.get("_snapshot")
+        if snapshot is not None:
+            return snapshot if with_output else {k: v for k, v in snapshot.items() if k != "output"}
+        alive = self.proc is not None and self.proc.poll() is None
+        d = {
+            "motorcycle_id": self.motorcycle_id,
+            "status": self.status,
+            "pid": self.proc.pid if alive else None,
+            "args": self.args,
+            "uptime_s": round(time.time() - self.started_at, 1) if alive and self.started_at else None,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+            "samples": self.samples,
+            "sample_hz": round(self.sample_hz, 2),
+            "seconds_since_sample": round(time.time() - self.last_sample_at, 1) if self.last_sample_at else None,
+            "pid_rates": self.pid_rates,
+        }
+        if alive and self.ps is not None:
+            try:
+                d["rss_mb"] = round(self.ps.memory_info().rss / (1024 * 1024), 1)
+                d["cpu_percent"] = self.ps.cpu_percent(interval=None)     # since the previous call
+            except psutil.Error:
+                pass
+        if with_output:
+            d["output"] = "\n".join(self.output)
+        return d
+
+
+class CollectorSupervisor:
+    def __init__(self, script="obddata.py", max_collectors=OBD_MAX_COLLECTORS,
+                 registry_path=OBD_REGISTRY_PATH, max_restarts=OBD_MAX_RESTARTS,
+                 restart_window_s=OBD_RESTART_WINDOW_S, max_rss_mb=OBD_COLLECTOR_MAX_RSS_MB):
+        self.script = script
+        self.max_collectors = max_collectors
+        self.registry_path = registry_path
+        self.max_restarts = max_restarts
+        self.restart_window_s = restart_window_s
+        self.max_rss_mb = max_rss_mb
+        self._collectors = {}           # motorcycle_id → Collector
+        self._lock = threading.RLock()
+        self._monitor = None
+        self._stop = threading.Event()
+
+    # ───────────── control ─────────────
+    def start(self, motorcycle_id, port=None, simulate=False):
+        """Start a collector. Returns (collector, created); raises BudgetExceeded when full."""
+        motorcycle_id = str(motorcycle_id)
+        args = (["--port", str(port)] if port else []) + (["--simulate"] if simulate else [])
+        with self._lock:
+            existing = self._collectors.get(motorcycle_id)
+            if existing is not None and existing.status in ACTIVE:
+                return existing, False
+            running = sum(1 for c in self._collectors.values() if c.status in ACTIVE)
+            if running >= self.max_collectors:
+                raise BudgetExceeded(f"Collector budget reached ({running}/{self.max_collectors} running)")
+            collector = Collector(motorcycle_id, args)
+            if existing is not None:            # keep counters of an earlier, stopped run
+                collector.samples = existing.samples
+            self._collectors[motorcycle_id] = collector
+            try:
+                self._spawn(collector)
+            except Exception:
+                collector.status = "failed"     # not ACTIVE: frees the budget, the next start retries
+                raise
+        self._ensure_monitor()
+        return collector, True
+
+    def stop(self, motorcycle_id, timeout=5):
+        """Stop one collector. Returns the collector, or None if it wasn't running."""
+        with self._lock:
+            collector = self._collectors.get(str(motorcycle_id))
+            if collector is None or collector.status not in ACTIVE:
+                return None
+            collector.stop_requested = True
+            collector.status = "stopping"
+        self._terminate(collector, timeout)
+        with self._lock:
+            collector.status = "stopped"
+            self._write_registry()
+        return collector
+
+    def stop_all(self, timeout=5):
+        with self._lock:
+            ids = [m for m, c in self._collectors.items() if c.status in ACTIVE]
+        return [c for c in (self.stop(m, timeout) for m in ids) if c is not None]
+
+    def record_sample(self, motorcycle_id):
+        """Called for every MQTT message; feeds the per-collector throughput metric."""
+        collector = self._collectors.get(str(motorcycle_id))
+        if collector is not None:
+            collector.samples += 1
+            collector.last_sample_at = time.time()
+
+    def get(self, motorcycle_id):
+        return self._collectors.get(str(motorcycle_id))
+
+    def status(self):
+        with self._lock:
+            collectors = list(self._collectors.values())
+        return {
+            "max_collectors": self.max_collectors,
+            "running": sum(1 for c in collectors if c.status in ACTIVE),
+            "collectors": [c.to_dict() for c in collectors],
+        }
+
+    # ───────────── processes ─────────────
+    def _spawn(self, collector):
+        cmd = [sys.executable, "-u", self.script, collector.motorcycle_id] + collector.args
+        # Each collector needs its own InfluxDB spool file (batch_writer.py), or they'd replay each other's
+        spool = os.environ.get("INFLUX_SPOOL_PATH", "influx_spool.lp") + "." + _SAFE_NAME_RE.sub("_", collector.motorcycle_id)
+        env = dict(os.environ, INFLUX_SPOOL_PATH=spool)
+        print(f"🟢 Starting collector for motorcycle_id={collector.motorcycle_id}: {' '.join(cmd)}")
+        collector.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                          universal_newlines=True, env=env)
+        try:
+            collector.ps = psutil.Process(collector.proc.pid)
+            collector.ps.cpu_percent(interval=None)     # the first call only sets the baseline (returns 0.0)
+        except psutil.Error:
+            collector.ps = None
+        collector.started_at = time.time()
+        collector.status = "running"
+        collector.next_restart_at = None
+        threading.Thread(target=self._pump_output, args=(collector, collector.proc),
+                         daemon=True, name=f"collector-{collector.motorcycle_id}").start()
+        self._write_registry()
+
+    def _pump_output(self, collector, proc):
+        for line in iter(proc.stdout.readline, ""):
+            line = line.rstrip()
+            print(f"[OBD {collector.motorcycle_id}] {line}")
+            collector.output.append(line)
+            m = _RATE_RE.match(line)
+            if m:
+                collector.pid_rates = {
+                    name: {"achieved_hz": float(got), "target_hz": float(want)}
+                    for name, got, want in _RATE_ITEM_RE.findall(m.group(1))
+                }
+
+    def _terminate(self, collector, timeout):
+        proc = collector.proc
+        if proc is None or proc.poll() is not None:
+            return
+        print(f"🛑 Stopping collector for motorcycle_id={collector.motorcycle_id} (PID: {proc.pid})...")
+        proc.terminate()        # obddata.py turns SIGTERM into a clean shutdown (flushes InfluxDB)
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        collector.last_exit_code = proc.returncode
+
+    # ───────────── monitoring ─────────────
+    def _ensure_monitor(self):
+        with self._lock:
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._watch, daemon=True, name="collector-monitor")
+                self._monitor.start()
+
+    def _watch(self, interval=1.0):
+        last = time.monotonic()
+        while not self._stop.wait(interval):
+            now = time.monotonic()
+            dt, last = now - last, now
+            oversized = []
+            with self._lock:
+                for collector in list(self._collectors.values()):
+                    try:
+                        if self._check(collector, dt):
+                            oversized.append(collector)
+                    except Exception as e:
+                        print(f"[Collectors] ⚠️ Monitor error for {collector.motorcycle_id}: {e}")
+            # Outside the lock: terminating can take seconds. The next pass restarts them like a crash
+            for collector in oversized:
+                try:
+                    self._terminate(collector, 5)
+                except Exception as e:
+                    print(f"[Collectors] ⚠️ Could not stop {collector.motorcycle_id}: {e}")
+
+    def _check(self, collector, dt):
+        """One monitor pass for `collector`; True when it outgrew max_rss_mb and has to be terminated."""
+        # Throughput: smoothed MQTT messages/s
+        delta = collector.samples - collector._samples_prev
+        collector._samples_prev = collector.samples
+        collector.sample_hz = 0.7 * collector.sample_hz + 0.3 * (delta / dt)
+
+        if collector.status == "running":
+            code = collector.proc.poll()
+            if code is None:
+                try:
+                    rss_mb = (collector.ps or psutil.Process(collector.proc.pid)).memory_info().rss / (1024 * 1024)
+                except psutil.Error:
+                    rss_mb = 0
+                if rss_mb > self.max_rss_mb:
+                    print(f"[Collectors] ⚠️ {collector.motorcycle_id} uses {rss_mb:.0f} MB "
+                          f"(> {self.max_rss_mb:.0f} MB), restarting")
+                    return True
+                return
+            if collector.stop_requested:
+                return
+            collector.last_exit_code = code
+            now = time.time()
+            collector.crash_times.append(now)
+            while collector.crash_times and now - collector.crash_times[0] > self.restart_window_s:
+                collector.crash_times.popleft()
+            if len(collector.crash_times) > self.max_restarts:
+                print(f"[Collectors] ❌ {collector.motorcycle_id} crashed {len(collector.crash_times)} times "
+                      f"in {self.restart_window_s:.0f}s, giving up")
+                collector.status = "failed"
+                self._write_registry()
+                return
+            delay = min(60.0, 2 ** (len(collector.crash_times) - 1))
+            print(f"[Collectors] ⚠️ {collector.motorcycle_id} exited with code {code}, restarting in {delay:.0f}s")
+            collector.status = "restarting"
+            collector.next_restart_at = now + delay
+
+        elif collector.status == "restarting" and time.time() >= collector.next_restart_at:
+            collector.restarts += 1
+            try:
+                self._spawn(collector)
+            except Exception as e:
+                print(f"[Collectors] ❌ Restart of {collector.motorcycle_id} failed: {e}")
+                collector.status = "failed"
+
+    # ───────────── PID registry ─────────────
+    def _write_registry(self):
+        entries = {}
+        for collector in self._collectors.values():
+            proc = collector.proc
+            if proc is None or proc.poll() is not None:
+                continue
+            try:
+                create_time = psutil.Process(proc.pid).create_time()
+            except psutil.Error:
+                continue
+            entries[collector.motorcycle_id] = {"pid": proc.pid, "create_time": create_time,
+                                                "args": collector.args}
+        tmp = f"{self.registry_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp, self.registry_path)
+
+    def reap_orphans(self, timeout=5):
+        """Terminate collectors a previous server run left behind (from the registry, not a process scan)."""
+        try:
+            with open(self.registry_path) as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return 0
+        reaped = 0
+        for motorcycle_id, entry in entries.items():
+            try:
+                proc = psutil.Process(entry["pid"])
+                if abs(proc.create_time() - entry["create_time"]) > 1:
+                    continue        # PID reused by something else
+                print(f"🔴 Killing leftover collector for motorcycle_id={motorcycle_id} (PID: {proc.pid})...")
+                proc.terminate()
+                try:
+                    proc.wait(timeout=timeout)
+                except psutil.TimeoutExpired:
+                    proc.kill()
+                reaped += 1
+            except (psutil.NoSuchProcess, psutil.AccessDenied, KeyError):
+                continue
+        with self._lock:
+            self._write_registry()
+        return reaped
+
+    def shutdown(self):
+        self._stop.set()
+        self.stop_all()
+
+
+# Process-wide instance used by server.py (owned by the ingest process in multi-worker serving)
+if LIVE_STATE == "remote":
+    COLLECTORS = remote("collectors")
+else:
+    COLLECTORS = CollectorSupervisor()
+    atexit.register(COLLECTORS.shutdown)
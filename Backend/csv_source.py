@@ -0,0 +1,72 @@
+"""
+csv_source.py
+─────────────
+Chunked reader for uploaded OBD logs (/predict-from-csv).
+
+Workshop logs can be hundreds of MB, so the upload is never read into one
+DataFrame: pandas parses it CSV_CHUNK_ROWS rows at a time with fixed float64
+dtypes for FEATURES (other columns are skipped at parse time), and each
+cleaned chunk is handed to detect_anomalies' StreamingDetector. Memory is
+bounded by the chunk size, not the file size.
+
+A value that isn't a number, or a missing FEATURES column, raises
+CsvFormatError instead of being coerced silently.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+CSV_CHUNK_ROWS = int(os.environ.get("CSV_CHUNK_ROWS", "50000"))
+
+FEATURES = [
+    "rpm",
+    "engine_load",
+    "throttle_pos",
+    "long_fuel_trim_1",
+    "coolant_temp",
+    "elm_voltage",
+]
+
+_COLUMNS = set(["_time"] + FEATURES)
+_DTYPES = {f: "float64" for f in FEATURES}
+
+
+class CsvFormatError(ValueError):
+    pass
+
+
+def iter_csv_chunks(file, chunk_rows=CSV_CHUNK_ROWS, stats=None):
+    """
+    Yield DataFrames (`_time` + FEATURES as float64) of `chunk_rows` CSV rows,
+    keeping only rows where every feature is present and non-zero. Without a
+    `_time` column the rows are stamped with the upload time. The index is
+    the data row number in the file. `stats` is an influx_stream.IngestStats.
+    """
+    uploaded_at = pd.Timestamp.now()
+    try:
+        reader = pd.read_csv(file, usecols=lambda c: c in _COLUMNS, dtype=_DTYPES, chunksize=chunk_rows)
+        with reader:
+            for chunk in reader:
+                missing = [f for f in FEATURES if f not in chunk.columns]
+                if missing:
+                    raise CsvFormatError(f"CSV is missing columns: {', '.join(missing)}")
+                if stats is not None:
+                    stats.raw_rows += len(chunk)
+
+                X = chunk[FEATURES].to_numpy()
+                chunk = chunk[(np.isfinite(X) & (X != 0)).all(axis=1)]
+                if chunk.empty:
+                    continue
+                if "_time" in chunk:
+                    chunk = chunk.assign(_time=pd.to_datetime(chunk["_time"], utc=True, errors="coerce"))
+                else:
+                    chunk = chunk.assign(_time=uploaded_at)
+                if stats is not None:
+                    stats.rows += len(chunk)
+                    stats.chunks += 1
+                yield chunk[["_time"] + FEATURES]
+    except CsvFormatError:
+        raise
+    except ValueError as e:             # bad numbers, empty file, malformed rows
+        raise CsvFormatError(f"Could not parse CSV: {e}")
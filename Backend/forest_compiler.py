@@ -0,0 +1,276 @@
+"""
+forest_compiler.py
+──────────────────
+Flattens the IsolationForest in models/<brand>/idle_<id>.pkl into contiguous
+NumPy node arrays and scores them with a vectorized evaluator.
+
+sklearn's IsolationForest.predict validates its input and then walks each of
+the 200 trees in turn (tree.apply per estimator); for the 1×24 vector of a
+/predict call that fixed per-call cost is almost all of the time. Here every
+node of every tree lives in five flat arrays
+
+    feature    int32    column of X tested at the node (tree feature subsets
+                        already mapped to columns of X)
+    threshold  float32  go right when x > threshold; +inf at leaves. sklearn
+                        compares float32 inputs with float64 thresholds;
+                        rounding each threshold down to float32 gives the
+                        same answer for every float32 x
+    left       intp     index of the left child; the right child is left + 1,
+                        leaves point to themselves
+    value      float64  at leaves, the depth plus the average path length of
+                        the samples left in the leaf (sklearn's correction)
+    nan_right  bool     where a NaN goes (sklearn's missing_go_to_left, negated)
+    roots      intp     (n_forests, n_trees) root node of every tree
+
+and all samples descend all trees together, one level per step:
+    node = left[node] + (x[feature[node]] > threshold[node])
+Leaves loop onto themselves, so after max_depth steps every path has
+finished, with no per-tree or per-sample Python loop. NaN routing costs an
+extra mask only for blocks that contain a NaN.
+
+Several forests can be stacked into one CompiledForest (CompiledForest.stack),
+so a whole fleet's vectors are scored in one pass, each row by its own bike's
+forest. Decisions match sklearn's: X is rounded to float32 like sklearn's
+input validation, and score = -2^(-mean path length / c(max_samples)).
+
+Export to .npz (loaded by the model registry instead of compiling again):
+    python forest_compiler.py models/yamaha/idle_1.pkl
+    python forest_compiler.py --all
+"""
+
+import argparse
+import glob
+import os
+import numpy as np
+import joblib
+
+CHUNK_ELEMENTS = 1 << 16        # rows × trees traversed per block; keeps the working set in cache
+
+
+def average_path_length(n):
+    """c(n): average path length of an unsuccessful BST search among n samples (as in sklearn)."""
+    n = np.asarray(n, dtype=np.float64)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+def _tree_arrays(tree, columns):
+    """Renumber one sklearn tree so siblings are adjacent (right = left + 1), root first."""
+    t = tree.tree_
+    n = t.node_count
+    children_left, children_right = t.children_left, t.children_right
+
+    # Breadth-first order puts every pair of siblings next to each other
+    order = [0]
+    for node in order:
+        if children_left[node] != -1:
+            order.extend((children_left[node], children_right[node]))
+    order = np.asarray(order)
+    new_index = np.empty(n, dtype=np.int64)
+    new_index[order] = np.arange(n)
+
+    depth = np.zeros(n, dtype=np.int64)
+    for node in order:
+        if children_left[node] != -1:
+            depth[children_left[node]] = depth[children_right[node]] = depth[node] + 1
+
+    leaf = children_left[order] == -1
+    feature = np.where(leaf, 0, np.asarray(columns)[np.maximum(t.feature[order], 0)])
+    threshold = np.where(leaf, np.inf, t.threshold[order])
+    left = np.where(leaf, np.arange(n), new_index[np.maximum(children_left[order], 0)])
+    value = np.where(leaf, depth[order] + average_path_length(t.n_node_samples[order]), 0.0)
+    missing_left = getattr(t, "missing_go_to_left", np.ones(n, dtype=bool))      # sklearn < 1.3: no NaN support
+    nan_right = ~leaf & ~np.asarray(missing_left, dtype=bool)[order]
+    return feature, threshold, left, value, nan_right, int(depth.max())
+
+
+class CompiledForest:
+    def __init__(self, feature, threshold, left, value, nan_right, roots, denominators, offsets, max_depth,
+                 n_features):
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = _floor_float32(threshold)
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.nan_right = np.ascontiguousarray(nan_right, dtype=bool)
+        self.roots = np.ascontiguousarray(np.atleast_2d(roots), dtype=np.intp)
+        self.denominators = np.atleast_1d(np.asarray(denominators, dtype=np.float64))
+        self.offsets = np.atleast_1d(np.asarray(offsets, dtype=np.float64))
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+
+    # ───────────── building ─────────────
+    @classmethod
+    def from_sklearn(cls, model):
+        """Compile a fitted sklearn IsolationForest."""
+        # Node 0 is a shared zero-valued leaf; stack() pads forests with fewer trees with it
+        parts = [(np.zeros(1, np.int64), np.full(1, np.inf), np.zeros(1, np.int64), np.zeros(1),
+                  np.zeros(1, bool), 0)]
+        roots, base = [], 1
+        for tree, columns in zip(model.estimators_, model.estimators_features_):
+            feature, threshold, left, value, nan_right, depth = _tree_arrays(tree, columns)
+            parts.append((feature, threshold, left + base, value, nan_right, depth))
+            roots.append(base)
+            base += len(feature)
+        feature, threshold, left, value, nan_right, depths = zip(*parts)
+        denominator = len(model.estimators_) * average_path_length([model.max_samples_])[0]
+        return cls(np.concatenate(feature), np.concatenate(threshold), np.concatenate(left),
+                   np.concatenate(value), np.concatenate(nan_right), [roots], [denominator], [model.offset_],
+                   max(depths), model.n_features_in_)
+
+    @classmethod
+    def stack(cls, forests):
+        """One CompiledForest holding several; row i of X is scored by forest `forest_index[i]`."""
+        n_trees = max(f.roots.shape[1] for f in forests)
+        feature, threshold, left, value, nan_right, roots = [], [], [], [], [], []
+        base = 0
+        for f in forests:
+            feature.append(f.feature)
+            threshold.append(f.threshold)
+            left.append(f.left + base)
+            value.append(f.value)
+            nan_right.append(f.nan_right)
+            padded = np.full((f.roots.shape[0], n_trees), base, dtype=np.int64)   # base = that forest's zero leaf
+            padded[:, :f.roots.shape[1]] = f.roots + base
+            roots.append(padded)
+            base += len(f.feature)
+        return cls(np.concatenate(feature), np.concatenate(threshold), np.concatenate(left),
+                   np.concatenate(value), np.concatenate(nan_right), np.vstack(roots),
+                   np.concatenate([f.denominators for f in forests]),
+                   np.concatenate([f.offsets for f in forests]),
+                   max(f.max_depth for f in forests), forests[0].n_features)
+
+    # ───────────── scoring ─────────────
+    def path_lengths(self, X, forest_index=None):
+        """Sum over trees of each row's path length (sklearn's `depths`)."""
+        # sklearn validates X as float32 before walking the trees; round the same way
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X must have shape (n, {self.n_features})")
+        n, n_trees = len(X), self.roots.shape[1]
+        roots = self.roots[0] if forest_index is None else None
+        flat = X.ravel()
+        out = np.empty(n)
+        step = max(1, CHUNK_ELEMENTS // n_trees)
+        for start in range(0, n, step):
+            stop = min(n, start + step)
+            if roots is not None:
+                node = np.broadcast_to(roots, (stop - start, n_trees)).copy()
+            else:
+                node = self.roots[forest_index[start:stop]]
+            row_base = (np.arange(start, stop, dtype=np.intp) * self.n_features)[:, None]
+            has_nan = np.isnan(flat[start * self.n_features:stop * self.n_features]).any()
+            # Gathers into preallocated buffers: the traversal is bound by these takes
+            index = np.empty_like(node)
+            x = np.empty(node.shape, dtype=np.float32)
+            threshold = np.empty(node.shape, dtype=np.float32)
+            go_right = np.empty(node.shape, dtype=bool)
+            for _ in range(self.max_depth):
+                np.take(self.feature, node, out=index)
+                index += row_base
+                np.take(flat, index, out=x)
+                np.take(self.threshold, node, out=threshold)
+                np.greater(x, threshold, out=go_right)
+                if has_nan:
+                    go_right |= np.isnan(x) & self.nan_right[node]
+                np.take(self.left, node, out=node)
+                node += go_right
+            out[start:stop] = self.value[node].sum(axis=1)
+        return out
+
+    def score_samples(self, X, forest_index=None):
+        depths = self.path_lengths(X, forest_index)
+        denominators = self.denominators[0] if forest_index is None else self.denominators[forest_index]
+        # Like sklearn, a forest fitted on a single sample (c = 0) scores every row 2^-1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(denominators != 0, depths / denominators, 1.0)
+        return -(2.0 ** -ratio)
+
+    def decision_function(self, X, forest_index=None):
+        offsets = self.offsets[0] if forest_index is None else self.offsets[forest_index]
+        return self.score_samples(X, forest_index) - offsets
+
+    def predict(self, X, forest_index=None):
+        """+1 normal / -1 anomaly, like IsolationForest.predict."""
+        return np.where(self.decision_function(X, forest_index) < 0, -1, 1)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.left, self.value, self.nan_right,
+                                      self.roots))
+
+    # ───────────── files ─────────────
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, feature=self.feature, threshold=self.threshold, left=self.left, value=self.value,
+                     nan_right=self.nan_right, roots=self.roots, denominators=self.denominators, offsets=self.offsets,
+                     meta=np.array([self.max_depth, self.n_features]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            max_depth, n_features = z["meta"].tolist()
+            return cls(z["feature"], z["threshold"], z["left"], z["value"], z["nan_right"], z["roots"],
+                       z["denominators"], z["offsets"], max_depth, n_features)
+
+
+def _floor_float32(threshold):
+    """Largest float32 ≤ each threshold, so `x > t32` ⇔ `x > t` for float32 x."""
+    threshold = np.asarray(threshold)
+    if threshold.dtype == np.float32:
+        return np.ascontiguousarray(threshold)
+    t32 = threshold.astype(np.float32)
+    above = t32.astype(np.float64) > threshold
+    t32[above] = np.nextafter(t32[above], np.float32(-np.inf))
+    return t32
+
+
+def compiled_path(bundle_path):
+    """models/yamaha/idle_4.pkl → models/yamaha/idle_4.forest.npz"""
+    return os.path.splitext(bundle_path)[0] + ".forest.npz"
+
+
+def load_compiled(bundle_path, model):
+    """The exported forest for a bundle if it is at least as new as the .pkl, else compile `model`."""
+    path = compiled_path(bundle_path)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(bundle_path):
+            return CompiledForest.load(path)
+    except (OSError, ValueError, KeyError):
+        pass
+    return CompiledForest.from_sklearn(model)
+
+
+def export(bundle_path):
+    forest = CompiledForest.from_sklearn(joblib.load(bundle_path)["model"])
+    out = compiled_path(bundle_path)
+    tmp = out + ".tmp"
+    forest.save(tmp)
+    os.replace(tmp, out)
+    print(f"[Forest] {bundle_path} → {out} ({forest.roots.shape[1]} trees, {len(forest.feature):,} nodes, "
+          f"{forest.nbytes / 1024:.0f} KB)")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export IsolationForest bundles as flat node arrays")
+    parser.add_argument("bundles", nargs="*", help="models/<brand>/idle_<id>.pkl files")
+    parser.add_argument("--all", action="store_true", help="Export every models/*/*.pkl")
+    args = parser.parse_args()
+
+    found = sorted(glob.glob(os.path.join("models", "*", "*.pkl"))) if args.all else []
+    # *.state.pkl is train_idle_model.py's incremental state, not a bundle
+    paths = args.bundles + [p for p in found if not p.endswith(".state.pkl")]
+    if not paths:
+        parser.error("give bundle paths or --all")
+    for path in paths:
+        try:
+            export(path)
+        except Exception as e:
+            print(f"[Forest] ⚠️ {path}: {e}")
+
+
+if __name__ == "__main__":
+    main()
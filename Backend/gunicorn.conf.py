@@ -0,0 +1,57 @@
+"""
+gunicorn.conf.py
+────────────────
+Multi-worker serving (see wsgi.py and live_state.py):
+
+    cd Backend
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The master starts `python ingest.py` (MQTT subscriber + shared live state)
+before forking the workers and stops it on exit. Set INGEST_EXTERNAL=1 to run
+ingest.py yourself (e.g. as its own service) instead; it then needs the same
+LIVE_STATE_AUTHKEY as the workers.
+
+The master also generates the random LIVE_STATE_AUTHKEY that ingest.py and
+the workers (both started from it) use on the live-state socket, unless one
+is already set.
+
+Workers are threaded: /obd-stream and /alerts-stream hold a thread for as
+long as a dashboard is connected, so WEB_THREADS bounds the open streams per
+worker.
+"""
+
+import os
+import secrets
+import subprocess
+import sys
+import time
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "16"))
+timeout = int(os.environ.get("WEB_TIMEOUT_S", "120"))     # training/CSV uploads can take a while
+
+_ingest = None
+
+
+def on_starting(server):
+    global _ingest
+    if os.environ.get("INGEST_EXTERNAL", "0") == "1":
+        return          # the external ingest.py and the workers share a key set by the operator
+    os.environ.setdefault("LIVE_STATE_AUTHKEY", secrets.token_hex(32))
+    here = os.path.dirname(os.path.abspath(__file__))
+    _ingest = subprocess.Popen([sys.executable, os.path.join(here, "ingest.py")], cwd=here)
+    server.log.info(f"Started ingest process (pid {_ingest.pid})")
+
+
+def on_exit(server):
+    if _ingest is None or _ingest.poll() is not None:
+        return
+    _ingest.terminate()
+    deadline = time.monotonic() + 10
+    while _ingest.poll() is None and time.monotonic() < deadline:
+        time.sleep(0.1)
+    if _ingest.poll() is None:
+        _ingest.kill()
+    server.log.info("Stopped ingest process")
@@ -0,0 +1,240 @@
+"""
+history_cache.py
+────────────────
+Local columnar cache of past OBD data, so long ranges (weekly reports,
+retraining, windows reaching back past midnight) stop re-reading the same
+history from InfluxDB.
+
+Layout:  <HISTORY_CACHE_DIR>/<motorcycle_id>/<YYYY-MM-DD>.arrow
+
+One uncompressed Arrow IPC file per motorcycle per UTC day, holding the
+pivoted `_time` + FEATURES rows exactly as InfluxDB returns them. A day is
+only written once it is over and HISTORY_CACHE_SETTLE_MIN has passed (so
+late samples from the batch writer's spool still land in it); after that
+it is read through a memory map, sliced without copying. Points that still
+arrive for it later (a spool replayed after a long InfluxDB outage) make
+batch_writer.py invalidate() it, and the next read fills it again.
+The still-open part of the range ("today") is always queried from InfluxDB,
+already averaged there by aggregateWindow when a resolution is asked for.
+
+pyarrow is optional: without it (or with HISTORY_CACHE=0) read_frame()
+returns None and every reader keeps querying InfluxDB as before.
+"""
+
+import os
+import threading
+import uuid
+import numpy as np
+import pandas as pd
+from influx_client import INFLUXDB_BUCKET, get_query_api
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:         # cache disabled, readers fall back to InfluxDB
+    pa = None
+
+FEATURES = [
+    "rpm",
+    "engine_load",
+    "throttle_pos",
+    "long_fuel_trim_1",
+    "coolant_temp",
+    "elm_voltage",
+]
+
+HISTORY_CACHE_DIR = os.environ.get("HISTORY_CACHE_DIR", "history_cache")
+HISTORY_CACHE_ENABLED = os.environ.get("HISTORY_CACHE", "1") == "1"
+# Minutes after midnight UTC before the previous day is considered final
+HISTORY_CACHE_SETTLE_MIN = int(os.environ.get("HISTORY_CACHE_SETTLE_MIN", "60"))
+
+# Longest a collector's last reading of a PID is carried forward in raw rows (hold_readings)
+HISTORY_HOLD_MAX_S = float(os.environ.get("HISTORY_HOLD_MAX_S", "5"))
+
+DAY = pd.Timedelta(days=1)
+
+
+def flux_time(ts):
+    return pd.Timestamp(ts).tz_convert("UTC").strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _utc(ts):
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def downsample_stage(resolution):
+    """Flux stage that averages each field into `resolution` buckets before the pivot."""
+    if resolution is None:
+        return ""
+    return f"|> aggregateWindow(every: {resolution}, fn: mean, createEmpty: false)"
+
+
+def _pandas_freq(resolution):
+    """Flux duration → pandas offset alias (1m → 1min, 1d → 1D)."""
+    return resolution[:-1] + {"s": "s", "m": "min", "h": "h", "d": "D"}[resolution[-1]]
+
+
+def resample_frame(df, resolution):
+    """Local equivalent of aggregateWindow(fn: mean): epoch-aligned [start, stop) buckets labelled by stop."""
+    if resolution is None or df.empty:
+        return df
+    return (df.resample(_pandas_freq(resolution), on="_time", closed="left", label="right", origin="epoch")
+              .mean().dropna(how="all").reset_index())
+
+
+def query_range(motorcycle_id, start, stop, resolution=None):
+    """Pivoted `_time` + FEATURES rows for [start, stop) straight from InfluxDB (bucket means with `resolution`)."""
+    flux = f"""
+    from(bucket: "{INFLUXDB_BUCKET}")
+      |> range(start: {flux_time(start)}, stop: {flux_time(stop)})
+      |> filter(fn: (r) => r._measurement == "obd_data")
+      |> filter(fn: (r) => r.motorcycle_id == "{motorcycle_id}")
+      |> filter(fn: (r) => { " or ".join([f'r._field == "{f}"' for f in FEATURES]) })
+      {downsample_stage(resolution)}
+      |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+      |> keep(columns: [{', '.join([f'"{f}"' for f in ["_time"] + FEATURES]) }])
+    """
+    df = get_query_api().query_data_frame(flux)
+    if isinstance(df, list):        # one frame per table schema
+        df = pd.concat(df, ignore_index=True) if df else pd.DataFrame()
+    df = df.drop(columns=["result", "table"], errors="ignore")
+    for col in ["_time"] + FEATURES:       # a bike may be missing a field entirely
+        if col not in df.columns:
+            df[col] = pd.Series(dtype="datetime64[ns, UTC]" if col == "_time" else "float64")
+    df["_time"] = pd.to_datetime(df["_time"], utc=True)
+    df[FEATURES] = df[FEATURES].astype("float64")
+    df = df[["_time"] + FEATURES].sort_values("_time").reset_index(drop=True)
+    return hold_readings(df) if resolution is None else df
+
+
+def hold_readings(df, max_hold_s=HISTORY_HOLD_MAX_S):
+    """
+    Collectors write a slow PID only when it was re-read, so between reads it
+    is null in the pivoted rows. Carry every reading forward (for at most
+    `max_hold_s`) so raw rows look like the live MQTT samples. Sorts by _time.
+    """
+    if df.empty:
+        return df
+    df = df.sort_values("_time").reset_index(drop=True)
+    times = pd.to_datetime(df["_time"], utc=True)
+    limit = pd.Timedelta(seconds=max_hold_s)
+    for f in FEATURES:
+        if f in df:
+            read_at = times.where(df[f].notna()).ffill()
+            df[f] = df[f].ffill().where(times - read_at <= limit)
+    return df
+
+
+class HistoryCache:
+    def __init__(self, base_dir=HISTORY_CACHE_DIR, enabled=HISTORY_CACHE_ENABLED,
+                 settle_minutes=HISTORY_CACHE_SETTLE_MIN):
+        self.base_dir = base_dir
+        self.enabled = enabled and pa is not None
+        self.settle = pd.Timedelta(minutes=settle_minutes)
+        self._lock = threading.Lock()
+        self.counters = {"day_hits": 0, "day_fills": 0, "live_queries": 0}
+        if pa is None and enabled:
+            print("[HistoryCache] ⚠️ pyarrow not installed; reading history from InfluxDB only")
+
+    def path(self, motorcycle_id, day):
+        return os.path.join(self.base_dir, str(motorcycle_id), f"{day:%Y-%m-%d}.arrow")
+
+    def boundary(self, now=None):
+        """Midnight UTC up to which days are final (cacheable)."""
+        now = _utc(now) if now is not None else pd.Timestamp.now(tz="UTC")
+        return (now - self.settle).floor("D")
+
+    # ───────────── reading ─────────────
+    def read_frame(self, motorcycle_id, start, stop=None, resolution=None):
+        """
+        `_time` + FEATURES rows for [start, stop): final days from the local
+        cache (filled from InfluxDB on first use), the rest from InfluxDB.
+        With `resolution` the rows are aggregateWindow bucket means: cached
+        rows are bucketed here, the open tail by InfluxDB, split on a bucket
+        edge so no bucket is built from both.
+        Returns None when the range holds no final day (or bucket), so
+        callers keep their usual query for short, recent ranges.
+        """
+        if not self.enabled:
+            return None
+        start = _utc(start)
+        stop = pd.Timestamp.now(tz="UTC") if stop is None else _utc(stop)
+        split = self.boundary()
+        if resolution is not None:
+            split = split.floor(_pandas_freq(resolution))       # epoch-aligned, like aggregateWindow
+        if start >= split or start >= stop:
+            return None
+
+        cached_stop = min(stop, split)
+        cached = pd.concat([self._day_frame(motorcycle_id, day, start, cached_stop)
+                            for day in self.days(start, cached_stop)], ignore_index=True)
+        frames = [resample_frame(cached, resolution)]
+        if stop > split:
+            with self._lock:
+                self.counters["live_queries"] += 1
+            frames.append(query_range(motorcycle_id, split, stop, resolution))
+        return pd.concat(frames, ignore_index=True)
+
+    def days(self, start, stop):
+        """Midnights of the UTC days overlapping [start, stop)."""
+        return list(pd.date_range(_utc(start).floor("D"), _utc(stop) - pd.Timedelta(1, "ns"), freq="D"))
+
+    def day_frame(self, motorcycle_id, day, start=None, stop=None):
+        """One final day (optionally clipped to [start, stop)) as a DataFrame."""
+        day = _utc(day).floor("D")
+        return self._day_frame(motorcycle_id, day,
+                               _utc(start) if start is not None else day,
+                               _utc(stop) if stop is not None else day + DAY)
+
+    def _day_frame(self, motorcycle_id, day, start, stop):
+        table = self._day_table(motorcycle_id, day)
+        # Rows are sorted by time: slice the mapped table, no copy
+        times = table.column("_time").to_numpy().astype("datetime64[ns]").view("int64")
+        lo = np.searchsorted(times, max(start, day).value, side="left")
+        hi = np.searchsorted(times, min(stop, day + DAY).value, side="left")
+        df = table.slice(lo, hi - lo).to_pandas(split_blocks=True)
+        df["_time"] = pd.to_datetime(df["_time"], utc=True)
+        return df
+
+    def _day_table(self, motorcycle_id, day):
+        path = self.path(motorcycle_id, day)
+        if not os.path.exists(path):
+            self._fill(motorcycle_id, day, path)
+        else:
+            with self._lock:
+                self.counters["day_hits"] += 1
+        # Buffers keep the mapping alive; column data is never copied into RAM up front
+        return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+    def _fill(self, motorcycle_id, day, path):
+        df = query_range(motorcycle_id, day, day + DAY)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write aside and rename, so concurrent readers never map a half-written file
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+        with self._lock:
+            self.counters["day_fills"] += 1
+        print(f"[HistoryCache] Cached {len(df)} rows for motorcycle {motorcycle_id} on {day:%Y-%m-%d}")
+
+    # ───────────── maintenance ─────────────
+    def invalidate(self, motorcycle_id, day=None):
+        """Delete one cached day (e.g. after a late backfill, see batch_writer.py), or every day of a motorcycle."""
+        days = [_utc(day).floor("D")] if day is not None else None
+        folder = os.path.join(self.base_dir, str(motorcycle_id))
+        if not os.path.isdir(folder):
+            return
+        for name in os.listdir(folder):
+            if days is None or name == f"{days[0]:%Y-%m-%d}.arrow":
+                os.remove(os.path.join(folder, name))
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "enabled": self.enabled, "dir": self.base_dir,
+                    "boundary": str(self.boundary()) if self.enabled else None}
+
+
+HISTORY_CACHE = HistoryCache()
@@ -0,0 +1,88 @@
+"""
+influx_client.py
+────────────────
+Single source of InfluxDB settings and one shared, connection-pooled client
+per process. Every backend module imports its config and APIs from here
+instead of building its own InfluxDBClient.
+
+The client keeps a urllib3 pool of keep-alive HTTP connections, so
+concurrent /predict and /recent-data requests reuse open sockets instead of
+paying TCP + HTTP setup each time.
+
+Every setting can be overridden with an environment variable of the same name.
+"""
+
+import atexit
+import os
+import threading
+from influxdb_client import InfluxDBClient
+
+# ───────────────────────── Config ─────────────────────────
+INFLUXDB_URL = os.environ.get("INFLUXDB_URL", "http://localhost:8086")
+INFLUXDB_TOKEN = os.environ.get(
+    "INFLUXDB_TOKEN",
+    "rLaEXQUWJ2R71NQIEFVfhw18L9xC4knKBf7bPAymrJtz6nukc5NIfPPdoc2dlk0c8n_gGm6kiwi7aDAl-uCmWA==",
+)
+INFLUXDB_ORG = os.environ.get("INFLUXDB_ORG", "MotorcycleMaintenance")
+INFLUXDB_BUCKET = os.environ.get("INFLUXDB_BUCKET", "MotorcycleOBDData")
+
+# Max keep-alive connections held open to InfluxDB (≈ concurrent queries)
+INFLUXDB_POOL_SIZE = int(os.environ.get("INFLUXDB_POOL_SIZE", "10"))
+# Per-request HTTP timeout in milliseconds
+INFLUXDB_TIMEOUT_MS = int(os.environ.get("INFLUXDB_TIMEOUT_MS", "30000"))
+INFLUXDB_GZIP = os.environ.get("INFLUXDB_GZIP", "1") == "1"
+
+_client = None
+_query_api = None
+_lock = threading.Lock()
+
+
+def get_client() -> InfluxDBClient:
+    """Return the process-wide InfluxDBClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = InfluxDBClient(
+                    url=INFLUXDB_URL,
+                    token=INFLUXDB_TOKEN,
+                    org=INFLUXDB_ORG,
+                    timeout=INFLUXDB_TIMEOUT_MS,
+                    enable_gzip=INFLUXDB_GZIP,
+                    connection_pool_maxsize=INFLUXDB_POOL_SIZE,
+                )
+    return _client
+
+
+def get_query_api():
+    """Shared QueryApi bound to the pooled client (safe to use from many threads)."""
+    global _query_api
+    if _query_api is None:
+        client = get_client()
+        with _lock:
+            if _query_api is None:
+                _query_api = client.query_api()
+    return _query_api
+
+
+def get_write_api(write_options=None, **callbacks):
+    """
+    New WriteApi on the pooled client; callers own it and must close() it.
+    `callbacks` are forwarded as success_callback / error_callback / retry_callback.
+    """
+    if write_options is None:
+        return get_client().write_api(**callbacks)
+    return get_client().write_api(write_options=write_options, **callbacks)
+
+
+def close_client():
+    """Close the pooled client (registered to run at interpreter exit)."""
+    global _client, _query_api
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _query_api = None
+
+
+atexit.register(close_client)
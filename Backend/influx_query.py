@@ -1,22 +1,49 @@
-from influxdb_client import InfluxDBClient
+import re
 import pandas as pd
+from influx_client import INFLUXDB_BUCKET, INFLUXDB_ORG, get_query_api
+from live_window import LIVE_WINDOWS
+from history_cache import HISTORY_CACHE, downsample_stage, hold_readings, resample_frame   # shared with the cache's bucketing
 
-# InfluxDB connection config
-INFLUXDB_URL = "http://localhost:8086"
-INFLUXDB_TOKEN = "rLaEXQUWJ2R71NQIEFVfhw18L9xC4knKBf7bPAymrJtz6nukc5NIfPPdoc2dlk0c8n_gGm6kiwi7aDAl-uCmWA=="
-INFLUXDB_ORG = "MotorcycleMaintenance"
-INFLUXDB_BUCKET = "MotorcycleOBDData"
+# Flux duration literal accepted for the optional `resolution` bucket size (e.g. 1s, 1m, 1h)
+_RESOLUTION_RE = re.compile(r"^[1-9][0-9]*(s|m|h|d)$")
 
-# Initialize InfluxDB client
-client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
-query_api = client.query_api()
+def parse_resolution(resolution):
+    """
+    Validate a bucket size coming from a request.
+    Returns None when no downsampling was asked for, raises ValueError when invalid.
+    """
+    if resolution in (None, "", "raw"):
+        return None
+    resolution = str(resolution).strip()
+    if not _RESOLUTION_RE.match(resolution):
+        raise ValueError(f"Invalid resolution '{resolution}' (expected e.g. 1s, 1m, 1h)")
+    return resolution
 
-def get_recent_data(motorcycle_id, minutes=10):
+def get_recent_data(motorcycle_id, minutes=10, resolution=None):
     """
     Fetch and clean recent data for the given motorcycle ID within the last X minutes.
-    Returns a cleaned DataFrame or empty list.
+    With `resolution` (e.g. "1m") InfluxDB averages the points into buckets first,
+    so the payload scales with the number of buckets instead of raw points.
+    Returns a list of records (empty list when there is no data).
     """
+    df = get_recent_frame(motorcycle_id, minutes, resolution)
+    return df.to_dict("records") if not df.empty else []
+
+def get_recent_frame(motorcycle_id, minutes=10, resolution=None):
+    """get_recent_data as a cleaned, `_time`-sorted DataFrame (for paging / columnar responses)."""
     time_range = f"-{minutes}m"
+    resolution = parse_resolution(resolution)
+
+    # Hot path: the MQTT-fed ring buffer already holds the whole window
+    df = LIVE_WINDOWS.window_df(motorcycle_id, minutes)
+    if df is not None:
+        return _clean_frame(resample_frame(df, resolution))
+    # Ranges reaching back into finished days: those days come from the local cache, the
+    # open tail from InfluxDB (already bucketed there when a resolution is given)
+    df = HISTORY_CACHE.read_frame(motorcycle_id, pd.Timestamp.now(tz="UTC") - pd.Timedelta(minutes=minutes),
+                                  resolution=resolution)
+    if df is not None:
+        return _clean_frame(df)
 
     query = f'''
     from(bucket: "{INFLUXDB_BUCKET}")
@@ -30,18 +57,23 @@ def get_recent_data(motorcycle_id, minutes=10):
           r["_field"] == "long_fuel_trim_1" or
           r["_field"] == "coolant_temp" or
           r["_field"] == "elm_voltage")
+      {downsample_stage(resolution)}
       |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
       |> keep(columns: ["_time", "rpm", "engine_load", "throttle_pos", "long_fuel_trim_1", "coolant_temp", "elm_voltage"])
     '''
 
     # Execute the query
-    df = query_api.query_data_frame(org=INFLUXDB_ORG, query=query)
-
-    if df.empty:
-        return []
+    df = get_query_api().query_data_frame(org=INFLUXDB_ORG, query=query)
 
     # Drop internal columns if present
     df = df.drop(columns=["result", "table"], errors="ignore")
+    if resolution is None:
+        df = hold_readings(df)      # slow PIDs are only written when re-read
+    return _clean_frame(df)
+
+def _clean_frame(df):
+    if df.empty:
+        return pd.DataFrame()
 
     # Clean data: remove rows with missing values
     df.dropna(inplace=True)
@@ -55,5 +87,4 @@ def get_recent_data(motorcycle_id, minutes=10):
     # Reset index
     df.reset_index(drop=True, inplace=True)
 
-    # Return cleaned data as list of records (for JSON or frontend use)
-    return df.to_dict("records")
+    return df
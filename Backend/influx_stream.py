@@ -0,0 +1,95 @@
+"""
+influx_stream.py
+────────────────
+Chunked reader for long training ranges.
+
+Instead of pivoting the whole history into one DataFrame, the range is cut
+into time slices (default 6 h) that are queried one after another, so only
+one slice is in memory at a time. Each chunk is cleaned, filtered and cast to
+float before it is yielded, and IngestStats tracks rows/sec and peak RSS so
+flat memory use can be checked on multi-week runs.
+
+Finished days are read one day per chunk from the local columnar cache
+(history_cache.py) when it is enabled; only the open tail is queried from
+InfluxDB slice by slice.
+"""
+
+import sys
+import time
+import pandas as pd
+from history_cache import HISTORY_CACHE, query_range
+
+SLICE_MINUTES = 360
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (ru_maxrss, or psutil on Windows)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+
+
+class IngestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.raw_rows = 0
+        self.rows = 0
+        self.chunks = 0
+
+    @property
+    def rows_per_sec(self):
+        elapsed = time.perf_counter() - self.started
+        return self.raw_rows / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return (f"Ingested {self.raw_rows:,} rows ({self.rows:,} kept) in {self.chunks} chunks, "
+                f"{self.rows_per_sec:,.0f} rows/s, peak RSS {peak_rss_mb():.1f} MB")
+
+
+def iter_feature_chunks(motorcycle_id, start, stop=None, slice_minutes=SLICE_MINUTES,
+                        row_filter=None, stats=None, on_slice=None):
+    """
+    Yield cleaned DataFrames (`_time` + FEATURES as float64) in time order for
+    [start, stop). `row_filter(df) -> df` runs on every chunk (e.g. the
+    coolant_temp window for warm idle); `on_slice(done, total)` reports progress.
+    """
+    start = pd.Timestamp(start)
+    stop = pd.Timestamp.now(tz="UTC") if stop is None else pd.Timestamp(stop)
+    step = pd.Timedelta(minutes=slice_minutes)
+
+    # (lo, hi, from_cache) pieces in time order: cached finished days, then Influx slices
+    pieces = []
+    tail = start
+    if HISTORY_CACHE.enabled:
+        cached_until = min(HISTORY_CACHE.boundary(), stop)
+        for day in HISTORY_CACHE.days(start, cached_until) if start < cached_until else []:
+            pieces.append((max(start, day), min(day + pd.Timedelta(days=1), cached_until), True))
+        tail = max(start, cached_until)
+    while tail < stop:
+        pieces.append((tail, min(tail + step, stop), False))
+        tail += step
+
+    total = max(1, len(pieces))
+    for i, (lo, hi, from_cache) in enumerate(pieces):
+        df = HISTORY_CACHE.day_frame(motorcycle_id, lo, lo, hi) if from_cache else query_range(motorcycle_id, lo, hi)
+        if on_slice:
+            on_slice(i + 1, total)
+        if df.empty:
+            continue
+
+        if stats is not None:
+            stats.raw_rows += len(df)
+        df = df.dropna().sort_values("_time")
+        if row_filter is not None:
+            df = row_filter(df)
+        if df.empty:
+            continue
+        if stats is not None:
+            stats.rows += len(df)
+            stats.chunks += 1
+        yield df.reset_index(drop=True)
@@ -0,0 +1,115 @@
+"""
+ingest.py
+─────────
+The MQTT subscriber and everything it feeds: the live windows, report
+rollups, SSE fan-out, online alerts and collector throughput. It also owns
+the child processes (OBD collectors, training jobs).
+
+`python server.py` runs all of this in the Flask process (start_ingest()).
+In production (wsgi.py + gunicorn.conf.py) it is one separate process:
+
+    python ingest.py
+
+which serves that state to the HTTP workers over LIVE_STATE_ADDRESS
+(live_state.py), so there is exactly one MQTT subscription however many
+workers serve requests.
+"""
+
+import os
+
+if __name__ == "__main__":
+    os.environ["LIVE_STATE"] = "local"      # this process owns the live state; set before the imports below
+
+import json
+import threading
+import paho.mqtt.client as mqtt
+from live_window import LIVE_WINDOWS
+from live_stream import STREAM_BROKER
+from rollups import ROLLUPS
+from online_detector import ALERT_BROKER, ONLINE_DETECTOR
+from collector_supervisor import COLLECTORS
+from training_jobs import TRAINING_JOBS
+from telemetry_codec import SeqDeduplicator, binary_topic, decode_payload, is_binary_topic
+
+# MQTT broker settings
+MQTT_BROKER = "broker.hivemq.com"
+MQTT_PORT = 1883
+MQTT_TOPIC = "obd/data"
+# Subscribe to the JSON topic, its binary twin (obd/data/bin) or both
+MQTT_PAYLOAD = os.environ.get("MQTT_PAYLOAD", "both")
+
+seen_samples = SeqDeduplicator()   # collectors publishing both formats send every sample twice
+
+# MQTT callback when a message is received
+def on_message(client, userdata, msg):
+    try:
+        if is_binary_topic(msg.topic):
+            payload = decode_payload(msg.payload)
+        else:
+            payload = json.loads(msg.payload.decode("utf-8"))
+        if not seen_samples.is_new(payload):
+            return
+        # print(f"📡 MQTT Received: {payload}")
+        LIVE_WINDOWS.ingest(payload)
+        ROLLUPS.ingest(payload)
+        STREAM_BROKER.publish(payload)
+        ONLINE_DETECTOR.ingest(payload)
+        COLLECTORS.record_sample(payload.get("motorcycle_id"))
+    except Exception as e:
+        print(f"❌ MQTT message decode error: {e}")
+
+# Samples may have been missed while disconnected → live windows fall back to InfluxDB
+def on_disconnect(client, userdata, *args):
+    LIVE_WINDOWS.mark_gap()
+    ROLLUPS.mark_gap()
+    ONLINE_DETECTOR.mark_gap()
+
+# MQTT logging
+def on_log(client, userdata, level, buf):
+    print(f"[MQTT LOG] {buf}")
+
+def start_mqtt():
+    client = mqtt.Client()
+    client.on_message = on_message
+    client.on_disconnect = on_disconnect
+    client.on_log = on_log
+    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    topics = []
+    if MQTT_PAYLOAD in ("json", "both"):
+        topics.append((MQTT_TOPIC, 0))
+    if MQTT_PAYLOAD in ("binary", "both"):
+        topics.append((binary_topic(MQTT_TOPIC), 0))
+    client.subscribe(topics)
+    client.loop_forever()
+
+def start_ingest():
+    """Start the MQTT thread and the background jobs that belong with it."""
+    # Terminate collectors a previous run left behind (tracked in collectors.json)
+    COLLECTORS.reap_orphans()
+
+    # Start MQTT client in a background thread
+    mqtt_thread = threading.Thread(target=start_mqtt, daemon=True, name="mqtt")
+    mqtt_thread.start()
+
+    # Keep the report rollups of every motorcycle seen so far up to date
+    ROLLUPS.start()
+    return mqtt_thread
+
+
+if __name__ == "__main__":
+    import signal
+    import sys
+    from live_state import require_authkey, serve
+    require_authkey()       # before any MQTT or child process is started
+    # SIGTERM (gunicorn.conf.py on_exit) → normal exit, so atexit stops the collectors
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    start_ingest()
+    serve({
+        "live_windows": LIVE_WINDOWS,
+        "rollups": ROLLUPS,
+        "stream_broker": STREAM_BROKER,
+        "alert_broker": ALERT_BROKER,
+        "online_detector": ONLINE_DETECTOR,
+        "collectors": COLLECTORS,
+        "training_jobs": TRAINING_JOBS,
+    })
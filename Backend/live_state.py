@@ -0,0 +1,148 @@
+"""
+live_state.py
+─────────────
+Sharing the live, MQTT-fed state between processes, for serving with several
+HTTP workers (wsgi.py + gunicorn.conf.py).
+
+One ingest process (ingest.py) owns the MQTT subscription and the
+process-wide objects it feeds or that own child processes:
+
+    live_windows      live_window.LIVE_WINDOWS
+    rollups           rollups.ROLLUPS
+    stream_broker     live_stream.STREAM_BROKER
+    alert_broker      online_detector.ALERT_BROKER
+    online_detector   online_detector.ONLINE_DETECTOR
+    collectors        collector_supervisor.COLLECTORS
+    training_jobs     training_jobs.TRAINING_JOBS
+
+and serves them with a multiprocessing BaseManager on LIVE_STATE_ADDRESS
+("host:port", or a Unix socket path). With LIVE_STATE=remote those module
+globals are RemoteObjects instead: every method call is forwarded to the
+ingest process's instance over the local socket. The HTTP workers themselves
+hold no live state, so any number of them see the same windows, alerts,
+collectors and training jobs. Return values are pickled; subscriptions to
+the brokers come back as proxies, so SSE streams block in the worker while
+the ingest process queues their messages.
+
+The manager unpickles what it receives, so the socket is guarded by
+LIVE_STATE_AUTHKEY, which has no default: gunicorn.conf.py generates a
+random one per start and hands it to ingest.py and the workers through the
+environment, and neither side starts without it.
+
+LIVE_STATE=local (the default, `python server.py`) keeps everything in the
+one process, as before.
+"""
+
+import os
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+LIVE_STATE = os.environ.get("LIVE_STATE", "local")              # "local" or "remote"
+LIVE_STATE_ADDRESS = os.environ.get("LIVE_STATE_ADDRESS", "127.0.0.1:50055")
+LIVE_STATE_AUTHKEY = os.environ.get("LIVE_STATE_AUTHKEY", "").encode()
+LIVE_STATE_CONNECT_TIMEOUT_S = float(os.environ.get("LIVE_STATE_CONNECT_TIMEOUT_S", "10"))
+
+SHARED = ("live_windows", "rollups", "stream_broker", "alert_broker", "online_detector",
+          "collectors", "training_jobs")
+_SUBSCRIBES = {"subscribe": "subscription"}     # broker.subscribe() returns a proxy, not a copy
+
+
+class LiveStateManager(BaseManager):
+    pass
+
+
+def require_authkey():
+    if not LIVE_STATE_AUTHKEY:
+        raise RuntimeError("LIVE_STATE_AUTHKEY is not set; shared live state needs a secret key "
+                           "(gunicorn.conf.py generates one)")
+    return LIVE_STATE_AUTHKEY
+
+
+def _address():
+    host, sep, port = LIVE_STATE_ADDRESS.rpartition(":")
+    return (host, int(port)) if sep and port.isdigit() else LIVE_STATE_ADDRESS
+
+
+def _register(objects=None):
+    for name in SHARED:
+        obj = None if objects is None else objects[name]
+        LiveStateManager.register(name, callable=None if obj is None else (lambda obj=obj: obj),
+                                  method_to_typeid=_SUBSCRIBES if name.endswith("_broker") else None)
+    LiveStateManager.register("subscription", create_method=False)
+
+
+# ───────────── ingest process ─────────────
+def serve(objects):
+    """Serve `objects` ({name: instance} for every name in SHARED) until the process ends."""
+    _register(objects)
+    manager = LiveStateManager(address=_address(), authkey=require_authkey())
+    server = manager.get_server()
+    print(f"[LiveState] Serving live state on {LIVE_STATE_ADDRESS}")
+    server.serve_forever()
+
+
+# ───────────── HTTP workers ─────────────
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def _connect(reset=False):
+    global _manager
+    with _manager_lock:
+        if reset:
+            _manager = None
+        if _manager is None:
+            _register()
+            manager = LiveStateManager(address=_address(), authkey=require_authkey())
+            deadline = time.monotonic() + LIVE_STATE_CONNECT_TIMEOUT_S
+            while True:
+                try:
+                    manager.connect()
+                    break
+                except (ConnectionError, OSError) as e:
+                    if time.monotonic() >= deadline:
+                        raise ConnectionError(f"Live state not reachable on {LIVE_STATE_ADDRESS}: {e}")
+                    time.sleep(0.2)     # the ingest process may still be starting
+            _manager = manager
+        return _manager
+
+
+class RemoteObject:
+    """
+    Stands in for one of the ingest process's shared objects: `obj.method(...)`
+    runs there and returns a pickled copy of the result. Connects on first
+    use and reconnects once if the ingest process was restarted.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._proxy = None
+        self._lock = threading.Lock()
+
+    def _get_proxy(self, reset=False):
+        with self._lock:
+            if reset or self._proxy is None:
+                self._proxy = getattr(_connect(reset), self._name)()
+            return self._proxy
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+
+        def call(*args, **kwargs):
+            try:
+                return getattr(self._get_proxy(), attr)(*args, **kwargs)
+            except (ConnectionError, EOFError, BrokenPipeError):
+                print(f"[LiveState] ⚠️ Lost the ingest process, reconnecting for {self._name}.{attr}")
+                return getattr(self._get_proxy(reset=True), attr)(*args, **kwargs)
+        call.__name__ = attr
+        return call
+
+    def __repr__(self):
+        return f"<RemoteObject {self._name} @ {LIVE_STATE_ADDRESS}>"
+
+
+def remote(name):
+    require_authkey()          # refuse to run remote without a key, at import rather than on the first request
+    return RemoteObject(name)
@@ -0,0 +1,123 @@
+"""
+live_stream.py
+──────────────
+Fan-out of MQTT messages to server-push (SSE) subscribers.
+
+Each subscriber gets a bounded queue filtered by motorcycle_id. A slow client
+never blocks the MQTT thread: when its queue is full the oldest message is
+dropped. An optional per-subscriber rate limit (max_hz) coalesces bursts so
+only the newest message is sent once per interval.
+
+A subscription that hasn't been polled for SUBSCRIPTION_IDLE_S is dropped
+(an SSE stream polls at least every heartbeat), so streams of an HTTP
+worker that died without closing them don't pile up in the ingest process.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from live_state import LIVE_STATE, remote
+
+SUBSCRIPTION_IDLE_S = float(os.environ.get("SUBSCRIPTION_IDLE_S", "120"))
+
+
+class Subscription:
+    def __init__(self, broker, motorcycle_id=None, max_queue=50, max_hz=None):
+        self.id = next(broker._ids)
+        self.motorcycle_id = None if motorcycle_id is None else str(motorcycle_id)
+        self.min_interval = 1.0 / max_hz if max_hz else 0.0
+        self.dropped = 0
+        self.sent = 0
+        self._broker = broker
+        self._queue = deque(maxlen=max_queue)
+        self._cond = threading.Condition()
+        self._last_sent = 0.0
+        self._last_poll = time.monotonic()
+        self._closed = False
+
+    def wants(self, payload: dict) -> bool:
+        return self.motorcycle_id is None or str(payload.get("motorcycle_id")) == self.motorcycle_id
+
+    def offer(self, payload: dict):
+        """Called from the publisher thread; never blocks on the consumer."""
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1            # deque(maxlen) drops the oldest on append
+            self._queue.append(payload)
+            self._cond.notify()
+
+    def get(self, timeout: float):
+        """Next message for this subscriber, or None after `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        self._last_poll = deadline          # a blocked reader counts as polling until its wait ends
+        with self._cond:
+            while not self._closed:
+                wait = deadline - time.monotonic()
+                if self._queue:
+                    # Rate limit: hold back until the interval elapsed, then send only the newest
+                    hold = self._last_sent + self.min_interval - time.monotonic()
+                    if hold <= 0:
+                        if self.min_interval:
+                            self.dropped += len(self._queue) - 1
+                            payload = self._queue.pop()
+                            self._queue.clear()
+                        else:
+                            payload = self._queue.popleft()
+                        self._last_sent = time.monotonic()
+                        self.sent += 1
+                        return payload
+                    wait = min(wait, hold)
+                if wait <= 0:
+                    return None
+                self._cond.wait(wait)
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._broker._remove(self)
+
+
+class StreamBroker:
+    def __init__(self):
+        self._subs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._latest = {}
+
+    def subscribe(self, motorcycle_id=None, max_queue=50, max_hz=None) -> Subscription:
+        sub = Subscription(self, motorcycle_id, max_queue, max_hz)
+        with self._lock:
+            self._subs[sub.id] = sub
+        return sub
+
+    def _remove(self, sub):
+        with self._lock:
+            self._subs.pop(sub.id, None)
+
+    def publish(self, payload: dict):
+        self._latest = payload
+        now = time.monotonic()
+        with self._lock:
+            subs = list(self._subs.values())
+        for sub in subs:
+            if now - sub._last_poll > SUBSCRIPTION_IDLE_S:
+                sub.close()             # abandoned: nobody is reading it
+            elif sub.wants(payload):
+                sub.offer(payload)
+
+    def latest(self):
+        """The last message published (/obd-data)."""
+        return self._latest
+
+    def stats(self):
+        with self._lock:
+            return [{"id": s.id, "motorcycle_id": s.motorcycle_id, "queued": len(s._queue),
+                     "sent": s.sent, "dropped": s.dropped} for s in self._subs.values()]
+
+
+# Process-wide broker fed by the MQTT subscriber (ingest.py; remote in HTTP workers, see live_state.py)
+STREAM_BROKER = remote("stream_broker") if LIVE_STATE == "remote" else StreamBroker()
@@ -0,0 +1,141 @@
+"""
+live_window.py
+──────────────
+In-process rolling window of recent OBD samples, one preallocated NumPy ring
+buffer per motorcycle, filled from the MQTT stream in ingest.py.
+
+detect_anomalies and /recent-data read from here when the buffer fully covers
+the requested window; InfluxDB only serves cold or partial windows (server
+just started, horizon exceeded, or a gap in the stream).
+"""
+
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from live_state import LIVE_STATE, remote
+
+FEATURES = [
+    "rpm",
+    "engine_load",
+    "throttle_pos",
+    "long_fuel_trim_1",
+    "coolant_temp",
+    "elm_voltage",
+]
+
+# How much history each motorcycle keeps, and the sample rate used to size it
+LIVE_WINDOW_HORIZON_MIN = int(os.environ.get("LIVE_WINDOW_HORIZON_MIN", "60"))
+LIVE_WINDOW_MAX_HZ = float(os.environ.get("LIVE_WINDOW_MAX_HZ", "10"))
+# A silence longer than this means we may have missed samples → window no longer trusted
+LIVE_WINDOW_MAX_GAP_S = float(os.environ.get("LIVE_WINDOW_MAX_GAP_S", "30"))
+
+
+class RingBuffer:
+    """Fixed-capacity (time, FEATURES) ring buffer for one motorcycle."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self._values = np.full((capacity, len(FEATURES)), np.nan, dtype=np.float64)
+        self._next = 0              # slot the next sample goes into
+        self._size = 0
+        self._covered_since = None  # earliest time from which we hold every sample
+        self._lock = threading.Lock()
+
+    def append(self, ts: float, values: np.ndarray):
+        with self._lock:
+            if self._size and ts - self._times[self._next - 1] > LIVE_WINDOW_MAX_GAP_S:
+                self._covered_since = ts
+            elif self._covered_since is None:
+                self._covered_since = ts
+
+            self._times[self._next] = ts
+            self._values[self._next] = values
+            self._next = (self._next + 1) % self.capacity
+            if self._size < self.capacity:
+                self._size += 1
+            else:
+                # Overwrote the oldest sample; coverage now starts at the next-oldest one
+                self._covered_since = max(self._covered_since, self._times[self._next])
+
+    def mark_gap(self):
+        """Called when the feed was interrupted (e.g. MQTT disconnect)."""
+        with self._lock:
+            self._covered_since = None
+
+    def covers(self, start_ts: float) -> bool:
+        with self._lock:
+            return self._covered_since is not None and self._covered_since <= start_ts
+
+    def since(self, start_ts: float):
+        """Return (times, values) copies for samples at or after start_ts, oldest first."""
+        with self._lock:
+            if self._size < self.capacity:
+                times = self._times[:self._size]
+                values = self._values[:self._size]
+            else:
+                order = np.r_[self._next:self.capacity, 0:self._next]
+                times = self._times[order]
+                values = self._values[order]
+            first = np.searchsorted(times, start_ts, side="left")
+            return times[first:].copy(), values[first:].copy()
+
+
+class LiveWindows:
+    """Registry of per-motorcycle ring buffers."""
+
+    def __init__(self, horizon_min=LIVE_WINDOW_HORIZON_MIN, max_hz=LIVE_WINDOW_MAX_HZ):
+        self.horizon_s = horizon_min * 60
+        self.capacity = int(self.horizon_s * max_hz)
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def _buffer(self, motorcycle_id: str) -> RingBuffer:
+        buf = self._buffers.get(motorcycle_id)
+        if buf is None:
+            with self._lock:
+                buf = self._buffers.setdefault(motorcycle_id, RingBuffer(self.capacity))
+        return buf
+
+    def ingest(self, payload: dict, ts: float = None):
+        """Append one MQTT payload: {"motorcycle_id": ..., "data": {"RPM": ..., ...}}."""
+        motorcycle_id = payload.get("motorcycle_id")
+        if motorcycle_id is None:
+            return
+        data = {str(k).lower(): v for k, v in (payload.get("data") or {}).items()}
+        values = np.array([_to_float(data.get(f)) for f in FEATURES], dtype=np.float64)
+        self._buffer(str(motorcycle_id)).append(time.time() if ts is None else ts, values)
+
+    def mark_gap(self):
+        with self._lock:
+            buffers = list(self._buffers.values())
+        for buf in buffers:
+            buf.mark_gap()
+
+    def window_df(self, motorcycle_id: str, minutes: int):
+        """
+        Last `minutes` of samples as a DataFrame shaped like the InfluxDB pivot
+        (`_time` + FEATURES), or None when the buffer doesn't cover the window.
+        """
+        buf = self._buffers.get(str(motorcycle_id))
+        start = time.time() - minutes * 60
+        if buf is None or minutes * 60 > self.horizon_s or not buf.covers(start):
+            return None
+        times, values = buf.since(start)
+        df = pd.DataFrame(values, columns=FEATURES)
+        df.insert(0, "_time", pd.to_datetime(times, unit="s", utc=True))
+        return df
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+# Process-wide instance fed by the MQTT subscriber (ingest.py); HTTP workers of a
+# multi-process deployment reach the ingest process's one instead (live_state.py)
+LIVE_WINDOWS = remote("live_windows") if LIVE_STATE == "remote" else LiveWindows()
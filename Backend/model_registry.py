@@ -0,0 +1,279 @@
+"""
+model_registry.py
+─────────────────
+Bounded LRU cache of trained idle models (models/<brand>/<mode>_<id>.pkl).
+
+Models are looked up per bike first, then per brand/model:
+  models/<brand>/<mode>_<id>.pkl                 the bike's own forest + scaler
+  models/<brand>/shared_<mode>_<model>.pkl       one forest per brand/model
+                                                 (normal_ranges.json keys)
+  models/<brand>/<mode>_<id>.calib.json          a bike's scaler statistics
+                                                 and score offset for the
+                                                 shared forest (~300 bytes)
+A bike without its own .pkl is scored by the shared forest through its
+calibration record (get_bundle(..., model=...)). A new bike with no record
+yet gets source="shared": the caller centres it on its own data and scales
+by the shared model's "bike_scale" (anomaly_model.StreamingDetector).
+Bikes' own forests and the shared ones are cached together, up to
+max_models; calibration records sit in a separate LRU of max_calibrations,
+so thousands of calibrated bikes cost a few MB beyond the forests.
+
+A cached bundle is revalidated against the file on every lookup, so a
+retrained model is picked up without restarting the server:
+  validate="mtime"     reload when the file's mtime or size changed
+  validate="checksum"  on an mtime/size change, reload only if the SHA-1
+                       of the contents changed too
+
+mmap=True loads with joblib mmap_mode="r"; this only avoids a copy for
+uncompressed pickles (joblib silently loads compressed ones normally).
+
+engine="compiled" also flattens the bundle's IsolationForest into
+bundle["forest"] (forest_compiler.CompiledForest, or the exported
+idle_<id>.forest.npz when it is up to date); anomaly_model scores with it
+instead of sklearn's per-tree predict. engine="sklearn" leaves it out.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+import joblib
+from forest_compiler import load_compiled
+import numpy as np
+
+# Files next to the models that match <mode>_*.pkl but aren't bundles
+# (train_idle_model.py --incremental keeps its reservoir/scaler state there)
+SIDECAR_SUFFIXES = (".state.pkl",)
+
+
+class Calibration:
+    """
+    One bike's calibration against a shared forest. mean_/scale_ are named
+    like StandardScaler's so window_features.scale_aggregates takes it as the
+    scaler; `offset` replaces the forest's offset_ in the decision
+    (None keeps the forest's own).
+    """
+    __slots__ = ("model", "mean_", "scale_", "offset", "n_samples", "n_windows")
+
+    def __init__(self, model, mean, scale, offset=None, n_samples=0, n_windows=0):
+        self.model = model
+        self.mean_ = np.asarray(mean, dtype=float)
+        self.scale_ = np.asarray(scale, dtype=float)
+        self.offset = None if offset is None else float(offset)
+        self.n_samples = int(n_samples)
+        self.n_windows = int(n_windows)
+
+    def to_dict(self):
+        return {"model": self.model, "mean": self.mean_.tolist(), "scale": self.scale_.tolist(),
+                "offset": self.offset, "n_samples": self.n_samples, "n_windows": self.n_windows}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["model"], d["mean"], d["scale"], d.get("offset"), d.get("n_samples", 0), d.get("n_windows", 0))
+
+
+def save_calibration(path, calibration):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(calibration.to_dict(), f, indent=2)
+    os.replace(tmp, path)
+
+
+def load_calibration(path):
+    with open(path) as f:
+        return Calibration.from_dict(json.load(f))
+
+
+class ModelRegistry:
+    def __init__(self, base_dir="models", max_models=64, validate="mtime", mmap=False, engine="compiled",
+                 max_calibrations=10000):
+        if validate not in ("mtime", "checksum"):
+            raise ValueError(f"validate must be 'mtime' or 'checksum', not {validate!r}")
+        if engine not in ("compiled", "sklearn"):
+            raise ValueError(f"engine must be 'compiled' or 'sklearn', not {engine!r}")
+        self.base_dir = base_dir
+        self.max_models = max_models
+        self.validate = validate
+        self.mmap = mmap
+        self.engine = engine
+        self.max_calibrations = max_calibrations
+        self._cache = OrderedDict()     # key → (stat_sig, checksum, bundle)
+        self._calibrations = OrderedDict()      # (brand, id, mode) → (stat_sig, Calibration)
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "reloads": 0, "evictions": 0, "shared_lookups": 0}
+
+    def path(self, brand, moto_id, mode="idle"):
+        return os.path.join(self.base_dir, brand, f"{mode}_{moto_id}.pkl")
+
+    def shared_path(self, brand, model, mode="idle"):
+        return os.path.join(self.base_dir, brand, f"shared_{mode}_{model}.pkl")
+
+    def calibration_path(self, brand, moto_id, mode="idle"):
+        return os.path.join(self.base_dir, brand, f"{mode}_{moto_id}.calib.json")
+
+    # ───────────── lookup ─────────────
+    def get(self, brand, moto_id, mode="idle"):
+        """Return (model, scaler) for one motorcycle, loading or reloading as needed."""
+        bundle = self.get_bundle(brand, moto_id, mode)
+        return bundle["model"], bundle["scaler"]
+
+    def get_bundle(self, brand, moto_id, mode="idle", model=None):
+        """
+        Return the whole saved dict (model, scaler and any training metadata).
+        With `model`, a bike without its own .pkl gets the shared brand/model
+        forest instead, with "scaler" and "offset" from its calibration record
+        and "source" set to "calibrated" or "shared" (own models: "bike").
+        """
+        key = (brand, str(moto_id), mode)
+        path = self.path(*key)
+        shared_path = None if model is None else self.shared_path(brand, model, mode)
+        if shared_path is None or os.path.exists(path) or not os.path.exists(shared_path):
+            return self._get_file(key, path)        # FileNotFoundError names the bike's own .pkl
+
+        shared = self._get_file((brand, f"shared_{model}", mode), shared_path)
+        with self._lock:
+            self.counters["shared_lookups"] += 1
+        bundle = {k: shared[k] for k in ("model", "forest", "window_rows", "window_step", "bike_scale")
+                  if k in shared}
+        calibration = self._calibration(key, model)
+        if calibration is None:
+            bundle.update(scaler=shared["scaler"], offset=None, source="shared")
+        else:
+            bundle.update(scaler=calibration, offset=calibration.offset, source="calibrated")
+        return bundle
+
+    def has_model(self, brand, moto_id, mode="idle", model=None):
+        """Whether get_bundle would find a model: the bike's own, or with `model` a shared one."""
+        if os.path.exists(self.path(brand, moto_id, mode)):
+            return True
+        return model is not None and os.path.exists(self.shared_path(brand, model, mode))
+
+    def _get_file(self, key, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._cache.pop(key, None)
+            raise FileNotFoundError(path)
+        sig = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == sig:
+                self._cache.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[2]
+
+        checksum = None
+        if entry is not None and self.validate == "checksum":
+            checksum = _sha1(path)
+            if checksum == entry[1]:
+                # Touched but unchanged: keep the loaded bundle, remember the new stat
+                with self._lock:
+                    self._cache[key] = (sig, checksum, entry[2])
+                    self._cache.move_to_end(key)
+                    self.counters["hits"] += 1
+                return entry[2]
+
+        bundle = self._load(path)
+        if self.validate == "checksum" and checksum is None:
+            checksum = _sha1(path)
+        with self._lock:
+            self.counters["reloads" if entry is not None else "misses"] += 1
+            self._cache[key] = (sig, checksum, bundle)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_models:
+                self._cache.popitem(last=False)
+                self.counters["evictions"] += 1
+        return bundle
+
+    def _calibration(self, key, model):
+        """The bike's calibration record for `model`, or None."""
+        path = self.calibration_path(*key)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._calibrations.pop(key, None)
+            return None
+        sig = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._calibrations.get(key)
+            if entry is not None and entry[0] == sig:
+                self._calibrations.move_to_end(key)
+                calibration = entry[1]
+            else:
+                calibration = None
+        if calibration is None:
+            try:
+                calibration = load_calibration(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[ModelRegistry] ⚠️ Ignoring unreadable calibration {path}: {e}")
+                return None
+            with self._lock:
+                self._calibrations[key] = (sig, calibration)
+                self._calibrations.move_to_end(key)
+                while len(self._calibrations) > self.max_calibrations:
+                    self._calibrations.popitem(last=False)
+        # A record made for another model (the bike was re-registered) doesn't apply
+        return calibration if calibration.model == model else None
+
+    def _load(self, path):
+        bundle = joblib.load(path, mmap_mode="r" if self.mmap else None)
+        if not {"model", "scaler"} <= bundle.keys():
+            raise ValueError(f"{path} missing model/scaler keys")
+        if self.engine == "compiled":
+            try:
+                bundle["forest"] = load_compiled(path, bundle["model"])
+            except Exception as e:
+                print(f"[ModelRegistry] ⚠️ Could not compile {path}, scoring with sklearn: {e}")
+        return bundle
+
+    # ───────────── maintenance ─────────────
+    def warm_up(self, mode="idle", brands=None):
+        """Preload bikes' own models under models/<brand>/ (all brands by default), up to max_models."""
+        pattern = re.compile(rf"^{re.escape(mode)}_(.+)\.pkl$")
+        loaded = 0
+        for brand_dir in sorted(glob.glob(os.path.join(self.base_dir, "*"))):
+            brand = os.path.basename(brand_dir)
+            if not os.path.isdir(brand_dir) or (brands and brand not in brands):
+                continue
+            for path in sorted(glob.glob(os.path.join(brand_dir, f"{mode}_*.pkl"))):
+                m = pattern.match(os.path.basename(path))
+                if not m or path.endswith(SIDECAR_SUFFIXES) or loaded >= self.max_models:
+                    continue
+                try:
+                    self.get(brand, m.group(1), mode)
+                    loaded += 1
+                except Exception as e:
+                    print(f"[ModelRegistry] ⚠️ Warm-up failed for {path}: {e}")
+        print(f"[ModelRegistry] Warmed up {loaded} models")
+        return loaded
+
+    def invalidate(self, brand=None, moto_id=None, mode="idle"):
+        """Drop one cached model, or everything when called without arguments."""
+        with self._lock:
+            if brand is None:
+                self._cache.clear()
+                self._calibrations.clear()
+            else:
+                self._cache.pop((brand, str(moto_id), mode), None)
+                self._calibrations.pop((brand, str(moto_id), mode), None)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "size": len(self._cache), "max_models": self.max_models,
+                    "validate": self.validate, "mmap": self.mmap, "engine": self.engine,
+                    "calibrations": len(self._calibrations), "max_calibrations": self.max_calibrations,
+                    "cached": ["/".join(k) for k in self._cache]}
+
+
+def _sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
@@ -0,0 +1,71 @@
+"""
+obd_sim.py
+──────────
+Simulated ELM327 stand-in for running obddata.py without a motorcycle:
+
+    python obddata.py 4 --simulate
+
+SimulatedOBD mimics the parts of obd.OBD the collector uses
+(is_connected / supports / query / close). Every query blocks for the
+adapter's per-request latency, so the PID scheduler sees the same
+bandwidth limit it would on a real serial link, and readings drift
+around warm-idle values.
+"""
+
+import math
+import random
+import threading
+import time
+
+# name → (centre, amplitude, noise) for a warm idling engine
+_IDLE_PROFILE = {
+    "RPM": (1500.0, 120.0, 25.0),
+    "COOLANT_TEMP": (88.0, 3.0, 0.3),
+    "ENGINE_LOAD": (25.0, 4.0, 1.0),
+    "ELM_VOLTAGE": (13.6, 0.2, 0.05),
+    "THROTTLE_POS": (12.0, 1.5, 0.4),
+    "LONG_FUEL_TRIM_1": (-2.0, 1.0, 0.3),
+}
+
+
+class _Quantity:
+    def __init__(self, magnitude):
+        self.magnitude = magnitude
+
+
+class SimulatedResponse:
+    def __init__(self, value=None):
+        self.value = None if value is None else _Quantity(value)
+        self.time = time.time()
+
+    def is_null(self):
+        return self.value is None
+
+
+class SimulatedOBD:
+    def __init__(self, latency_s=0.03, null_rate=0.0, seed=None):
+        self.latency_s = latency_s
+        self.null_rate = null_rate
+        self._rng = random.Random(seed)
+        self._started = time.monotonic()
+        self._lock = threading.Lock()       # one request on the "serial line" at a time
+        self._connected = True
+
+    def is_connected(self):
+        return self._connected
+
+    def supports(self, cmd):
+        return cmd.name in _IDLE_PROFILE
+
+    def query(self, cmd, force=False):
+        with self._lock:
+            time.sleep(self.latency_s)
+            profile = _IDLE_PROFILE.get(cmd.name)
+            if profile is None or self._rng.random() < self.null_rate:
+                return SimulatedResponse()
+            centre, amplitude, noise = profile
+            t = time.monotonic() - self._started
+            return SimulatedResponse(centre + amplitude * math.sin(t / 7.0) + self._rng.gauss(0, noise))
+
+    def close(self):
+        self._connected = False
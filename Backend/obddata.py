@@ -1,31 +1,59 @@
+import argparse
 import obd
 import os
+import signal
 import time
 import json
-import sys
 import paho.mqtt.client as mqtt
-from influxdb_client import InfluxDBClient, Point, WriteOptions
+from influxdb_client import Point
+from influx_client import close_client
+from batch_writer import BatchWriter, WRITE_PRECISION
+from telemetry_codec import binary_topic, encode_payload
+from pid_scheduler import PidScheduler, parse_rates
 
-# Enable debug logging
-obd.logger.setLevel(obd.logging.DEBUG)
+# python-OBD logs every request at DEBUG; at tens of queries/s that drowns the output
+if os.environ.get("OBD_DEBUG", "0") == "1":
+    obd.logger.setLevel(obd.logging.DEBUG)
 
 # MQTT broker settings
 MQTT_BROKER = "broker.hivemq.com"
 MQTT_PORT = 1883
 MQTT_TOPIC = "obd/data"
-
-# InfluxDB settings - update these with your real values
-INFLUXDB_URL = "http://localhost:8086"
-INFLUXDB_TOKEN = "rLaEXQUWJ2R71NQIEFVfhw18L9xC4knKBf7bPAymrJtz6nukc5NIfPPdoc2dlk0c8n_gGm6kiwi7aDAl-uCmWA=="
-INFLUXDB_ORG = "MotorcycleMaintenance"
-INFLUXDB_BUCKET = "MotorcycleOBDData"
+# "json" (obd/data, what the browser dashboard reads), "binary" (obd/data/bin) or "both"
+MQTT_PAYLOAD = os.environ.get("MQTT_PAYLOAD", "json")
+
+# InfluxDB settings live in influx_client.py; batching is tuned here
+INFLUX_BATCH_SIZE = int(os.environ.get("INFLUX_BATCH_SIZE", "500"))           # points per HTTP write
+INFLUX_FLUSH_INTERVAL_MS = int(os.environ.get("INFLUX_FLUSH_INTERVAL_MS", "1000"))
+INFLUX_JITTER_MS = int(os.environ.get("INFLUX_JITTER_MS", "200"))
+INFLUX_RETRY_INTERVAL_MS = int(os.environ.get("INFLUX_RETRY_INTERVAL_MS", "1000"))
+INFLUX_MAX_RETRIES = int(os.environ.get("INFLUX_MAX_RETRIES", "5"))
+INFLUX_SPOOL_PATH = os.environ.get("INFLUX_SPOOL_PATH", "influx_spool.lp")     # used while InfluxDB is down
+INFLUX_SPOOL_MAX_MB = int(os.environ.get("INFLUX_SPOOL_MAX_MB", "50"))
+
+# Sampling: each PID is polled at its own rate (pid_scheduler.py), samples go out at OBD_PUBLISH_HZ
+OBD_PUBLISH_HZ = float(os.environ.get("OBD_PUBLISH_HZ", "5"))
+OBD_REPORT_S = float(os.environ.get("OBD_REPORT_S", "10"))       # how often achieved Hz is printed
+
+parser = argparse.ArgumentParser(description="Collect OBD-II data and publish it over MQTT")
+parser.add_argument("motorcycle_id", nargs="?", default=None, help="e.g. 4")
+parser.add_argument("--port", default=os.environ.get("OBD_PORT", "COM3"), help="Serial port of the ELM327")
+parser.add_argument("--simulate", action="store_true", help="Use a simulated ELM327 (obd_sim.py)")
+args = parser.parse_args()
 
 # Get motorcycle_id from command line argument (optional)
-if len(sys.argv) < 2:
+if args.motorcycle_id is None:
     print("[WARNING] No motorcycle_id provided. Using 'unknown'.")
     MOTORCYCLE_ID = "unknown"
 else:
-    MOTORCYCLE_ID = sys.argv[1]
+    MOTORCYCLE_ID = args.motorcycle_id
+
+# The collector supervisor stops us with SIGTERM; treat it like Ctrl+C so the
+# InfluxDB batch is flushed and the connections are closed
+def on_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+signal.signal(signal.SIGTERM, on_sigterm)
 
 # Create MQTT client
 mqtt_client = mqtt.Client(protocol=mqtt.MQTTv311)
@@ -37,16 +65,20 @@ mqtt_client.on_connect = on_connect
 mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 30)
 mqtt_client.loop_start()
 
-# Setup InfluxDB client
-influx_client = InfluxDBClient(
-    url=INFLUXDB_URL,
-    token=INFLUXDB_TOKEN,
-    org=INFLUXDB_ORG
+# Setup batched InfluxDB writer on the shared client
+influx_writer = BatchWriter(
+    batch_size=INFLUX_BATCH_SIZE,
+    flush_interval_ms=INFLUX_FLUSH_INTERVAL_MS,
+    jitter_interval_ms=INFLUX_JITTER_MS,
+    retry_interval_ms=INFLUX_RETRY_INTERVAL_MS,
+    max_retries=INFLUX_MAX_RETRIES,
+    spool_path=INFLUX_SPOOL_PATH,
+    spool_max_bytes=INFLUX_SPOOL_MAX_MB * 1024 * 1024,
 )
-write_api = influx_client.write_api(write_options=WriteOptions(batch_size=1))
 
-def write_to_influxdb(obd_data, motorcycle_id):
-    point = Point("obd_data").tag("motorcycle_id", motorcycle_id)
+def write_to_influxdb(obd_data, motorcycle_id, timestamp_ms):
+    # Stamp the sample with its read time so batching/spooling never shifts it
+    point = Point("obd_data").tag("motorcycle_id", motorcycle_id).time(timestamp_ms, WRITE_PRECISION)
     for cmd, value in obd_data.items():
         if value is not None:
             try:
@@ -55,14 +87,24 @@ def write_to_influxdb(obd_data, motorcycle_id):
             except (ValueError, TypeError):
                 print(f"[WARNING] Could not convert value to float for {cmd}: {value}")
                 continue
-    write_api.write(bucket=INFLUXDB_BUCKET, record=point)
-    print(f"[InfluxDB] Wrote: {obd_data}")
+    influx_writer.write(point)
 
-port = "COM3"  # Change this as needed
+port = "simulator" if args.simulate else args.port  # Change with --port / OBD_PORT
 print(f"Attempting to connect to OBD-II device on {port}...")
 
+def read_pid(name):
+    """One blocking adapter request → value rounded to 2 decimals, or None."""
+    response = connection.query(obd.commands[name])
+    if response.is_null() or response.value is None:
+        return None
+    return round(float(response.value.magnitude), 2)
+
 try:
-    connection = obd.OBD(portstr=port, fast=True, timeout=3)
+    if args.simulate:
+        from obd_sim import SimulatedOBD
+        connection = SimulatedOBD()
+    else:
+        connection = obd.OBD(portstr=port, fast=True, timeout=3)
 
     if connection.is_connected():
         print(f"Successfully connected to vehicle on {port}!")
@@ -71,56 +113,66 @@ try:
         if not connection.supports(obd.commands.LONG_FUEL_TRIM_1):
             print("[WARNING] LONG_FUEL_TRIM_1 PID not supported by this vehicle or adapter.")
 
-        commands = [
-            obd.commands.RPM,
-            obd.commands.COOLANT_TEMP,
-            obd.commands.ENGINE_LOAD,
-            obd.commands.ELM_VOLTAGE,
-            obd.commands.THROTTLE_POS,
-            obd.commands.LONG_FUEL_TRIM_1
-        ]
-
-        last_write_time = time.time()
+        # RPM / throttle fast, coolant / voltage slow; the adapter is never idle between requests.
+        # Only the latest read goes out per tick, so nothing is polled faster than we publish
+        rates = parse_rates(max_hz=OBD_PUBLISH_HZ)
+        scheduler = PidScheduler(read_pid, rates).start()
+        print(f"Polling PIDs at {rates} Hz, publishing at {OBD_PUBLISH_HZ} Hz")
 
         print("Press Ctrl+C to stop data gathering.")
+        seq = 0
+        period = 1.0 / OBD_PUBLISH_HZ
+        next_tick = time.monotonic()
+        next_report = next_tick + OBD_REPORT_S
         try:
             while True:
-                # Clear screen each loop for cleaner output
-                os.system('cls' if os.name == 'nt' else 'clear')
-
-                obd_data = {}
-                for cmd in commands:
-                    response = connection.query(cmd)
-
-                    if response.is_null():
-                        print(f"[DEBUG] {cmd.name} returned no data (null).")
-                        value = None
-                    else:
-                        value = response.value.magnitude if response.value is not None else None
-                        if value is not None:
-                            value = round(float(value), 2)
-                    obd_data[cmd.name] = value
+                sample_time_ms = time.time_ns() // 1_000_000
+                obd_data, stale = scheduler.take()
 
                 # Remove null values from payload to avoid sending them over MQTT
                 payload_data = {k: v for k, v in obd_data.items() if v is not None}
+                # Slow PIDs not re-read since the last tick are repeats: flagged, so the server's
+                # statistics skip them, and never written to InfluxDB twice
+                stale = [k for k in stale if k in payload_data]
                 payload = {
                     "motorcycle_id": MOTORCYCLE_ID,
+                    "seq": seq,     # lets the server drop the duplicate when both formats are sent
+                    "timestamp_ms": sample_time_ms,     # with seq: tells a restarted collector's samples apart
                     "data": payload_data
                 }
-
-                mqtt_client.publish(MQTT_TOPIC, json.dumps(payload))
-                print(f"Published OBD data: {json.dumps(payload, indent=2)}")
-
-                # Write to InfluxDB every 5 seconds
-                current_time = time.time()
-                if current_time - last_write_time >= 5:
-                    write_to_influxdb(obd_data, MOTORCYCLE_ID)
-                    last_write_time = current_time
-
-                time.sleep(0.2)  # 200 ms delay for faster updates
+                if stale:
+                    payload["stale"] = stale
+
+                if MQTT_PAYLOAD in ("json", "both"):
+                    mqtt_client.publish(MQTT_TOPIC, json.dumps(payload))
+                if MQTT_PAYLOAD in ("binary", "both"):
+                    mqtt_client.publish(binary_topic(MQTT_TOPIC),
+                                        encode_payload(MOTORCYCLE_ID, payload_data, seq, sample_time_ms, stale))
+                seq = (seq + 1) & 0xFFFFFFFF
+
+                # Queue every fresh reading; the batch writer sends them in the background
+                fresh = {k: v for k, v in obd_data.items() if k not in stale}
+                if any(v is not None for v in fresh.values()):
+                    write_to_influxdb(fresh, MOTORCYCLE_ID, sample_time_ms)
+
+                now = time.monotonic()
+                if now >= next_report:
+                    report = scheduler.rate_report()
+                    print("[PID] achieved Hz: " + ", ".join(
+                        f"{name} {r['achieved_hz']}/{r['target_hz']:g}" + (f" ({r['nulls']} null)" if r["nulls"] else "")
+                        for name, r in report.items()), flush=True)
+                    next_report = now + OBD_REPORT_S
+
+                # Fixed-rate publishing: sleep to the next tick, skip ticks we already missed
+                next_tick += period
+                time.sleep(max(0.0, next_tick - time.monotonic()))
+                if time.monotonic() - next_tick > period:
+                    next_tick = time.monotonic()
 
         except KeyboardInterrupt:
             print("\nData gathering stopped by user.")
+        finally:
+            scheduler.stop()
     else:
         print(f"Failed to connect to OBD-II device on {port}.")
 
@@ -132,4 +184,6 @@ finally:
     mqtt_client.disconnect()
     if 'connection' in locals() and connection.is_connected():
         connection.close()
-    influx_client.close()
+    influx_writer.close()
+    print(f"[InfluxDB] Writer stats: {influx_writer.stats()}")
+    close_client()
@@ -0,0 +1,282 @@
+"""
+online_detector.py
+──────────────────
+Per-message anomaly scoring on the MQTT stream (ingest.py on_message), so a
+critical coolant or voltage reading is pushed to the dashboard as it
+arrives instead of showing up on the next /predict.
+
+For every motorcycle and feature, each message updates in O(1):
+  • Welford running mean / variance and an EWMA (context for the alert and
+    /alerts state)
+  • consecutive-violation counters against NORMAL_RANGES[brand][model]
+
+Alert levels use the same thresholds as classify_value. Hysteresis stops
+alerts from flapping:
+  • raise   a level after ONLINE_WARNING_SAMPLES / ONLINE_CRITICAL_SAMPLES
+            consecutive samples at or beyond it (critical defaults to 1:
+            one sample is enough)
+  • clear   only after ONLINE_CLEAR_SAMPLES consecutive samples back inside
+            the band by ONLINE_HYSTERESIS × the width of the warning band
+
+Each change of level is an event on ALERT_BROKER (the same fan-out as the
+live SSE stream, /alerts-stream) and in a short history (/alerts).
+
+MQTT messages carry only motorcycle_id, so a bike's brand/model must be
+registered (/start-obd, /predict or /alerts-stream pass it). Until then its
+statistics are kept but no ranges are checked.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from anomaly_model import NORMAL_RANGES, normalize
+from live_state import LIVE_STATE, remote
+from live_stream import StreamBroker
+from telemetry_codec import fresh_data
+
+ONLINE_WARNING_SAMPLES = int(os.environ.get("ONLINE_WARNING_SAMPLES", "5"))
+ONLINE_CRITICAL_SAMPLES = int(os.environ.get("ONLINE_CRITICAL_SAMPLES", "1"))
+ONLINE_CLEAR_SAMPLES = int(os.environ.get("ONLINE_CLEAR_SAMPLES", "10"))
+ONLINE_HYSTERESIS = float(os.environ.get("ONLINE_HYSTERESIS", "0.05"))
+ONLINE_EWMA_ALPHA = float(os.environ.get("ONLINE_EWMA_ALPHA", "0.2"))
+ONLINE_EVENT_HISTORY = int(os.environ.get("ONLINE_EVENT_HISTORY", "200"))
+
+FEATURES = [
+    "rpm",
+    "engine_load",
+    "throttle_pos",
+    "long_fuel_trim_1",
+    "coolant_temp",
+    "elm_voltage",
+]
+
+LEVELS = ["normal", "warning", "critical"]
+NORMAL, WARNING, CRITICAL = 0, 1, 2
+
+
+class _FeatureState:
+    __slots__ = ("n", "mean", "m2", "ewma", "last", "level", "above_warning", "above_critical",
+                 "clear_count", "clear_to")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = None
+        self.last = None
+        self.level = NORMAL
+        self.above_warning = 0      # consecutive samples at warning or worse
+        self.above_critical = 0     # consecutive samples at critical
+        self.clear_count = 0        # consecutive samples back inside the band (with hysteresis)
+        self.clear_to = NORMAL      # worst level seen during the clearing streak
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / self.n) if self.n > 1 else 0.0
+
+    def to_dict(self):
+        return {"level": LEVELS[self.level], "last": self.last, "n": self.n, "mean": round(self.mean, 3),
+                "std": round(self.std, 3), "ewma": None if self.ewma is None else round(self.ewma, 3)}
+
+
+def _compile_bands(brand, model):
+    """Per feature: (crit_min, warn_min, warn_max, crit_max, margin) or None without a reference range."""
+    entry = NORMAL_RANGES.get(normalize(brand), {}).get(normalize(model), {})
+    bands = []
+    for f in FEATURES:
+        r = entry.get(f)
+        if r is None:
+            bands.append(None)
+            continue
+        margin = ONLINE_HYSTERESIS * (r["warning_max"] - r["warning_min"])
+        bands.append((r["critical_min"], r["warning_min"], r["warning_max"], r["critical_max"], margin))
+    return bands
+
+
+def _level(value, crit_min, warn_min, warn_max, crit_max):
+    # Same comparisons as anomaly_model.classify_value
+    if value <= crit_min or value >= crit_max:
+        return CRITICAL
+    if value <= warn_min or value >= warn_max:
+        return WARNING
+    return NORMAL
+
+
+class _Bike:
+    def __init__(self, brand=None, model=None):
+        self.brand = brand
+        self.model = model
+        self.bands = _compile_bands(brand, model) if brand and model else [None] * len(FEATURES)
+        self.features = [_FeatureState() for _ in FEATURES]
+        self.messages = 0
+        self.last_seen = None
+
+
+class OnlineDetector:
+    def __init__(self, broker, history=ONLINE_EVENT_HISTORY):
+        self.broker = broker
+        self.events = deque(maxlen=history)
+        self._bikes = {}            # motorcycle_id → _Bike
+        self._lock = threading.Lock()
+        self.counters = {"messages": 0, "events": 0}
+
+    def register(self, motorcycle_id, brand, model):
+        """Set the brand/model whose NORMAL_RANGES apply to this motorcycle (statistics are kept)."""
+        motorcycle_id = str(motorcycle_id)
+        brand, model = normalize(brand), normalize(model)
+        with self._lock:
+            bike = self._bikes.get(motorcycle_id)
+            if bike is not None and (bike.brand, bike.model) == (brand, model):
+                return
+            fresh = _Bike(brand, model)
+            if bike is not None:
+                for old, new in zip(bike.features, fresh.features):
+                    new.n, new.mean, new.m2, new.ewma, new.last = old.n, old.mean, old.m2, old.ewma, old.last
+                fresh.messages, fresh.last_seen = bike.messages, bike.last_seen
+            self._bikes[motorcycle_id] = fresh
+
+    def reset(self, motorcycle_id):
+        """Start a new session for this motorcycle (keeps its brand/model)."""
+        with self._lock:
+            bike = self._bikes.get(str(motorcycle_id))
+            if bike is not None:
+                self._bikes[str(motorcycle_id)] = _Bike(bike.brand, bike.model)
+
+    def ingest(self, payload, ts=None):
+        """Score one MQTT payload; returns the events it raised (usually none)."""
+        motorcycle_id = payload.get("motorcycle_id")
+        if motorcycle_id is None:
+            return []
+        motorcycle_id = str(motorcycle_id)
+        ts = time.time() if ts is None else ts
+        data = fresh_data(payload)      # a stale (repeated) value must not count as another violation
+        events = []
+        with self._lock:
+            bike = self._bikes.get(motorcycle_id)
+            if bike is None:
+                bike = self._bikes[motorcycle_id] = _Bike()
+            bike.messages += 1
+            bike.last_seen = ts
+            self.counters["messages"] += 1
+            for j, f in enumerate(FEATURES):
+                value = data.get(f)
+                if value is None:
+                    continue
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+                if value != value:          # NaN
+                    continue
+                level = self._update(bike.features[j], bike.bands[j], value)
+                if level is not None:
+                    events.append(self._event(motorcycle_id, bike, j, level, ts))
+            self.counters["events"] += len(events)
+            self.events.extend(events)
+        for event in events:
+            print(f"[Alerts] {event['message']}")
+            self.broker.publish(event)
+        return events
+
+    def _update(self, s, band, value):
+        # Running statistics
+        s.n += 1
+        delta = value - s.mean
+        s.mean += delta / s.n
+        s.m2 += delta * (value - s.mean)
+        s.ewma = value if s.ewma is None else s.ewma + ONLINE_EWMA_ALPHA * (value - s.ewma)
+        s.last = value
+        if band is None:
+            return None
+
+        crit_min, warn_min, warn_max, crit_max, margin = band
+        level = _level(value, crit_min, warn_min, warn_max, crit_max)
+        s.above_warning = s.above_warning + 1 if level >= WARNING else 0
+        s.above_critical = s.above_critical + 1 if level == CRITICAL else 0
+
+        # Raise
+        raised = s.level
+        if s.above_critical >= ONLINE_CRITICAL_SAMPLES:
+            raised = CRITICAL
+        elif s.above_warning >= ONLINE_WARNING_SAMPLES:
+            raised = max(raised, WARNING)
+        if raised > s.level:
+            s.level, s.clear_count, s.clear_to = raised, 0, NORMAL
+            return raised
+
+        # Clear: judged against a band narrowed by the hysteresis margin
+        settled = _level(value, crit_min + margin, warn_min + margin, warn_max - margin, crit_max - margin)
+        if settled < s.level:
+            s.clear_to = settled if s.clear_count == 0 else max(s.clear_to, settled)
+            s.clear_count += 1
+            if s.clear_count >= ONLINE_CLEAR_SAMPLES:
+                s.level, s.clear_count = s.clear_to, 0
+                return s.level
+        else:
+            s.clear_count = 0
+        return None
+
+    def _event(self, motorcycle_id, bike, j, level, ts):
+        s = bike.features[j]
+        f = FEATURES[j]
+        _, warn_min, warn_max, _, _ = bike.bands[j]
+        z = (s.last - s.mean) / s.std if s.std > 0 else 0.0
+        return {
+            "type": "alert",
+            "motorcycle_id": motorcycle_id,
+            "feature": f,
+            "level": LEVELS[level],
+            "value": s.last,
+            "ewma": round(s.ewma, 3),
+            "mean": round(s.mean, 3),
+            "std": round(s.std, 3),
+            "z": round(z, 2),
+            "normal_range": [warn_min, warn_max],
+            "time_ms": int(ts * 1000),
+            "message": f"{f} {LEVELS[level].upper()} on motorcycle {motorcycle_id}: {s.last:.2f} "
+                       f"(normal {warn_min}–{warn_max})",
+        }
+
+    def mark_gap(self):
+        """Samples may have been missed: consecutive counts restart (levels and statistics stay)."""
+        with self._lock:
+            for bike in self._bikes.values():
+                for s in bike.features:
+                    s.above_warning = s.above_critical = s.clear_count = 0
+
+    def active_alerts(self, motorcycle_id=None):
+        """Current non-normal levels as events (sent to new /alerts-stream subscribers first)."""
+        with self._lock:
+            return [self._event(m, bike, j, s.level, bike.last_seen or time.time())
+                    for m, bike in self._bikes.items() if motorcycle_id is None or m == str(motorcycle_id)
+                    for j, s in enumerate(bike.features) if s.level != NORMAL]
+
+    def state(self, motorcycle_id):
+        with self._lock:
+            bike = self._bikes.get(str(motorcycle_id))
+            if bike is None:
+                return None
+            return {"motorcycle_id": str(motorcycle_id), "brand": bike.brand, "model": bike.model,
+                    "messages": bike.messages, "last_seen": bike.last_seen,
+                    "features": {f: s.to_dict() for f, s in zip(FEATURES, bike.features)}}
+
+    def recent_events(self, motorcycle_id=None, limit=50):
+        with self._lock:
+            events = [e for e in self.events if motorcycle_id is None or e["motorcycle_id"] == str(motorcycle_id)]
+        return events[-limit:]
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "motorcycles": len(self._bikes),
+                    "registered": sum(1 for b in self._bikes.values() if b.brand)}
+
+
+# Process-wide instances fed by the MQTT subscriber (ingest.py; remote in HTTP workers, see live_state.py)
+if LIVE_STATE == "remote":
+    ALERT_BROKER = remote("alert_broker")
+    ONLINE_DETECTOR = remote("online_detector")
+else:
+    ALERT_BROKER = StreamBroker()
+    ONLINE_DETECTOR = OnlineDetector(ALERT_BROKER)
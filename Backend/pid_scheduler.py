@@ -0,0 +1,145 @@
+"""
+pid_scheduler.py
+────────────────
+Per-PID polling scheduler for the OBD collector (obddata.py).
+
+An ELM327 answers one request at a time, so the way to a higher sample
+rate is to keep the adapter busy and spend its bandwidth where it matters:
+every PID has its own target rate (RPM / throttle fast, coolant / voltage
+slow) and a background thread always queries the PID whose next deadline
+is earliest, with no fixed sleep between rounds. A deadline that was missed
+is re-based to "now" rather than queued, so an overloaded adapter shares its
+bandwidth among the late PIDs instead of building a backlog.
+
+The latest value of every PID is kept in a snapshot the collector publishes
+from; take() also says which PIDs were not re-read since the previous tick,
+so slow PIDs are not stored or counted again at the publish rate. No PID
+is polled faster than the publish rate (parse_rates(max_hz=...)): a second
+read between two ticks would only overwrite the first and cost adapter
+time. Achieved Hz / null counts per PID are reported for tuning.
+
+python-OBD's obd.Async is not used: its watch loop queries every watched
+command once per round and then sleeps `delay_cmds`, so all PIDs run at the
+same rate. This does the same job (a daemon thread calling query() and
+keeping the last response) with per-PID deadlines.
+"""
+
+import heapq
+import os
+import threading
+import time
+
+# target Hz per PID; override with OBD_PID_RATES="RPM=10,COOLANT_TEMP=0.5,..."
+# (the fast ones match obddata.py's default OBD_PUBLISH_HZ, which caps them anyway)
+DEFAULT_PID_RATES = {
+    "RPM": 5,
+    "THROTTLE_POS": 5,
+    "ENGINE_LOAD": 5,
+    "LONG_FUEL_TRIM_1": 1,
+    "COOLANT_TEMP": 1,
+    "ELM_VOLTAGE": 1,
+}
+
+
+def parse_rates(spec=None, defaults=DEFAULT_PID_RATES, max_hz=None):
+    """"RPM=10,COOLANT_TEMP=1" → {"RPM": 10.0, ...} on top of the defaults, each at most `max_hz`."""
+    rates = dict(defaults)
+    spec = os.environ.get("OBD_PID_RATES", "") if spec is None else spec
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, hz = item.partition("=")
+        try:
+            rates[name.strip().upper()] = float(hz)
+        except ValueError:
+            raise ValueError(f"Invalid PID rate '{item}' (expected NAME=HZ)")
+    if max_hz is not None:
+        capped = {name: hz for name, hz in rates.items() if hz > max_hz}
+        if capped:
+            print(f"[PID] Capping {', '.join(capped)} at the publish rate ({max_hz:g} Hz)")
+        rates = {name: min(hz, max_hz) for name, hz in rates.items()}
+    return {name: hz for name, hz in rates.items() if hz > 0}
+
+
+class PidScheduler:
+    def __init__(self, query, rates, clock=time.monotonic):
+        """`query(name)` performs one blocking adapter request and returns a value or None."""
+        self.query = query
+        self.rates = dict(rates)
+        self.clock = clock
+        self._latest = {name: None for name in self.rates}
+        self._counts = {name: 0 for name in self.rates}
+        self._nulls = {name: 0 for name in self.rates}
+        self._errors = {name: 0 for name in self.rates}
+        self._fresh = set()             # PIDs read since the last take()
+        self._window = (clock(), dict(self._counts))     # start of the current rate window
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="pid-scheduler")
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=2):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def snapshot(self):
+        """Latest value of every PID (None if the last read was null)."""
+        with self._lock:
+            return dict(self._latest)
+
+    def take(self):
+        """(snapshot, PIDs not read since the previous take()) — one published sample per call."""
+        with self._lock:
+            stale = [name for name in self.rates if name not in self._fresh]
+            self._fresh.clear()
+            return dict(self._latest), stale
+
+    def rate_report(self):
+        """{pid: {"target_hz", "achieved_hz", "nulls", "errors"}} since the previous call."""
+        now = self.clock()
+        with self._lock:
+            started, counts_then = self._window
+            elapsed = max(now - started, 1e-9)
+            report = {
+                name: {
+                    "target_hz": hz,
+                    "achieved_hz": round((self._counts[name] - counts_then[name]) / elapsed, 2),
+                    "nulls": self._nulls[name],
+                    "errors": self._errors[name],
+                }
+                for name, hz in self.rates.items()
+            }
+            self._window = (now, dict(self._counts))
+        return report
+
+    def _run(self):
+        start = self.clock()
+        # (next deadline, tie-breaker, name); staggered so fast PIDs don't all start at once
+        heap = [(start + i * 1e-3, i, name) for i, name in enumerate(self.rates)]
+        heapq.heapify(heap)
+        while not self._stop.is_set():
+            due, i, name = heap[0]
+            wait = due - self.clock()
+            if wait > 0 and self._stop.wait(wait):
+                break
+            heapq.heappop(heap)
+            try:
+                value = self.query(name)
+                error = False
+            except Exception as e:
+                print(f"[PID] ⚠️ Query {name} failed: {e}")
+                value, error = None, True
+            with self._lock:
+                self._latest[name] = value
+                self._fresh.add(name)
+                self._counts[name] += 1
+                self._nulls[name] += value is None and not error
+                self._errors[name] += error
+            # Next deadline one period on; if we're already late, don't build a backlog
+            heapq.heappush(heap, (max(due + 1.0 / self.rates[name], self.clock()), i, name))
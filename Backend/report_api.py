@@ -1,18 +1,15 @@
 # report_api.py
+import os
+import pandas as pd
 from flask import Blueprint, jsonify, request
-from influxdb_client import InfluxDBClient
+from influx_client import INFLUXDB_BUCKET, get_query_api
+from influx_query import downsample_stage, parse_resolution
+from history_cache import HISTORY_CACHE, flux_time
+from rollups import ROLLUPS
+from response_cache import RESPONSE_CACHE, REPORT_CACHE_TTL_S
 
 report_api = Blueprint("report_api", __name__)
 
-# InfluxDB configuration
-INFLUXDB_URL = "http://localhost:8086"
-INFLUXDB_TOKEN = "rLaEXQUWJ2R71NQIEFVfhw18L9xC4knKBf7bPAymrJtz6nukc5NIfPPdoc2dlk0c8n_gGm6kiwi7aDAl-uCmWA=="
-INFLUXDB_ORG = "MotorcycleMaintenance"
-INFLUXDB_BUCKET = "MotorcycleOBDData"
-
-client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
-query_api = client.query_api()
-
 FEATURES = [
     "rpm",
     "engine_load",
@@ -22,46 +19,134 @@ FEATURES = [
     "elm_voltage"
 ]
 
-def query_aggregated_report(time_range, motorcycle_id):
+# Means/std/min/max from the hourly rollups (rollups.py) instead of scanning raw points
+REPORT_ROLLUPS = os.environ.get("REPORT_ROLLUPS", "1") == "1"
+
+def query_aggregated_report(time_range, motorcycle_id, stop="now()"):
+    """
+    Mean of every feature over `time_range`, computed inside InfluxDB.
+    Only one row per field comes back, whatever the raw point count.
+    """
+    fields_filter = " or ".join([f'r["_field"] == "{f}"' for f in FEATURES])
+
+    query = f'''
+    from(bucket: "{INFLUXDB_BUCKET}")
+      |> range(start: {time_range}, stop: {stop})
+      |> filter(fn: (r) => r["_measurement"] == "obd_data")
+      |> filter(fn: (r) => r["motorcycle_id"] == "{motorcycle_id}")
+      |> filter(fn: (r) => {fields_filter})
+      |> group(columns: ["_field"])
+      |> mean()
+    '''
+
+    means = {f: None for f in FEATURES}
+    try:
+        tables = get_query_api().query(query)
+    except Exception as e:
+        print(f"[ERROR] Failed to compute means: {e}")
+        return means
+
+    for table in tables:
+        for record in table.records:
+            field = record.values.get("_field")
+            if field in means and record.get_value() is not None:
+                means[field] = round(float(record.get_value()), 2)
+    return means
+
+def query_bucketed_report(time_range, motorcycle_id, resolution, stop="now()"):
+    """Per-bucket feature means (aggregateWindow in Flux) for charting a report range."""
     fields_filter = " or ".join([f'r["_field"] == "{f}"' for f in FEATURES])
     keep_columns = ', '.join([f'"{f}"' for f in ["_time"] + FEATURES])
 
     query = f'''
     from(bucket: "{INFLUXDB_BUCKET}")
-      |> range(start: {time_range})
+      |> range(start: {time_range}, stop: {stop})
       |> filter(fn: (r) => r["_measurement"] == "obd_data")
       |> filter(fn: (r) => r["motorcycle_id"] == "{motorcycle_id}")
       |> filter(fn: (r) => {fields_filter})
+      {downsample_stage(resolution)}
       |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
       |> keep(columns: [{keep_columns}])
     '''
 
-    result = query_api.query_data_frame(query)
-
-    # If empty, return None for each field
+    result = get_query_api().query_data_frame(query)
     if result.empty:
-        return {f: None for f in FEATURES}
+        return []
 
-    # Drop metadata columns and calculate mean per feature
-    try:
-        means = result[FEATURES].mean(numeric_only=True).round(2).to_dict()
-        return means
-    except Exception as e:
-        print(f"[ERROR] Failed to compute means: {e}")
-        return {f: None for f in FEATURES}
-    
-@report_api.route("/reports/daily", methods=["GET"])
-def daily_report():
+    result = result.drop(columns=["result", "table"], errors="ignore").sort_values("_time")
+    result = result.round(2).astype(object).where(result.notna(), None)
+    return result.to_dict("records")
+
+def rollup_report(motorcycle_id, start, stop=None):
+    """Feature means (top level, as before) plus count/std/min/max per feature from the hourly rollups."""
+    summary = ROLLUPS.summary(motorcycle_id, start, stop)
+    report = {f: summary["features"][f]["mean"] for f in FEATURES}
+    report["stats"] = summary["features"]
+    report["hours"] = summary["hours"]
+    return report
+
+def cached_buckets(buckets):
+    """Bucket means from HISTORY_CACHE.read_frame (cached days bucketed locally, today's tail in Flux)."""
+    buckets = buckets[["_time"] + FEATURES].round(2)
+    return buckets.astype(object).where(buckets.notna(), None).to_dict("records")
+
+def build_report(start, stop=None):
     motorcycle_id = request.args.get("motorcycle_id", "unknown")
     if motorcycle_id == "unknown":
         return jsonify({"error": "Missing motorcycle_id"}), 400
-    report = query_aggregated_report("-24h", motorcycle_id)
-    return jsonify(report)
+    try:
+        resolution = parse_resolution(request.args.get("resolution"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def compute():
+        flux_start, flux_stop = flux_time(start), flux_time(stop) if stop is not None else "now()"
+        if REPORT_ROLLUPS:
+            report = rollup_report(motorcycle_id, start, stop)
+        else:
+            report = query_aggregated_report(flux_start, motorcycle_id, flux_stop)
+
+        if resolution:
+            # Finished days of the range are read from the local columnar cache when available
+            frame = HISTORY_CACHE.read_frame(motorcycle_id, start, stop, resolution)
+            if frame is not None:
+                report["buckets"] = cached_buckets(frame)
+            else:
+                report["buckets"] = query_bucketed_report(flux_start, motorcycle_id, resolution, flux_stop)
+        return report, 200
+
+    # Same report asked for by several tabs → one computation, then served from memory for the TTL
+    key = ("report", request.path, tuple(sorted(request.args.items())))
+    return RESPONSE_CACHE.respond(key, compute, REPORT_CACHE_TTL_S)
+
+def _ago(duration):
+    return pd.Timestamp.now(tz="UTC") - pd.Timedelta(duration)
+
+@report_api.route("/reports/daily", methods=["GET"])
+def daily_report():
+    return build_report(_ago("24h"))
 
 @report_api.route("/reports/weekly", methods=["GET"])
 def weekly_report():
-    motorcycle_id = request.args.get("motorcycle_id", "unknown")
-    if motorcycle_id == "unknown":
-        return jsonify({"error": "Missing motorcycle_id"}), 400
-    report = query_aggregated_report("-7d", motorcycle_id)
-    return jsonify(report)
+    return build_report(_ago("7d"))
+
+@report_api.route("/reports/monthly", methods=["GET"])
+def monthly_report():
+    return build_report(_ago("30d"))
+
+@report_api.route("/reports/range", methods=["GET"])
+def range_report():
+    """Custom range: ?start=<ISO time>[&stop=<ISO time>], UTC unless an offset is given."""
+    try:
+        start = pd.Timestamp(request.args.get("start", ""))
+        stop = pd.Timestamp(request.args["stop"]) if request.args.get("stop") else None
+    except ValueError:
+        return jsonify({"error": "start/stop must be ISO timestamps"}), 400
+    if pd.isna(start):
+        return jsonify({"error": "Missing start"}), 400
+    start = start.tz_localize("UTC") if start.tzinfo is None else start.tz_convert("UTC")
+    if stop is not None:
+        stop = stop.tz_localize("UTC") if stop.tzinfo is None else stop.tz_convert("UTC")
+        if stop <= start:
+            return jsonify({"error": "stop must be after start"}), 400
+    return build_report(start, stop)
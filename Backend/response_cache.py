@@ -0,0 +1,184 @@
+"""
+response_cache.py
+─────────────────
+Short-TTL result cache with single-flight request coalescing for the
+read endpoints (/predict, /recent-data, /reports/*).
+
+Several dashboard tabs open for the same bike ask for the same thing at the
+same moment. The first request for a key computes it; identical requests
+arriving meanwhile wait for that one result instead of running their own
+detect_anomalies / Flux query, and later ones within the TTL get the stored
+body. Only successful responses are stored; errors go to every waiter
+of that flight and are recomputed next time.
+
+Bodies are kept serialized, so a hit costs no JSON encoding, and each one
+carries an ETag (SHA-1 of the body) and Cache-Control max-age. A request
+whose If-None-Match matches gets 304 with no body.
+
+Bodies of RESPONSE_COMPRESS_MIN_BYTES or more are sent brotli- or
+gzip-compressed when the client accepts it (brotli needs the optional
+`brotli` package). The compressed bytes are kept with the entry, so each
+body is compressed once per TTL, not once per request.
+
+memo() caches a computed Python object the same way (single-flight, TTL)
+for endpoints that serve several responses (pages, formats) from one
+expensive result.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:         # optional: gzip only
+    brotli = None
+
+RESPONSE_CACHE_MAX = int(os.environ.get("RESPONSE_CACHE_MAX", "1024"))
+PREDICT_CACHE_TTL_S = float(os.environ.get("PREDICT_CACHE_TTL_S", "5"))
+RECENT_DATA_CACHE_TTL_S = float(os.environ.get("RECENT_DATA_CACHE_TTL_S", "2"))
+REPORT_CACHE_TTL_S = float(os.environ.get("REPORT_CACHE_TTL_S", "60"))
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()       # key → (body, status, etag, expires_at, {encoding: bytes})
+        self._flights = {}                  # key → _Flight in progress
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "not_modified": 0, "compressed": 0}
+
+    def get_or_compute(self, key, compute, ttl, serialize=True):
+        """
+        Return ((body, status, etag, expires_at, variants), outcome) for `key`,
+        where outcome is "hit", "miss" or "coalesced". `compute()` returns
+        (payload, status) and runs at most once per key at a time. With
+        serialize=False the payload object itself is stored as the body.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[3] > now:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry, "hit"
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.counters["misses"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry, "coalesced"
+
+        cacheable = False
+        try:
+            payload, status = compute()
+            # detect_anomalies reports failures as {"status": "error"} with HTTP 200
+            cacheable = status == 200 and ttl > 0 and not (
+                isinstance(payload, dict) and payload.get("status") == "error")
+            if serialize:
+                # Same encoder as jsonify, so cached bodies look exactly like uncached ones
+                body = (current_app.json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+                entry = (body, status, hashlib.sha1(body).hexdigest(), time.monotonic() + ttl, {})
+            else:
+                entry = (payload, status, None, time.monotonic() + ttl, None)
+            flight.entry = entry
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if cacheable:
+                    self._entries[key] = flight.entry
+                    self._entries.move_to_end(key)
+                    self._evict(time.monotonic())
+                del self._flights[key]
+            flight.done.set()
+        return entry, "miss"
+
+    def memo(self, key, compute, ttl):
+        """(payload, status) from `compute()`, shared by concurrent callers and kept for `ttl` on success."""
+        (payload, status, _, _, _), _ = self.get_or_compute(key, compute, ttl, serialize=False)
+        return payload, status
+
+    def respond(self, key, compute, ttl):
+        """Flask response for `key` with ETag / Cache-Control headers (304 on a matching If-None-Match)."""
+        (body, status, etag, expires_at, variants), outcome = self.get_or_compute(key, compute, ttl)
+        max_age = max(0, round(expires_at - time.monotonic())) if status == 200 else 0
+
+        encoding = None
+        if len(body) >= RESPONSE_COMPRESS_MIN_BYTES:
+            encoding = request.accept_encodings.best_match(ENCODINGS)
+        if encoding is not None:
+            compressed = variants.get(encoding)
+            if compressed is None:
+                # Racing threads may both compress; either result is fine to keep
+                compressed = variants[encoding] = compress(body, encoding)
+                with self._lock:
+                    self.counters["compressed"] += 1
+            body = compressed
+            etag = f"{etag}-{encoding}"     # a different representation needs its own strong ETag
+
+        if status == 200 and etag in request.if_none_match:
+            with self._lock:
+                self.counters["not_modified"] += 1
+            response = Response(status=304)
+        else:
+            response = Response(body, status=status, mimetype="application/json")
+            if encoding is not None:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = f"private, max-age={max_age}" if status == 200 else "no-store"
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["X-Cache"] = outcome.upper()
+        return response
+
+    def invalidate(self, prefix=()):
+        """Drop every entry whose key starts with `prefix` (everything by default)."""
+        n = len(prefix)
+        with self._lock:
+            for key in [k for k in self._entries if k[:n] == tuple(prefix)]:
+                del self._entries[key]
+
+    def _evict(self, now):
+        # Called with the lock held: expired entries first, then least recently used
+        if len(self._entries) <= self.max_entries:
+            return
+        for key in [k for k, e in self._entries.items() if e[3] <= now]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "size": len(self._entries), "in_flight": len(self._flights),
+                    "max_entries": self.max_entries, "encodings": ENCODINGS}
+
+
+# Process-wide instance shared by server.py and the report blueprint
+RESPONSE_CACHE = ResponseCache()
@@ -0,0 +1,112 @@
+"""
+response_format.py
+──────────────────
+Optional compact shapes for the large read responses (/recent-data rows and
+/predict row_anomalies):
+
+  "format": "columnar"   one array per column instead of one dict per row;
+                         times are epoch milliseconds, row statuses are an
+                         (n_rows × n_features) matrix of STATUS_* codes
+  "limit": N             at most N rows per response, plus "next_cursor"
+  "cursor": "<token>"    continue after the last row of the previous page
+
+Without these fields the responses are exactly what they always were.
+
+Cursors are opaque tokens holding the position of the last row returned
+(sample time in ms, plus row_index for row anomalies). Pages are cut by
+time rather than by offset, so a window that slid forward between two page
+requests neither repeats nor skips rows.
+"""
+
+import base64
+import os
+import numpy as np
+import pandas as pd
+
+PAGE_LIMIT_MAX = int(os.environ.get("PAGE_LIMIT_MAX", "10000"))
+FORMATS = ("records", "columnar")
+
+_EPOCH = pd.Timestamp(0, tz="UTC")
+
+
+def parse_page_args(body):
+    """(format, cursor, limit) from a request body; raises ValueError on bad values."""
+    fmt = body.get("format") or "records"
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    limit = body.get("limit")
+    if limit is not None:
+        limit = int(limit)
+        if not 1 <= limit <= PAGE_LIMIT_MAX:
+            raise ValueError(f"limit must be between 1 and {PAGE_LIMIT_MAX}")
+    cursor = decode_cursor(body["cursor"]) if body.get("cursor") else None
+    return fmt, cursor, limit
+
+
+def encode_cursor(time_ms, row_index=-1):
+    return base64.urlsafe_b64encode(f"{time_ms}:{row_index}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        time_ms, row_index = raw.split(":")
+        return int(time_ms), int(row_index)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def epoch_ms(times):
+    """Epoch milliseconds (int64) of a sequence of timestamps; missing times become -1."""
+    t = pd.to_datetime(pd.Series(times), utc=True)
+    ms = ((t - _EPOCH) // pd.Timedelta(milliseconds=1)).to_numpy(dtype=float, na_value=np.nan)
+    return np.where(np.isnan(ms), -1, ms).astype(np.int64)
+
+
+def _page(keys, cursor, limit):
+    # keys: (n, 2) int array of (time_ms, row_index), ascending → (start, stop, next_cursor)
+    start = 0
+    if cursor is not None:
+        after = (keys[:, 0] > cursor[0]) | ((keys[:, 0] == cursor[0]) & (keys[:, 1] > cursor[1]))
+        start = int(np.argmax(after)) if after.any() else len(keys)
+    stop = len(keys) if limit is None else min(len(keys), start + limit)
+    next_cursor = encode_cursor(*keys[stop - 1].tolist()) if stop < len(keys) else None
+    return start, stop, next_cursor
+
+
+# ───────────── /recent-data ─────────────
+def page_frame(df, cursor=None, limit=None):
+    """Rows of a `_time`-sorted frame after `cursor`, at most `limit` → (page, next_cursor)."""
+    if cursor is None and limit is None:
+        return df, None
+    ms = epoch_ms(df["_time"])
+    keys = np.column_stack([ms, np.full(len(ms), -1)])
+    start, stop, next_cursor = _page(keys, cursor, limit)
+    return df.iloc[start:stop], next_cursor
+
+
+def frame_columns(df):
+    """{"_time": [epoch ms], feature: [values]} for a cleaned recent-data frame."""
+    columns = {"_time": epoch_ms(df["_time"]).tolist()}
+    for col in df.columns:
+        if col != "_time":
+            columns[col] = df[col].tolist()
+    return columns
+
+
+# ───────────── /predict row_anomalies ─────────────
+def page_row_anomalies(rows, cursor=None, limit=None):
+    """Page a row_anomalies list (records) or dict (columnar) → (page, next_cursor)."""
+    if cursor is None and limit is None:
+        return rows, None
+    if isinstance(rows, dict):
+        keys = np.column_stack([np.asarray(rows["time"], dtype=np.int64),
+                                np.asarray(rows["row_index"], dtype=np.int64)]).reshape(-1, 2)
+        start, stop, next_cursor = _page(keys, cursor, limit)
+        page = {k: v[start:stop] for k, v in rows.items() if k in ("row_index", "time", "status")}
+        page["values"] = {f: v[start:stop] for f, v in rows["values"].items()}
+        return {**rows, **page}, next_cursor
+    keys = np.column_stack([epoch_ms([r["time"] for r in rows]),
+                            np.asarray([r["row_index"] for r in rows], dtype=np.int64)]).reshape(-1, 2)
+    start, stop, next_cursor = _page(keys, cursor, limit)
+    return rows[start:stop], next_cursor
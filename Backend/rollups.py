@@ -0,0 +1,275 @@
+"""
+rollups.py
+──────────
+Per-motorcycle, per-hour partial aggregates of FEATURES for the reports.
+
+Every UTC hour keeps count / sum / sum-of-squares / min / max per feature,
+so a report over any range (24 h, 7 d, 30 d, custom) combines at most a few
+hundred hour rows instead of scanning millions of raw points, and can return
+std, min and max as well as the mean.
+
+Where the numbers come from:
+  • finished hours: a Flux window(1h) |> reduce() query, run on first use
+    and then every ROLLUP_REFRESH_S for the last ROLLUP_LOOKBACK_HOURS
+    (late points from the batch writer's spool get picked up)
+  • the open hour: the MQTT stream (ingest()) while it has been unbroken
+    since the hour began, otherwise a one-hour Flux query at report time
+Ranges are aligned to whole hours.
+"""
+
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from influx_client import INFLUXDB_BUCKET, get_query_api
+from history_cache import flux_time
+from telemetry_codec import fresh_data
+from live_state import LIVE_STATE, remote
+
+FEATURES = [
+    "rpm",
+    "engine_load",
+    "throttle_pos",
+    "long_fuel_trim_1",
+    "coolant_temp",
+    "elm_voltage",
+]
+
+ROLLUP_REFRESH_S = int(os.environ.get("ROLLUP_REFRESH_S", "300"))
+ROLLUP_LOOKBACK_HOURS = int(os.environ.get("ROLLUP_LOOKBACK_HOURS", "2"))
+ROLLUP_BACKFILL_HOURS = int(os.environ.get("ROLLUP_BACKFILL_HOURS", str(7 * 24)))
+ROLLUP_RETENTION_DAYS = int(os.environ.get("ROLLUP_RETENTION_DAYS", "90"))
+# Same meaning as LIVE_WINDOW_MAX_GAP_S: a longer silence means samples may be missing
+ROLLUP_MAX_GAP_S = float(os.environ.get("ROLLUP_MAX_GAP_S", "30"))
+
+COUNT, SUM, SUMSQ, MIN, MAX = range(5)
+HOUR_S = 3600
+
+
+def _empty_bucket():
+    bucket = np.zeros((5, len(FEATURES)))
+    bucket[MIN], bucket[MAX] = np.inf, -np.inf
+    return bucket
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def combine(buckets):
+    """Fold (n, 5, n_features) hour buckets into {feature: {count, mean, std, min, max}}."""
+    out = {}
+    if len(buckets):
+        stacked = np.asarray(buckets)
+        count = stacked[:, COUNT].sum(axis=0)
+        total = stacked[:, SUM].sum(axis=0)
+        sumsq = stacked[:, SUMSQ].sum(axis=0)
+        lo, hi = stacked[:, MIN].min(axis=0), stacked[:, MAX].max(axis=0)
+    for i, f in enumerate(FEATURES):
+        n = int(count[i]) if len(buckets) else 0
+        if n == 0:
+            out[f] = {"count": 0, "mean": None, "std": None, "min": None, "max": None}
+            continue
+        mean = total[i] / n
+        var = max(sumsq[i] / n - mean * mean, 0.0)   # population variance; clip rounding below 0
+        out[f] = {"count": n, "mean": round(float(mean), 2), "std": round(float(np.sqrt(var)), 2),
+                  "min": round(float(lo[i]), 2), "max": round(float(hi[i]), 2)}
+    return out
+
+
+def query_hours(motorcycle_id, start, stop):
+    """{hour_epoch_s: bucket} for the whole hours in [start, stop), reduced inside InfluxDB."""
+    flux = f"""
+    from(bucket: "{INFLUXDB_BUCKET}")
+      |> range(start: {flux_time(start)}, stop: {flux_time(stop)})
+      |> filter(fn: (r) => r._measurement == "obd_data")
+      |> filter(fn: (r) => r.motorcycle_id == "{motorcycle_id}")
+      |> filter(fn: (r) => { " or ".join([f'r._field == "{f}"' for f in FEATURES]) })
+      |> map(fn: (r) => ({{r with _value: float(v: r._value)}}))
+      |> window(every: 1h)
+      |> reduce(
+          identity: {{count: 0, sum: 0.0, sumsq: 0.0, min: 0.0, max: 0.0}},
+          fn: (r, accumulator) => ({{
+            count: accumulator.count + 1,
+            sum: accumulator.sum + r._value,
+            sumsq: accumulator.sumsq + r._value * r._value,
+            min: if accumulator.count == 0 or r._value < accumulator.min then r._value else accumulator.min,
+            max: if accumulator.count == 0 or r._value > accumulator.max then r._value else accumulator.max
+          }}))
+      |> keep(columns: ["_start", "_field", "count", "sum", "sumsq", "min", "max"])
+    """
+    df = get_query_api().query_data_frame(flux)
+    if isinstance(df, list):
+        df = pd.concat(df, ignore_index=True) if df else pd.DataFrame()
+    hours = {}
+    if df.empty:
+        return hours
+    df = df[df["_field"].isin(FEATURES)]
+    starts = pd.to_datetime(df["_start"], utc=True).astype("int64") // 10**9 // HOUR_S * HOUR_S
+    columns = df[["count", "sum", "sumsq", "min", "max"]].to_numpy(dtype=np.float64)
+    for hour, field, values in zip(starts, df["_field"], columns):
+        bucket = hours.setdefault(int(hour), _empty_bucket())
+        bucket[:, FEATURES.index(field)] = values
+    return hours
+
+
+class HourlyRollups:
+    def __init__(self, lookback_hours=ROLLUP_LOOKBACK_HOURS, backfill_hours=ROLLUP_BACKFILL_HOURS,
+                 retention_days=ROLLUP_RETENTION_DAYS):
+        self.lookback_s = lookback_hours * HOUR_S
+        self.backfill_s = backfill_hours * HOUR_S
+        self.retention_s = retention_days * 86400
+        self._hours = {}            # motorcycle_id → {hour_epoch_s: (5, n_features) bucket}
+        self._covered_from = {}     # motorcycle_id → first hour loaded from InfluxDB
+        self._final_until = {}      # motorcycle_id → hours before this came from InfluxDB
+        self._stream_since = {}     # motorcycle_id → start of the unbroken MQTT feed
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._thread = None
+        self.counters = {"ingested": 0, "queries": 0, "hours_loaded": 0}
+
+    # ───────────── incremental updates ─────────────
+    def ingest(self, payload: dict, ts: float = None):
+        """Fold one MQTT payload into its hour bucket."""
+        motorcycle_id = payload.get("motorcycle_id")
+        if motorcycle_id is None:
+            return
+        motorcycle_id = str(motorcycle_id)
+        ts = time.time() if ts is None else ts
+        data = fresh_data(payload)          # held values of slow PIDs are not new readings
+        values = np.array([_to_float(data.get(f)) for f in FEATURES], dtype=np.float64)
+        present = ~np.isnan(values)
+        hour = int(ts) // HOUR_S * HOUR_S
+
+        with self._lock:
+            last = self._last_seen.get(motorcycle_id)
+            if last is None or ts - last > ROLLUP_MAX_GAP_S or motorcycle_id not in self._stream_since:
+                self._stream_since[motorcycle_id] = ts
+            self._last_seen[motorcycle_id] = ts
+            if hour < self._final_until.get(motorcycle_id, 0):
+                return          # hour already final from InfluxDB
+            bucket = self._hours.setdefault(motorcycle_id, {}).setdefault(hour, _empty_bucket())
+            v = values[present]
+            bucket[COUNT, present] += 1
+            bucket[SUM, present] += v
+            bucket[SUMSQ, present] += v * v
+            bucket[MIN, present] = np.minimum(bucket[MIN, present], v)
+            bucket[MAX, present] = np.maximum(bucket[MAX, present], v)
+            self.counters["ingested"] += 1
+
+    def mark_gap(self):
+        """MQTT disconnected: open hours can no longer be trusted to be complete."""
+        with self._lock:
+            self._stream_since.clear()
+
+    def _load(self, motorcycle_id, start_s, stop_s):
+        """Replace the buckets of whole hours [start_s, stop_s) with InfluxDB's numbers."""
+        if start_s >= stop_s:
+            return
+        hours = query_hours(motorcycle_id, pd.Timestamp(start_s, unit="s", tz="UTC"),
+                            pd.Timestamp(stop_s, unit="s", tz="UTC"))
+        with self._lock:
+            store = self._hours.setdefault(motorcycle_id, {})
+            for hour in [h for h in store if start_s <= h < stop_s]:
+                del store[hour]
+            store.update(hours)
+            self._covered_from[motorcycle_id] = min(self._covered_from.get(motorcycle_id, start_s), start_s)
+            self._final_until[motorcycle_id] = max(self._final_until.get(motorcycle_id, stop_s), stop_s)
+            self.counters["queries"] += 1
+            self.counters["hours_loaded"] += len(hours)
+
+    def ensure(self, motorcycle_id, start_s, now_s=None):
+        """Make sure every finished hour from start_s on is loaded and current."""
+        motorcycle_id = str(motorcycle_id)
+        hour_now = int(time.time() if now_s is None else now_s) // HOUR_S * HOUR_S
+        with self._lock:
+            lock = self._load_locks.setdefault(motorcycle_id, threading.Lock())
+        with lock:      # one loader per motorcycle; concurrent reports wait and reuse it
+            with self._lock:
+                covered = self._covered_from.get(motorcycle_id)
+                final = self._final_until.get(motorcycle_id)
+            if covered is None:
+                self._load(motorcycle_id, start_s, hour_now)
+                return
+            if start_s < covered:
+                self._load(motorcycle_id, start_s, covered)
+            if final < hour_now:
+                self._load(motorcycle_id, max(final - self.lookback_s, covered), hour_now)
+
+    def refresh(self):
+        """Periodic pass: re-aggregate the recent hours of every known motorcycle, drop old ones."""
+        now = time.time()
+        hour_now = int(now) // HOUR_S * HOUR_S
+        with self._lock:
+            motos = list(self._hours)
+        for motorcycle_id in motos:
+            try:
+                with self._lock:
+                    final = self._final_until.get(motorcycle_id)
+                    covered = self._covered_from.get(motorcycle_id)
+                    lock = self._load_locks.setdefault(motorcycle_id, threading.Lock())
+                with lock:
+                    if final is None:       # only seen on MQTT so far: backfill recent history
+                        self._load(motorcycle_id, hour_now - self.backfill_s, hour_now)
+                    else:
+                        self._load(motorcycle_id, max(final - self.lookback_s, covered), hour_now)
+            except Exception as e:
+                print(f"[Rollups] ⚠️ Refresh failed for motorcycle {motorcycle_id}: {e}")
+        cutoff = hour_now - self.retention_s
+        with self._lock:
+            for motorcycle_id, store in self._hours.items():
+                for hour in [h for h in store if h < cutoff]:
+                    del store[hour]
+                if self._covered_from.get(motorcycle_id, cutoff) < cutoff:
+                    self._covered_from[motorcycle_id] = cutoff
+
+    def start(self, interval_s=ROLLUP_REFRESH_S):
+        if self._thread is None:
+            def loop():
+                while True:
+                    time.sleep(interval_s)
+                    self.refresh()
+            self._thread = threading.Thread(target=loop, daemon=True, name="rollup-refresh")
+            self._thread.start()
+
+    # ───────────── reports ─────────────
+    def summary(self, motorcycle_id, start, stop=None):
+        """
+        {feature: {count, mean, std, min, max}} over the hours starting in
+        [start, stop); stop=None runs up to now, including the open hour.
+        """
+        motorcycle_id = str(motorcycle_id)
+        now = time.time()
+        start_s = int(pd.Timestamp(start).timestamp()) // HOUR_S * HOUR_S
+        stop_s = now if stop is None else pd.Timestamp(stop).timestamp()
+        hour_now = int(now) // HOUR_S * HOUR_S
+        self.ensure(motorcycle_id, start_s, now)
+
+        with self._lock:
+            store = self._hours.get(motorcycle_id, {})
+            buckets = [b.copy() for h, b in store.items() if start_s <= h < min(stop_s, hour_now)]
+            open_hour = store.get(hour_now)
+            streamed = self._stream_since.get(motorcycle_id, now) <= hour_now
+        hours = len(buckets)
+        if stop_s > hour_now:
+            if open_hour is not None and streamed:
+                buckets.append(open_hour.copy())
+            else:
+                buckets.extend(query_hours(motorcycle_id, pd.Timestamp(hour_now, unit="s", tz="UTC"),
+                                           pd.Timestamp(now, unit="s", tz="UTC")).values())
+            hours += 1
+        return {"hours": hours, "features": combine(buckets)}
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "motorcycles": len(self._hours),
+                    "hours": sum(len(s) for s in self._hours.values())}
+
+
+# Process-wide instance fed by the MQTT subscriber (ingest.py; remote in HTTP workers, see live_state.py)
+ROLLUPS = remote("rollups") if LIVE_STATE == "remote" else HourlyRollups()
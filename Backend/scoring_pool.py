@@ -0,0 +1,201 @@
+"""
+scoring_pool.py
+───────────────
+Runs detect_anomalies in a pool of worker processes, so concurrent /predict
+and /predict/batch calls score on separate cores instead of taking turns on
+the Flask process's GIL (window cleaning, scaling, the forest and the row
+classification are all CPU-bound).
+
+  • the calling thread still fetches the window (live buffer, history cache
+    or InfluxDB, all owned by this process) and copies it into a
+    SharedMemory block: row index and _time as int64, FEATURES as float64.
+    Only the block's name and the call's arguments are pickled
+  • every worker keeps its own anomaly_model.MODEL_REGISTRY, so models stay
+    loaded between calls; with MODEL_WARMUP=1 the initializer preloads them
+  • at most SCORING_MAX_PENDING calls queue or run at once (ScoringBusy
+    beyond that) and each waits at most SCORING_TIMEOUT_S (ScoringTimeout).
+    A call that times out keeps its slot and its SharedMemory block until
+    its worker actually finishes, so slow scoring cannot pile up unbounded
+  • a worker that dies breaks the pool; the next call starts a fresh one
+
+SCORING_WORKERS sets the pool size; 0 scores in the calling thread as
+before. The default is one worker per core for `python server.py` and 0
+behind wsgi.py, where every HTTP worker already is its own process.
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+import numpy as np
+import pandas as pd
+import anomaly_model
+from anomaly_model import FEATURES, MIN_ROWS, detect_anomalies
+from live_state import LIVE_STATE
+
+_CORES = os.cpu_count() or 1
+SCORING_WORKERS = int(os.environ.get("SCORING_WORKERS",
+                                     "0" if LIVE_STATE == "remote" or _CORES == 1 else str(_CORES)))
+SCORING_MAX_PENDING = int(os.environ.get("SCORING_MAX_PENDING", "32"))
+SCORING_TIMEOUT_S = float(os.environ.get("SCORING_TIMEOUT_S", "30"))
+
+
+class ScoringBusy(Exception):
+    pass
+
+
+class ScoringTimeout(Exception):
+    pass
+
+
+# ───────────── worker processes ─────────────
+def _init_worker(warm_up):
+    if warm_up:
+        anomaly_model.MODEL_REGISTRY.warm_up()
+
+
+def _score_shared(name, n, kwargs):
+    """detect_anomalies on the window in SharedMemory block `name` (see _write_window)."""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        ints = np.ndarray((2, n), dtype=np.int64, buffer=shm.buf)
+        values = np.ndarray((n, len(FEATURES)), dtype=np.float64, buffer=shm.buf, offset=ints.nbytes)
+        # Copies: the block is unlinked as soon as the caller has its answer
+        df = pd.DataFrame(values.copy(), columns=FEATURES, index=pd.Index(ints[0].copy()))
+        df.insert(0, "_time", pd.to_datetime(ints[1], utc=True))
+        del ints, values
+    finally:
+        shm.close()
+    return detect_anomalies(source=df, **kwargs)
+
+
+# ───────────── calling process ─────────────
+def _window_bytes(n):
+    return n * 8 * (2 + len(FEATURES))
+
+
+def _write_window(shm, df):
+    n = len(df)
+    ints = np.ndarray((2, n), dtype=np.int64, buffer=shm.buf)
+    values = np.ndarray((n, len(FEATURES)), dtype=np.float64, buffer=shm.buf, offset=ints.nbytes)
+    ints[0] = df.index.to_numpy(dtype=np.int64)
+    ints[1] = pd.to_datetime(df["_time"], utc=True).dt.as_unit("ns").array.asi8      # NaT → iNaT → NaT
+    values[:] = df[FEATURES].to_numpy(dtype=float)
+
+
+class ScoringPool:
+    def __init__(self, workers=SCORING_WORKERS, max_pending=SCORING_MAX_PENDING, timeout_s=SCORING_TIMEOUT_S,
+                 warm_up=False):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout_s = timeout_s
+        self.warm_up = warm_up
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.counters = {"pooled": 0, "in_thread": 0, "rejected": 0, "timeouts": 0, "restarts": 0}
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: this process runs the MQTT and Flask threads, which a fork would copy mid-flight
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"),
+                                                 initializer=_init_worker, initargs=(self.warm_up,))
+            return self._pool
+
+    def _discard(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self.counters["restarts"] += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def detect(self, motorcycle_id, brand, model, mode="idle", minutes=30, source=None, max_row_anomalies=None,
+               row_format="records"):
+        """detect_anomalies(...) on a worker process; same arguments and result."""
+        kwargs = {"motorcycle_id": motorcycle_id, "brand": brand, "model": model, "mode": mode,
+                  "minutes": minutes, "max_row_anomalies": max_row_anomalies, "row_format": row_format}
+        if self.workers <= 0:
+            return detect_anomalies(source=source, **kwargs)
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.counters["rejected"] += 1
+                raise ScoringBusy(f"{self._pending} predictions already pending, try again shortly")
+            self._pending += 1
+        release = True
+        try:
+            if source is None:
+                try:
+                    source = anomaly_model._get_window_df(motorcycle_id, minutes)
+                except Exception as e:
+                    print(f"[ERROR] detect_anomalies failed: {e}")
+                    return {"status": "error", "motorcycle_id": motorcycle_id, "error": str(e)}
+            # Chunk iterators, bare arrays and windows too short to load a model stay in this thread
+            if not isinstance(source, pd.DataFrame) or "_time" not in source or len(source) < MIN_ROWS:
+                with self._lock:
+                    self.counters["in_thread"] += 1
+                return detect_anomalies(source=source, **kwargs)
+            release = False  # _run_pooled owns the slot from here on
+            return self._run_pooled(source, kwargs)
+        finally:
+            if release:
+                self._release()
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _run_pooled(self, df, kwargs):
+        """Score `df` on the pool. Frees the call's pending slot and SharedMemory block once
+        the worker is done with them, which after a ScoringTimeout is later than this returns."""
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=_window_bytes(len(df)))
+        except BaseException:
+            self._release()
+            raise
+
+        def finish(_future=None):
+            shm.close()
+            shm.unlink()
+            self._release()
+
+        try:
+            _write_window(shm, df)
+            pool = self._get_pool()
+            future = pool.submit(_score_shared, shm.name, len(df), kwargs)
+        except BrokenProcessPool:
+            finish()
+            print("[Scoring] ⚠️ A scoring worker died; starting a new pool")
+            self._discard(pool)
+            raise
+        except BaseException:
+            finish()
+            raise
+        # Runs at once if the future is already done, else in the pool's management thread
+        future.add_done_callback(finish)
+
+        try:
+            result = future.result(timeout=self.timeout_s)
+        except FutureTimeout:
+            future.cancel()     # only succeeds while still queued; a running call keeps its slot
+            with self._lock:
+                self.counters["timeouts"] += 1
+            raise ScoringTimeout(f"Prediction took longer than {self.timeout_s:g}s")
+        except BrokenProcessPool:
+            print("[Scoring] ⚠️ A scoring worker died; starting a new pool")
+            self._discard(pool)
+            raise
+        with self._lock:
+            self.counters["pooled"] += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "workers": self.workers, "pending": self._pending,
+                    "max_pending": self.max_pending, "timeout_s": self.timeout_s, "running": self._pool is not None}
+
+
+# Process-wide instance used by server.py
+SCORING_POOL = ScoringPool(warm_up=os.environ.get("MODEL_WARMUP", "0") == "1")
@@ -1,19 +1,30 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-import paho.mqtt.client as mqtt
 import json
-import subprocess
 import os
-import threading
-import sys
-import psutil
+from concurrent.futures import ThreadPoolExecutor
 from anomaly_model import detect_anomalies
 import joblib
 
 
 # ====  ML & DB helpers  ====
 from anomaly_model   import detect_anomalies
-from influx_query    import get_recent_data   # <-- your cleaned‑data helper
+from influx_query    import get_recent_frame  # <-- your cleaned‑data helper
+from live_window     import LIVE_WINDOWS      # per-motorcycle ring buffers fed by MQTT
+from live_stream     import STREAM_BROKER     # SSE fan-out of MQTT messages
+from history_cache   import HISTORY_CACHE     # on-disk Arrow cache of finished days
+from rollups         import ROLLUPS           # hourly count/sum/sumsq/min/max for reports
+from response_cache  import RESPONSE_CACHE, PREDICT_CACHE_TTL_S, RECENT_DATA_CACHE_TTL_S
+from response_format import frame_columns, page_frame, page_row_anomalies, parse_page_args
+from training_jobs   import TRAINING_JOBS, QueueFull
+from csv_source      import CsvFormatError, iter_csv_chunks   # chunked /predict-from-csv parsing
+from influx_stream   import IngestStats
+from collector_supervisor import COLLECTORS, BudgetExceeded   # one obddata.py per motorcycle
+from online_detector import ALERT_BROKER, ONLINE_DETECTOR       # per-message range checks → pushed alerts
+from live_state      import LIVE_STATE                           # "remote": live state lives in ingest.py
+from ingest          import start_ingest
+from scoring_pool    import SCORING_POOL, ScoringBusy, ScoringTimeout   # detect_anomalies on worker processes
+import anomaly_model
 
 from report_api import report_api  # 👈 import your Blueprint
 
@@ -22,178 +33,290 @@ app = Flask(__name__)
 CORS(app)  # Allow CORS for frontend access
 app.register_blueprint(report_api)  # 👈 attach /reports/daily and /weekly routes
 
-# MQTT broker settings
-MQTT_BROKER = "broker.hivemq.com"
-MQTT_PORT = 1883
-MQTT_TOPIC = "obd/data"
+# MQTT ingest (ingest.py) runs in this process for `python server.py`. Behind wsgi.py
+# (LIVE_STATE=remote) the ingest process owns it and this worker only reads the shared state.
+# The scoring workers (scoring_pool.py) re-import this file as __mp_main__ and skip both steps
+if LIVE_STATE == "local" and __name__ != "__mp_main__":
+    start_ingest()
 
-# Store the latest OBD data
-latest_obd_data = {}
-obd_process = None  # Single instance tracking
+# Optionally preload every models/<brand>/idle_<id>.pkl so the first /predict is fast
+if os.environ.get("MODEL_WARMUP", "0") == "1" and __name__ != "__mp_main__":
+    anomaly_model.MODEL_REGISTRY.warm_up()
 
-# Kill any running obddata.py process when the server starts
-def kill_existing_obd_process():
-    for proc in psutil.process_iter(attrs=['pid', 'name', 'cmdline']):
-        try:
-            if proc.info['name'] == "python.exe" and proc.info['cmdline'] and any("obddata.py" in arg for arg in proc.info['cmdline']):
-                print(f"🔴 Killing existing `obddata.py` process (PID: {proc.pid})...")
-                proc.terminate()
-                proc.wait(timeout=5)
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-
-kill_existing_obd_process()
-
-# MQTT callback when a message is received
-def on_message(client, userdata, msg):
-    global latest_obd_data
-    try:
-        latest_obd_data = json.loads(msg.payload.decode("utf-8"))
-        # print(f"📡 MQTT Received: {latest_obd_data}")
-    except Exception as e:
-        print(f"❌ MQTT message decode error: {e}")
+@app.route("/models/stats", methods=["GET"])
+def model_stats():
+    return jsonify(anomaly_model.MODEL_REGISTRY.stats())
 
-# MQTT logging
-def on_log(client, userdata, level, buf):
-    print(f"[MQTT LOG] {buf}")
+@app.route("/scoring/stats", methods=["GET"])
+def scoring_stats():
+    return jsonify(SCORING_POOL.stats())
 
-# Start MQTT client in a background thread
-def start_mqtt():
-    client = mqtt.Client()
-    client.on_message = on_message
-    client.on_log = on_log
-    client.connect(MQTT_BROKER, MQTT_PORT, 60)
-    client.subscribe(MQTT_TOPIC)
-    client.loop_forever()
+@app.route("/history-cache/stats", methods=["GET"])
+def history_cache_stats():
+    return jsonify(HISTORY_CACHE.stats())
 
-mqtt_thread = threading.Thread(target=start_mqtt, daemon=True)
-mqtt_thread.start()
+@app.route("/response-cache/stats", methods=["GET"])
+def response_cache_stats():
+    return jsonify(RESPONSE_CACHE.stats())
 
-# Function to stream subprocess output
-def stream_output(pipe, name):
-    for line in iter(pipe.readline, ''):  # '' is the sentinel for end of stream
-        print(f"[{name}] {line.rstrip()}")
+@app.route("/reports/rollups/stats", methods=["GET"])
+def rollup_stats():
+    return jsonify(ROLLUPS.stats())
 
+# ------------------------------------------------------------
+#  🏍️  OBD collectors, one obddata.py per motorcycle (collector_supervisor.py)
+#      POST /start-obd {"motorcycle_id": 4, "port": "COM3", "simulate": false}
+#      GET  /stop-obd?motorcycle_id=4   (no id → stop all)
+#      GET  /collectors[?motorcycle_id=4]
+# ------------------------------------------------------------
 @app.route("/start-obd", methods=["POST"])
 def start_obd():
-    global obd_process
-
-    if obd_process and obd_process.poll() is None:
-        return jsonify({"message": "OBD data collection already running", "pid": obd_process.pid}), 200
-
-    # Read motorcycle_id from JSON
     data = request.get_json() or {}
-    motorcycle_id = data.get("motorcycle_id")
-
-    print(f"🟢 Starting OBD data collection for motorcycle_id={motorcycle_id}")
+    motorcycle_id = data.get("motorcycle_id") or "unknown"
+    if data.get("brand") and data.get("model"):
+        ONLINE_DETECTOR.register(motorcycle_id, data["brand"], data["model"])
 
     try:
-        # Start subprocess
-        args = [sys.executable, "obddata.py"]
-        if motorcycle_id:
-            args.append(str(motorcycle_id))
-
-        obd_process = subprocess.Popen(
-            args,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True  # Ensures stdout/stderr are text, not bytes
-        )
-
-        # Stream output asynchronously
-        threading.Thread(target=stream_output, args=(obd_process.stdout, "STDOUT"), daemon=True).start()
-        threading.Thread(target=stream_output, args=(obd_process.stderr, "STDERR"), daemon=True).start()
-
-        return jsonify({"message": "OBD data collection started", "pid": obd_process.pid}), 200
-
+        collector, created = COLLECTORS.start(motorcycle_id, port=data.get("port"),
+                                              simulate=bool(data.get("simulate")))
+    except BudgetExceeded as e:
+        return jsonify({"error": str(e), "collectors": COLLECTORS.status()["collectors"]}), 429
     except Exception as e:
         return jsonify({"error": f"Failed to start obddata.py: {e}"}), 500
 
+    pid = collector.pid
+    if not created:
+        return jsonify({"message": "OBD data collection already running",
+                        "motorcycle_id": collector.motorcycle_id, "pid": pid}), 200
+    ONLINE_DETECTOR.reset(motorcycle_id)    # new session: fresh running statistics
+    return jsonify({"message": "OBD data collection started",
+                    "motorcycle_id": collector.motorcycle_id, "pid": pid}), 200
+
 @app.route("/stop-obd", methods=["GET"])
 def stop_obd():
-    global obd_process
-
-    if obd_process and obd_process.poll() is None:
-        print(f"🛑 Stopping OBD process (PID: {obd_process.pid})...")
-        obd_process.terminate()
-        try:
-            obd_process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            obd_process.kill()
-        obd_process = None
-        return jsonify({"message": "OBD data collection stopped"}), 200
-
+    motorcycle_id = request.args.get("motorcycle_id")
+    if motorcycle_id:
+        stopped = [c for c in [COLLECTORS.stop(motorcycle_id)] if c is not None]
+    else:
+        stopped = COLLECTORS.stop_all()
+
+    if stopped:
+        return jsonify({"message": "OBD data collection stopped",
+                        "motorcycle_ids": [c.motorcycle_id for c in stopped]}), 200
     return jsonify({"message": "No running OBD data collection process"}), 200
 
+@app.route("/collectors", methods=["GET"])
+def collectors():
+    motorcycle_id = request.args.get("motorcycle_id")
+    if motorcycle_id:
+        collector = COLLECTORS.get(motorcycle_id)
+        if collector is None:
+            return jsonify({"error": f"No collector for motorcycle_id={motorcycle_id}"}), 404
+        return jsonify(collector.to_dict(with_output=True))
+    return jsonify(COLLECTORS.status())
+
 @app.route("/obd-data", methods=["GET"])
 def get_obd_data():
-    return jsonify(latest_obd_data)
+    return jsonify(STREAM_BROKER.latest())
+
 # ------------------------------------------------------------
-#  this will save the Model of your current motorcycle
+#  📡  Server-Sent Events stream of live OBD data (replaces polling /obd-data)
+#      GET /obd-stream?motorcycle_id=4&max_hz=2
 # ------------------------------------------------------------
+SSE_HEARTBEAT_S = 15      # keeps proxies from closing idle streams
+SSE_MAX_QUEUE   = 50      # per-subscriber backlog; oldest messages dropped beyond this
 
-@app.route('/train_model', methods=['POST'])
-def train_model():
+@app.route("/obd-stream", methods=["GET"])
+def obd_stream():
+    motorcycle_id = request.args.get("motorcycle_id")
     try:
-        data = request.get_json()
-        motorcycle_id = data.get("motorcycle_id")
-        brand = data.get("brand")
+        max_hz = float(request.args["max_hz"]) if request.args.get("max_hz") else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "max_hz must be a number"}), 400
 
-        if not motorcycle_id or not brand:
-            return jsonify({"status": "error", "message": "Missing motorcycle_id or brand"}), 400
+    sub = STREAM_BROKER.subscribe(motorcycle_id, max_queue=SSE_MAX_QUEUE, max_hz=max_hz)
+    return _sse_response(sub)
 
-        # Normalize brand folder name
-        brand_folder = brand.strip().replace(" ", "_").lower()
+def _sse_response(sub, initial=()):
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            for payload in initial:
+                yield f"data: {json.dumps(payload)}\n\n"
+            while True:
+                payload = sub.get(timeout=SSE_HEARTBEAT_S)
+                if payload is None:
+                    yield ": heartbeat\n\n"
+                else:
+                    yield f"data: {json.dumps(payload)}\n\n"
+        finally:
+            sub.close()
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-        # Use Python interpreter from current environment
-        python_exe = sys.executable
+@app.route("/obd-stream/stats", methods=["GET"])
+def obd_stream_stats():
+    return jsonify({"subscribers": STREAM_BROKER.stats()})
 
-        # Construct the command
-        cmd = [
-            python_exe,
-            "train_idle_model.py",
-            "--motorcycle_id", str(motorcycle_id),
-            "--brand", brand_folder,
-            "--minutes", "43200"
-        ]
+# ------------------------------------------------------------
+#  🚨  Alerts from the online detector (online_detector.py)
+#      GET /alerts-stream?motorcycle_id=4&brand=Yamaha&model=NMAX%20155   (SSE)
+#      GET /alerts?motorcycle_id=4                                       (active + recent + state)
+# ------------------------------------------------------------
+@app.route("/alerts-stream", methods=["GET"])
+def alerts_stream():
+    motorcycle_id = request.args.get("motorcycle_id")
+    if motorcycle_id and request.args.get("brand") and request.args.get("model"):
+        ONLINE_DETECTOR.register(motorcycle_id, request.args["brand"], request.args["model"])
+
+    sub = ALERT_BROKER.subscribe(motorcycle_id, max_queue=SSE_MAX_QUEUE)
+    # Alerts already active are sent first, so a page opened mid-incident shows them too
+    return _sse_response(sub, initial=ONLINE_DETECTOR.active_alerts(motorcycle_id))
+
+@app.route("/alerts", methods=["GET"])
+def alerts():
+    motorcycle_id = request.args.get("motorcycle_id")
+    return jsonify({
+        "active": ONLINE_DETECTOR.active_alerts(motorcycle_id),
+        "events": ONLINE_DETECTOR.recent_events(motorcycle_id, request.args.get("limit", 50, type=int)),
+        "state": ONLINE_DETECTOR.state(motorcycle_id) if motorcycle_id else None,
+        "stats": ONLINE_DETECTOR.stats(),
+    })
+# ------------------------------------------------------------
+#  this will save the Model of your current motorcycle
+# ------------------------------------------------------------
 
-        print(f"[DEBUG] Running command: {' '.join(cmd)}")
+TRAIN_MINUTES = 43200           # 30 days of history per training run
 
-        # Run the command and capture output
-        result = subprocess.run(cmd, capture_output=True, text=True)
+def _positive_minutes(value):
+    """`minutes` of a training or prediction request as a positive int (ValueError otherwise)."""
+    try:
+        minutes = int(value)
+    except (TypeError, ValueError):
+        minutes = 0
+    if minutes <= 0 or isinstance(value, bool):
+        raise ValueError(f"minutes must be a positive integer, not {value!r}")
+    return minutes
+
+def _on_training_success(job):
+    # The registry also notices the new mtime; dropping the entry frees the old model now
+    anomaly_model.MODEL_REGISTRY.invalidate(job.brand, job.motorcycle_id)
+    RESPONSE_CACHE.invalidate(("predict", job.motorcycle_id))
+
+# Remote jobs finish in the ingest process; workers' registries pick the new .pkl up by mtime
+if LIVE_STATE == "local":
+    TRAINING_JOBS.on_success = _on_training_success
 
-        print("[DEBUG] STDOUT:", result.stdout)
-        print("[DEBUG] STDERR:", result.stderr)
+@app.route('/train_model', methods=['POST'])
+def train_model():
+    try:
+        data = request.get_json() or {}
+        motorcycle_id = data.get("motorcycle_id")
+        brand = data.get("brand")
 
-        if result.returncode != 0:
-            return jsonify({
-                "status": "error",
-                "message": result.stderr or "Training script failed"
-            }), 500
+        if not motorcycle_id or not brand:
+            return jsonify({"status": "error", "message": "Missing motorcycle_id or brand"}), 400
+        try:
+            minutes = _positive_minutes(data.get("minutes", TRAIN_MINUTES))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
 
+        job, created = TRAINING_JOBS.submit(motorcycle_id, brand, minutes)
         return jsonify({
-            "status": "success",
-            "message": result.stdout or "Model trained successfully"
-        })
+            "status": "queued" if created else "already_queued",
+            "message": "Training job queued" if created else "Training already in progress for this motorcycle",
+            "job": job.to_dict()
+        }), 202
 
+    except QueueFull as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
     except Exception as e:
         print("[TRAIN_MODEL ERROR]", str(e))
         return jsonify({"status": "error", "message": str(e)}), 500
+
+# Queue training for many motorcycles at once: {"motorcycles": [{"motorcycle_id", "brand"}, ...]}
+@app.route('/train_model/batch', methods=['POST'])
+def train_model_batch():
+    data = request.get_json() or {}
+    motorcycles = data.get("motorcycles")
+    if not isinstance(motorcycles, list) or not motorcycles:
+        return jsonify({"status": "error", "message": "motorcycles must be a non-empty list"}), 400
+    if not all(isinstance(m, dict) for m in motorcycles):
+        return jsonify({"status": "error", "message": "every motorcycles entry must be an object"}), 400
+    try:
+        minutes = _positive_minutes(data.get("minutes", TRAIN_MINUTES))
+        motorcycles = [{**m, "minutes": _positive_minutes(m["minutes"])} if "minutes" in m else m
+                       for m in motorcycles]
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    jobs = TRAINING_JOBS.submit_many(motorcycles, minutes)
+    return jsonify({"status": "queued", "jobs": jobs}), 202
+
+@app.route('/train_model/jobs', methods=['GET'])
+def list_training_jobs():
+    motorcycle_id = request.args.get("motorcycle_id")
+    jobs = [j.to_dict() for j in TRAINING_JOBS.list()
+            if motorcycle_id is None or j.motorcycle_id == str(motorcycle_id)]
+    return jsonify({"status": "ok", "jobs": jobs})
+
+@app.route('/train_model/jobs/<job_id>', methods=['GET'])
+def get_training_job(job_id):
+    job = TRAINING_JOBS.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Unknown job {job_id}"}), 404
+    return jsonify({"status": "ok", "job": job.to_dict(with_output=True)})
+
+@app.route('/train_model/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_training_job(job_id):
+    job = TRAINING_JOBS.cancel(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Unknown job {job_id}"}), 404
+    return jsonify({"status": "ok", "job": job.to_dict()})
 # ------------------------------------------------------------
 #  🔄  NEW: Recent‑data endpoint  (table on the frontend)
+#      optional "format": "columnar", "limit", "cursor" (response_format.py)
 # ------------------------------------------------------------
 @app.route("/recent-data", methods=["POST"])
 def recent_data():
     body          = request.get_json(force=True) or {}
     motorcycle_id = body.get("motorcycle_id")
     minutes       = int(body.get("minutes", 30))
+    resolution    = body.get("resolution")    # optional bucket size: "1s", "1m", "1h"
     if not motorcycle_id:
         return jsonify({"status":"error","error_message":"motorcycle_id is required"}), 400
     try:
-        rows = get_recent_data(motorcycle_id, minutes)
-        return jsonify({"status":"ok","rows":rows}), 200
-    except Exception as exc:
-        return jsonify({"status":"error","error_message":str(exc)}), 500
+        fmt, cursor, limit = parse_page_args(body)
+    except ValueError as exc:
+        return jsonify({"status":"error","error_message":str(exc)}), 400
+
+    def fetch():
+        try:
+            return get_recent_frame(motorcycle_id, minutes, resolution), 200
+        except ValueError as exc:
+            return {"status":"error","error_message":str(exc)}, 400
+        except Exception as exc:
+            return {"status":"error","error_message":str(exc)}, 500
+
+    def compute():
+        # Every page / format of one window is cut from the same fetched frame
+        df, status = RESPONSE_CACHE.memo(("recent-data", str(motorcycle_id), minutes, resolution),
+                                         fetch, RECENT_DATA_CACHE_TTL_S)
+        if status != 200:
+            return df, status
+        page, next_cursor = page_frame(df, cursor, limit) if not df.empty else (df, None)
+        if fmt == "columnar":
+            payload = {"status":"ok","format":"columnar","count":len(page),
+                       "columns":frame_columns(page) if not page.empty else {}}
+        else:
+            payload = {"status":"ok","rows":page.to_dict("records") if not page.empty else []}
+        if limit is not None:
+            payload["next_cursor"] = next_cursor
+        return payload, 200
+
+    # Identical concurrent requests share one query; repeats within the TTL are served from memory
+    key = ("recent-data", str(motorcycle_id), minutes, resolution, fmt, cursor, limit)
+    return RESPONSE_CACHE.respond(key, compute, RECENT_DATA_CACHE_TTL_S)
 # -----------------------------------------------------------
 # ------------------------------------------------------------
 #  🔮  ML /predict endpoint  (anomaly suggestion)
@@ -206,80 +329,167 @@ def predict():
 
     if not motorcycle_id or not brand or not model:
         return jsonify({"status": "error", "message": "Missing motorcycle_id, brand, or model"}), 400
+    try:
+        fmt, cursor, limit = parse_page_args(data)    # optional columnar rows / pagination
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
     brand_folder = brand.strip().replace(" ", "_").lower()
     model_name   = model.strip().replace(" ", "_").lower()
+    ONLINE_DETECTOR.register(motorcycle_id, brand_folder, model_name)
 
     model_path = os.path.join("models", brand_folder, f"idle_{motorcycle_id}.pkl")
 
-    if not os.path.exists(model_path):
+    # Bikes without their own model are scored by the shared brand/model one (model_registry.py)
+    if not anomaly_model.MODEL_REGISTRY.has_model(brand_folder, motorcycle_id, "idle", model_name):
         return jsonify({
             "status": "error",
             "message": f"Model not found for motorcycle_id {motorcycle_id} → {model_path}"
         }), 404
 
+    def run():
+        try:
+            result = SCORING_POOL.detect(
+                motorcycle_id=motorcycle_id,
+                brand=brand_folder,
+                model=model_name,  # ✅ passed to anomaly_model
+                mode="idle",
+                minutes=30,
+                row_format=fmt
+            )
+            return result, 200
+        except ScoringBusy as e:
+            return {"status": "error", "message": str(e)}, 503
+        except ScoringTimeout as e:
+            return {"status": "error", "message": str(e)}, 504
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"Prediction failed: {str(e)}"
+            }, 500
+
+    def compute():
+        if cursor is None and limit is None:
+            return run()
+        # Pages of row_anomalies are cut from one detect_anomalies result per TTL
+        result, status = RESPONSE_CACHE.memo(
+            ("predict", motorcycle_id, brand_folder, model_name, "idle", 30, fmt), run, PREDICT_CACHE_TTL_S)
+        if status != 200 or "row_anomalies" not in result:
+            return result, status
+        rows, next_cursor = page_row_anomalies(result["row_anomalies"], cursor, limit)
+        return {**result, "row_anomalies": rows, "next_cursor": next_cursor}, 200
+
+    # Tabs polling the same bike share one detect_anomalies run per TTL
+    key = ("predict", motorcycle_id, brand_folder, model_name, "idle", 30, fmt, cursor, limit)
+    return RESPONSE_CACHE.respond(key, compute, PREDICT_CACHE_TTL_S)
+
+# ------------------------------------------------------------
+#  🚦  Fleet /predict/batch: one InfluxDB round-trip for N motorcycles
+#      {"motorcycles": [{"motorcycle_id", "brand", "model"}, ...], "minutes": 30}
+# ------------------------------------------------------------
+PREDICT_BATCH_MAX     = 100
+PREDICT_BATCH_WORKERS = max(8, SCORING_POOL.workers)     # threads only wait on the scoring pool
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    data = request.get_json() or {}
+    motorcycles = data.get("motorcycles")
+    if not isinstance(motorcycles, list) or not motorcycles:
+        return jsonify({"status": "error", "message": "motorcycles must be a non-empty list"}), 400
+    if len(motorcycles) > PREDICT_BATCH_MAX:
+        return jsonify({"status": "error", "message": f"At most {PREDICT_BATCH_MAX} motorcycles per batch"}), 400
+    if not all(isinstance(m, dict) for m in motorcycles):
+        return jsonify({"status": "error", "message": "every motorcycles entry must be an object"}), 400
+    if not all(isinstance(m.get(k), (str, type(None))) for m in motorcycles for k in ("brand", "model")):
+        return jsonify({"status": "error", "message": "brand and model must be strings"}), 400
     try:
-        result = detect_anomalies(
-            motorcycle_id=motorcycle_id,
-            brand=brand_folder,
-            model=model_name,  # ✅ passed to anomaly_model
-            mode="idle",
-            minutes=30
-        )
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({
-            "status": "error",
-            "message": f"Prediction failed: {str(e)}"
-        }), 500
+        minutes = _positive_minutes(data.get("minutes", 30))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    results, errors, jobs = {}, {}, {}
+    for m in motorcycles:
+        motorcycle_id = str(m.get("motorcycle_id") or "")
+        brand, model = m.get("brand"), m.get("model")
+        if not motorcycle_id or not brand or not model:
+            errors[motorcycle_id or "?"] = "Missing motorcycle_id, brand, or model"
+            continue
+        brand_folder = brand.strip().replace(" ", "_").lower()
+        model_name   = model.strip().replace(" ", "_").lower()
+        model_path = os.path.join("models", brand_folder, f"idle_{motorcycle_id}.pkl")
+        if not anomaly_model.MODEL_REGISTRY.has_model(brand_folder, motorcycle_id, "idle", model_name):
+            errors[motorcycle_id] = f"Model not found for motorcycle_id {motorcycle_id} → {model_path}"
+            continue
+        jobs[motorcycle_id] = (brand_folder, model_name)
+
+    if jobs:
+        try:
+            windows = anomaly_model._get_window_dfs(list(jobs), minutes)
+        except Exception as e:
+            return jsonify({"status": "error", "message": f"Batch query failed: {e}", "errors": errors}), 500
+
+        with ThreadPoolExecutor(max_workers=min(PREDICT_BATCH_WORKERS, len(jobs))) as pool:
+            futures = {
+                pool.submit(SCORING_POOL.detect, motorcycle_id=moto_id, brand=b, model=mdl,
+                            mode="idle", minutes=minutes, source=windows[moto_id]): moto_id
+                for moto_id, (b, mdl) in jobs.items()
+            }
+            for future, moto_id in futures.items():
+                try:
+                    result = future.result()
+                except (ScoringBusy, ScoringTimeout) as e:
+                    errors[moto_id] = str(e)
+                    continue
+                if result.get("status") == "error":
+                    errors[moto_id] = result.get("error", "Prediction failed")
+                else:
+                    results[moto_id] = result
+
+    status = "ok" if not errors else ("partial" if results else "error")
+    return jsonify({"status": status, "results": results, "errors": errors})
 
 # ----------------------------------this is the CSV routes for manual upload-------------------------
+# Workshop logs are scored chunk by chunk (csv_source.py); at most this many flagged rows are returned in full
+CSV_MAX_ROW_ANOMALIES = int(os.environ.get("CSV_MAX_ROW_ANOMALIES", "1000"))
+
 @app.route('/predict-from-csv', methods=['POST'])
 def predict_from_csv():
     try:
-        file = request.files["file"]
+        file = request.files.get("file")
+        if not file:
+            return jsonify({"status": "error", "message": "No file provided"}), 400
         brand = request.form["brand"]
         model = request.form["model"]
         motorcycle_id = request.form["motorcycle_id"]
 
-        if not file:
-            return jsonify({"status": "error", "message": "No file provided"}), 400
-
-        import pandas as pd
-        import numpy as np
-        import anomaly_model
-        from anomaly_model import detect_anomalies, FEATURES
-
-        df = pd.read_csv(file)
-
-        # Optional: clean bad rows
-        df = df.replace(0, np.nan).dropna()
-        for col in FEATURES:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
+        stats = IngestStats()
+        format_errors = []
 
-        df["_time"] = pd.Timestamp.now()  # dummy time column
+        def chunks():
+            try:
+                yield from iter_csv_chunks(file.stream, stats=stats)
+            except CsvFormatError as e:
+                format_errors.append(e)
+                raise
 
-        # Monkey patch only for this request
-        original_get_window_df = anomaly_model._get_window_df  # save original
-
-        def patched_get_window_df(*_, **__):
-            return df
-
-        anomaly_model._get_window_df = patched_get_window_df
-
-        try:
-            result = detect_anomalies(
-                motorcycle_id=motorcycle_id,
-                brand=brand,
-                model=model,
-                mode="idle",
-                minutes=30
-            )
-        finally:
-            anomaly_model._get_window_df = original_get_window_df  # restore original
+        result = detect_anomalies(
+            motorcycle_id=motorcycle_id,
+            brand=brand,
+            model=model,
+            mode="idle",
+            source=chunks(),
+            max_row_anomalies=CSV_MAX_ROW_ANOMALIES,
+        )
+        if format_errors:
+            return jsonify({"status": "error", "message": str(format_errors[0])}), 400
 
+        print(f"[CSV] {stats.summary()}")
+        result["csv_rows"] = stats.raw_rows
+        result["csv_rows_used"] = stats.rows
         return jsonify(result)
 
+    except KeyError as e:
+        return jsonify({"status": "error", "message": f"Missing form field {e}"}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -6,8 +6,18 @@ for a SINGLE motorcycle and save it to:
 
     models/<brand>/idle_<motorcycle_id>.pkl
 
+Next to it, models/<brand>/idle_<motorcycle_id>.state.pkl keeps the
+sufficient statistics of everything trained on so far: the running
+mean/variance of the scaler and a reservoir of aggregated window vectors.
+With --incremental only the data since the last run is pulled and folded in,
+so retraining cost depends on new data, not on history length.
+
+History is read in time slices (influx_stream.py) and folded in chunk by
+chunk, so peak memory stays flat however many days are trained on.
+
 Example:
     python train_idle_model.py --motorcycle_id 4 --brand "Yamaha_NMAX" --minutes 720
+    python train_idle_model.py --motorcycle_id 4 --brand "Yamaha_NMAX" --incremental
 """
 
 import argparse
@@ -17,7 +27,8 @@ import numpy as np
 import pandas as pd
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
-from influxdb_client import InfluxDBClient
+from influx_stream import IngestStats, iter_feature_chunks
+from window_features import WINDOW_ROWS, WINDOW_STEP, WindowAggregator, reservoir_update, scale_aggregates
 
 
 # ────────────────────────────────────────────────────────────
@@ -27,7 +38,9 @@ parser = argparse.ArgumentParser(description="Train idle anomaly model")
 parser.add_argument("--motorcycle_id", required=True, help="e.g. 4 or moto_004")
 parser.add_argument("--brand",          required=True, help="e.g. Yamaha_NMAX")
 parser.add_argument("--minutes", type=int, default=60*24,
-                    help="How far back to pull data (default 1 day)")
+                    help="How far back to pull data (default 1 day)")
+parser.add_argument("--incremental", action="store_true",
+                    help="Fold in only data since the last run (falls back to --minutes without saved state)")
 args = parser.parse_args()
 
 MOTO_ID = str(args.motorcycle_id)
@@ -35,19 +48,14 @@ BRAND   = args.brand.strip().replace(" ", "_").lower()
 MODE    = "idle"
 MINUTES = args.minutes
 
-# ────────────────────────────────────────────────────────────
-# 2) InfluxDB connection (edit if needed)
-# ────────────────────────────────────────────────────────────
-INFLUXDB_URL    = "http://localhost:8086"
-INFLUXDB_TOKEN  = "rLaEXQUWJ2R71NQIEFVfhw18L9xC4knKBf7bPAymrJtz6nukc5NIfPPdoc2dlk0c8n_gGm6kiwi7aDAl-uCmWA=="
-INFLUXDB_ORG    = "MotorcycleMaintenance"
-INFLUXDB_BUCKET = "MotorcycleOBDData"
+RESERVOIR_SIZE = 5000    # max window vectors kept between incremental runs
 
-client    = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
-query_api = client.query_api()
+out_dir    = os.path.join("models", BRAND)
+out_path   = os.path.join(out_dir, f"{MODE}_{MOTO_ID}.pkl")
+state_path = os.path.join(out_dir, f"{MODE}_{MOTO_ID}.state.pkl")
 
 # ────────────────────────────────────────────────────────────
-# 3) Pull & clean idle data
+# 2) Sufficient statistics from earlier runs (--incremental)
 # ────────────────────────────────────────────────────────────
 FEATURES = [
     "rpm",
@@ -58,70 +66,106 @@ FEATURES = [
     "elm_voltage",
 ]
 
-flux = f"""
-from(bucket: "{INFLUXDB_BUCKET}")
-  |> range(start: -{MINUTES}m)
-  |> filter(fn: (r) => r._measurement == "obd_data")
-  |> filter(fn: (r) => r.motorcycle_id == "{MOTO_ID}")
-  |> filter(fn: (r) =>
-      r._field == "rpm" or
-      r._field == "engine_load" or
-      r._field == "throttle_pos" or
-      r._field == "long_fuel_trim_1" or
-      r._field == "coolant_temp"  or
-      r._field == "elm_voltage")
-  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
-  |> keep(columns: ["_time", "rpm", "engine_load", "throttle_pos", "long_fuel_trim_1", "coolant_temp", "elm_voltage"])
-"""
-
-df = query_api.query_data_frame(flux)
-client.close()
-
-if df.empty or len(df) < 60:          # at least one minute of ~1 Hz data
-    raise RuntimeError("Not enough idle data to train a model!")
-
-df = df.drop(columns=["result", "table"], errors="ignore")
-df = df.dropna().sort_values("_time").reset_index(drop=True)
+state = None
+if args.incremental and os.path.exists(state_path):
+    state = joblib.load(state_path)
+    if (state.get("window_rows"), state.get("window_step")) != (WINDOW_ROWS, WINDOW_STEP):
+        print("[WARN] Saved state used different window settings; retraining from scratch")
+        state = None
+
+if state is not None:
+    # Exclusive start: 1 µs after the last row already folded in
+    start = state["last_time"] + pd.Timedelta(microseconds=1)
+    print(f"Incremental run: folding in data since {state['last_time']}")
+else:
+    start = pd.Timestamp.now(tz="UTC") - pd.Timedelta(minutes=MINUTES)
+    state = {
+        "scaler": StandardScaler(),
+        "reservoir": np.empty((0, 4 * len(FEATURES))),
+        "seen": 0,
+        "last_time": None,
+        "window_rows": WINDOW_ROWS,
+        "window_step": WINDOW_STEP,
+        # Carries the rows of the next incomplete window into the following run
+        "aggregator": WindowAggregator(WINDOW_ROWS, WINDOW_STEP),
+        "rng": np.random.default_rng(42).bit_generator.state,
+    }
+incremental = state["last_time"] is not None
+
+
+def warm_idle(chunk):
+    # ✅ Filter by coolant temperature
+    return chunk[(chunk["coolant_temp"] >= 70) & (chunk["coolant_temp"] <= 105)]
+
+def report_slice(done, total):
+    print(f"[PROGRESS] {10 + int(60 * done / total)} reading InfluxDB ({done}/{total} slices)", flush=True)
 
-# ✅ Filter by coolant temperature
-df = df[(df["coolant_temp"] >= 70) & (df["coolant_temp"] <= 105)]
-print(f"Filtered to {len(df)} rows where coolant_temp is between 70–105°C")
-
-if df.empty or len(df) < 60:
+# ────────────────────────────────────────────────────────────
+# 3) Stream idle data from InfluxDB in time slices and fold each chunk into
+#    the running scaler stats and the window-vector reservoir
+# ────────────────────────────────────────────────────────────
+print("[PROGRESS] 10 querying InfluxDB", flush=True)
+stats = IngestStats()
+scaler = state["scaler"]
+aggregator = state["aggregator"]
+reservoir, seen = state["reservoir"], state["seen"]
+rng = np.random.default_rng()
+rng.bit_generator.state = state["rng"]
+last_time = state["last_time"]
+
+for chunk in iter_feature_chunks(MOTO_ID, start, row_filter=warm_idle, stats=stats, on_slice=report_slice):
+    X_raw = chunk[FEATURES].to_numpy()
+    # Running mean/variance (StandardScaler.partial_fit merges the chunk's moments)
+    scaler.partial_fit(X_raw)
+    # Sliding-window vectors (shared extractor with detect_anomalies)
+    reservoir, seen = reservoir_update(reservoir, seen, aggregator.feed(X_raw), rng, RESERVOIR_SIZE)
+    last_time = pd.Timestamp(chunk["_time"].iloc[-1]).tz_convert("UTC")
+
+print(stats.summary())
+print(f"Filtered to {stats.rows} rows where coolant_temp is between 70–105°C")
+
+min_rows = 1 if incremental else max(60, WINDOW_ROWS)   # fresh runs need at least one window
+if stats.raw_rows < min_rows or stats.rows < min_rows:
+    if incremental:
+        print("No new warm-idle data since the last run; model left unchanged.")
+        raise SystemExit(0)
+    if stats.raw_rows < min_rows:
+        raise RuntimeError("Not enough idle data to train a model!")
     raise RuntimeError("Not enough filtered warm-idle data to train the model!")
-
-X_raw = df[FEATURES].values
-
+if len(reservoir) == 0:
+    raise RuntimeError("Not enough warm-idle data for a single training window!")
 
 # ────────────────────────────────────────────────────────────
-# 4) Scale → Extract 24-feature vector → Train Isolation Forest
+# 4) Scale window vectors → train Isolation Forest
 # ────────────────────────────────────────────────────────────
-scaler = StandardScaler().fit(X_raw)
-X_scaled = scaler.transform(X_raw)
-
-# Extract mean, std, max, min per feature (→ 24 features)
-agg_features = np.hstack([
-    np.mean(X_scaled, axis=0),
-    np.std(X_scaled, axis=0),
-    np.max(X_scaled, axis=0),
-    np.min(X_scaled, axis=0)
-]).reshape(1, -1)  # Shape: (1, 24)
-
-# Train on the 24-feature vector
+print("[PROGRESS] 70 fitting model", flush=True)
+train_vectors = scale_aggregates(reservoir, scaler)
+
+# Train on the 24-feature window vectors
 model = IsolationForest(
     n_estimators=200,
     contamination=0.05,
     random_state=42
-).fit(agg_features)
+).fit(train_vectors)
 
 # ────────────────────────────────────────────────────────────
 # 5) Save model & scaler → models/<brand>/idle_<motorcycle_id>.pkl
 # ────────────────────────────────────────────────────────────
-out_dir  = os.path.join("models", BRAND)
+print("[PROGRESS] 90 saving model", flush=True)
 os.makedirs(out_dir, exist_ok=True)
-out_path = os.path.join(out_dir, f"{MODE}_{MOTO_ID}.pkl")
-
-joblib.dump({"model": model, "scaler": scaler}, out_path, compress=3)
 
-print(f" Trained on {len(df):,} rows for motorcycle {MOTO_ID}")
+# window_* tells detect_anomalies to aggregate exactly like training did
+joblib.dump({"model": model, "scaler": scaler,
+             "window_rows": WINDOW_ROWS, "window_step": WINDOW_STEP}, out_path, compress=3)
+joblib.dump({
+    **state,
+    "scaler": scaler,
+    "reservoir": reservoir,
+    "seen": seen,
+    "last_time": last_time,
+    "rng": rng.bit_generator.state,
+}, state_path, compress=3)
+
+print(f" Trained on {stats.rows:,} new rows ({len(train_vectors):,} window vectors, "
+      f"{int(scaler.n_samples_seen_):,} rows in total) for motorcycle {MOTO_ID}")
 print(f"Saved model to: {out_path}")
@@ -0,0 +1,168 @@
+"""
+train_shared_model.py
+─────────────────────
+Train ONE idle Isolation-Forest for a brand/model (the keys of
+normal_ranges.json) from several motorcycles, plus a calibration record per
+motorcycle:
+
+    models/<brand>/shared_idle_<model>.pkl
+    models/<brand>/idle_<motorcycle_id>.calib.json
+
+Every bike's window vectors are standardized with that bike's own scaler
+before they are pooled, so the forest learns the shape of a healthy idle
+rather than one bike's sensor offsets. A calibration record holds the bike's
+scaler statistics and its score offset (the CONTAMINATION quantile of the
+shared forest's scores on its own windows). Bikes with no own model and no
+record yet are centred on their own scored data, scaled by the fleet's
+median per-bike spread ("bike_scale"), and judged by the forest's own
+offset (see model_registry.py).
+
+Calibrating a new bike needs far less history than training a forest and
+leaves the shared model untouched (--calibrate).
+
+Example:
+    python train_shared_model.py --brand yamaha --model nmax_155 --motorcycle_ids 1 2 4 --minutes 43200
+    python train_shared_model.py --brand yamaha --model nmax_155 --calibrate 9 --minutes 1440
+"""
+
+import argparse
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+from influx_stream import IngestStats, iter_feature_chunks
+from model_registry import Calibration, ModelRegistry, save_calibration
+from window_features import WINDOW_ROWS, WINDOW_STEP, WindowAggregator, reservoir_update, scale_aggregates
+
+
+# ────────────────────────────────────────────────────────────
+# 1) CLI arguments
+# ────────────────────────────────────────────────────────────
+parser = argparse.ArgumentParser(description="Train a shared brand/model idle model and per-bike calibrations")
+parser.add_argument("--brand", required=True, help="e.g. yamaha")
+parser.add_argument("--model", required=True, help="e.g. nmax_155")
+group = parser.add_mutually_exclusive_group(required=True)
+group.add_argument("--motorcycle_ids", nargs="+", help="Bikes to train the shared forest on (all get calibrated)")
+group.add_argument("--calibrate", nargs="+", metavar="MOTORCYCLE_ID",
+                   help="Only calibrate these bikes against the existing shared forest")
+parser.add_argument("--minutes", type=int, default=60*24,
+                    help="How far back to pull data per bike (default 1 day)")
+args = parser.parse_args()
+
+BRAND = args.brand.strip().replace(" ", "_").lower()
+MODEL = args.model.strip().replace(" ", "_").lower()
+MODE  = "idle"
+
+RESERVOIR_SIZE = 5000       # max window vectors kept per bike
+CONTAMINATION = 0.05
+MIN_CALIBRATION_WINDOWS = 20    # fewer windows → keep the forest's own offset for the bike
+
+FEATURES = [
+    "rpm",
+    "engine_load",
+    "throttle_pos",
+    "long_fuel_trim_1",
+    "coolant_temp",
+    "elm_voltage",
+]
+
+registry = ModelRegistry("models", engine="sklearn")     # for the path layout only
+shared_path = registry.shared_path(BRAND, MODEL, MODE)
+os.makedirs(os.path.dirname(shared_path), exist_ok=True)
+
+
+def warm_idle(chunk):
+    # ✅ Filter by coolant temperature (same window as train_idle_model.py)
+    return chunk[(chunk["coolant_temp"] >= 70) & (chunk["coolant_temp"] <= 105)]
+
+
+# ────────────────────────────────────────────────────────────
+# 2) Stream each bike's warm-idle history into its own scaler and a
+#    reservoir of raw window vectors
+# ────────────────────────────────────────────────────────────
+def collect(moto_id, pooled=None):
+    """(scaler, raw window reservoir) for one bike; also folds its rows into `pooled`."""
+    start = pd.Timestamp.now(tz="UTC") - pd.Timedelta(minutes=args.minutes)
+    stats = IngestStats()
+    scaler = StandardScaler()
+    aggregator = WindowAggregator(WINDOW_ROWS, WINDOW_STEP)
+    reservoir, seen = np.empty((0, 4 * len(FEATURES))), 0
+    rng = np.random.default_rng(42)
+    for chunk in iter_feature_chunks(moto_id, start, row_filter=warm_idle, stats=stats):
+        X_raw = chunk[FEATURES].to_numpy()
+        scaler.partial_fit(X_raw)
+        if pooled is not None:
+            pooled.partial_fit(X_raw)
+        reservoir, seen = reservoir_update(reservoir, seen, aggregator.feed(X_raw), rng, RESERVOIR_SIZE)
+    print(f"[{moto_id}] {stats.summary()} → {seen:,} windows")
+    return (scaler if stats.rows else None), reservoir
+
+
+def calibrate(moto_id, forest, scaler, raw_windows):
+    vectors = scale_aggregates(raw_windows, scaler)
+    offset = None
+    if len(vectors) >= MIN_CALIBRATION_WINDOWS:
+        # Same definition as IsolationForest.offset_, on this bike's windows only
+        offset = float(np.percentile(forest.score_samples(vectors), 100 * CONTAMINATION))
+    calibration = Calibration(MODEL, scaler.mean_, scaler.scale_, offset,
+                              n_samples=scaler.n_samples_seen_, n_windows=len(vectors))
+    path = registry.calibration_path(BRAND, moto_id, MODE)
+    save_calibration(path, calibration)
+    note = f"offset {offset:.4f}" if offset is not None else f"only {len(vectors)} windows, shared offset kept"
+    print(f"Saved calibration to: {path} ({note})")
+
+
+# ────────────────────────────────────────────────────────────
+# 3a) --calibrate: new bikes against the existing shared forest
+# ────────────────────────────────────────────────────────────
+if args.calibrate:
+    if not os.path.exists(shared_path):
+        raise SystemExit(f"No shared model at {shared_path}; train one with --motorcycle_ids first")
+    forest = joblib.load(shared_path)["model"]
+    for moto_id in args.calibrate:
+        scaler, raw_windows = collect(str(moto_id))
+        if scaler is None:
+            print(f"[WARN] No warm-idle data for motorcycle {moto_id}; not calibrated")
+            continue
+        calibrate(str(moto_id), forest, scaler, raw_windows)
+    raise SystemExit(0)
+
+# ────────────────────────────────────────────────────────────
+# 3b) Train the shared forest on every bike's self-standardized windows
+# ────────────────────────────────────────────────────────────
+pooled = StandardScaler()
+per_bike = {}
+for moto_id in map(str, args.motorcycle_ids):
+    scaler, raw_windows = collect(moto_id, pooled)
+    if scaler is None or not len(raw_windows):
+        print(f"[WARN] Not enough warm-idle data for motorcycle {moto_id}; left out")
+        continue
+    per_bike[moto_id] = (scaler, raw_windows)
+if not per_bike:
+    raise RuntimeError("Not enough warm-idle data for a single training window!")
+
+train_vectors = np.vstack([scale_aggregates(w, s) for s, w in per_bike.values()])
+forest = IsolationForest(
+    n_estimators=200,
+    contamination=CONTAMINATION,
+    random_state=42
+).fit(train_vectors)
+
+# Typical within-bike spread, for bikes not calibrated yet (the pooled scale also
+# holds the spread between bikes)
+bike_scale = np.median([s.scale_ for s, _ in per_bike.values()], axis=0)
+
+joblib.dump({"model": forest, "scaler": pooled, "bike_scale": bike_scale,
+             "window_rows": WINDOW_ROWS, "window_step": WINDOW_STEP,
+             "brand": BRAND, "model_name": MODEL, "motorcycle_ids": sorted(per_bike)},
+            shared_path, compress=3)
+print(f"Trained on {len(train_vectors):,} window vectors from {len(per_bike)} motorcycles")
+print(f"Saved shared model to: {shared_path}")
+
+# ────────────────────────────────────────────────────────────
+# 4) Calibrate every training bike against the new forest
+# ────────────────────────────────────────────────────────────
+for moto_id, (scaler, raw_windows) in per_bike.items():
+    calibrate(moto_id, forest, scaler, raw_windows)
@@ -0,0 +1,213 @@
+"""
+training_jobs.py
+────────────────
+Asynchronous training queue for /train_model.
+
+Each job runs train_idle_model.py in a subprocess on a bounded worker pool,
+so a long 30-day fit never holds a Flask worker. Jobs get an ID, status and
+progress (parsed from the "[PROGRESS] <pct> <stage>" lines the script
+prints), concurrent requests for the same motorcycle share one job, and
+queued or running jobs can be cancelled.
+"""
+
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from live_state import LIVE_STATE, remote
+
+ACTIVE = ("queued", "running")
+_PROGRESS_RE = re.compile(r"^\[PROGRESS\]\s+(\d+)\s*(.*)$")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class TrainingJob:
+    def __init__(self, motorcycle_id, brand, minutes):
+        self.id = uuid.uuid4().hex
+        self.motorcycle_id = str(motorcycle_id)
+        self.brand = brand
+        self.minutes = minutes
+        self.status = "queued"
+        self.progress = 0
+        self.stage = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.returncode = None
+        self.output = deque(maxlen=500)     # last lines of script output
+        self.error = None
+        self.cancel_requested = False
+        self._proc = None
+        self._future = None
+
+    @property
+    def key(self):
+        return (self.brand, self.motorcycle_id)
+
+    def __getstate__(self):
+        # Pickled for an HTTP worker (live_state.py): the process and future stay behind
+        return dict(self.__dict__, _proc=None, _future=None)
+
+    def to_dict(self, with_output=False):
+        d = {
+            "job_id": self.id,
+            "motorcycle_id": self.motorcycle_id,
+            "brand": self.brand,
+            "minutes": self.minutes,
+            "status": self.status,
+            "progress": self.progress,
+            "stage": self.stage,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+        if with_output:
+            d["output"] = "\n".join(self.output)
+        return d
+
+
+class TrainingJobQueue:
+    def __init__(self, max_workers=2, max_pending=100, keep_finished=200,
+                 script="train_idle_model.py", on_success=None):
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self.script = script
+        self.on_success = on_success
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="train")
+        self._jobs = OrderedDict()      # job_id → TrainingJob, oldest first
+        self._active = {}               # (brand, motorcycle_id) → TrainingJob
+        self._lock = threading.Lock()
+
+    # ───────────── submission ─────────────
+    def submit(self, motorcycle_id, brand, minutes=43200):
+        """Queue a training job, or return the active one for the same motorcycle."""
+        brand = str(brand).strip().replace(" ", "_").lower()
+        job = TrainingJob(motorcycle_id, brand, minutes)
+        with self._lock:
+            existing = self._active.get(job.key)
+            if existing is not None:
+                return existing, False
+            pending = sum(1 for j in self._active.values() if j.status == "queued")
+            if pending >= self.max_pending:
+                raise QueueFull(f"Training queue is full ({pending} jobs waiting)")
+            self._jobs[job.id] = job
+            self._active[job.key] = job
+            self._prune()
+        job._future = self._pool.submit(self._run, job)
+        return job, True
+
+    def submit_many(self, motorcycles, minutes=43200):
+        """Queue one job per {"motorcycle_id", "brand"} entry; errors are reported per entry."""
+        results = []
+        for m in motorcycles:
+            motorcycle_id, brand = m.get("motorcycle_id"), m.get("brand")
+            if not motorcycle_id or not brand:
+                results.append({"motorcycle_id": motorcycle_id, "status": "error",
+                                "message": "Missing motorcycle_id or brand"})
+                continue
+            try:
+                job, created = self.submit(motorcycle_id, brand, m.get("minutes", minutes))
+                results.append({**job.to_dict(), "deduplicated": not created})
+            except QueueFull as e:
+                results.append({"motorcycle_id": str(motorcycle_id), "status": "error", "message": str(e)})
+        return results
+
+    # ───────────── queries / control ─────────────
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """Cancel a queued job or terminate a running one. Returns the job or None."""
+        job = self.get(job_id)
+        if job is None or job.status not in ACTIVE:
+            return job
+        job.cancel_requested = True
+        if job._future is not None and job._future.cancel():
+            self._finish(job, "cancelled")
+        elif job._proc is not None and job._proc.poll() is None:
+            job._proc.terminate()
+        return job
+
+    def shutdown(self):
+        for job in self.list():
+            self.cancel(job.id)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # ───────────── worker ─────────────
+    def _run(self, job):
+        if job.cancel_requested:
+            self._finish(job, "cancelled")
+            return
+        job.status, job.stage, job.started_at = "running", "starting", time.time()
+        cmd = [sys.executable, self.script,
+               "--motorcycle_id", job.motorcycle_id,
+               "--brand", job.brand,
+               "--minutes", str(job.minutes)]
+        print(f"[TRAIN] Job {job.id}: {' '.join(cmd)}")
+        try:
+            job._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                         universal_newlines=True)
+            if job.cancel_requested:         # cancelled while the process was starting
+                job._proc.terminate()
+            for line in iter(job._proc.stdout.readline, ""):
+                line = line.rstrip()
+                m = _PROGRESS_RE.match(line)
+                if m:
+                    job.progress, job.stage = int(m.group(1)), m.group(2) or job.stage
+                else:
+                    job.output.append(line)
+            job.returncode = job._proc.wait()
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, "failed")
+            return
+
+        if job.cancel_requested:
+            self._finish(job, "cancelled")
+        elif job.returncode != 0:
+            job.error = job.output[-1] if job.output else f"Training exited with code {job.returncode}"
+            self._finish(job, "failed")
+        else:
+            job.progress, job.stage = 100, "done"
+            self._finish(job, "succeeded")
+            if self.on_success:
+                self.on_success(job)
+
+    def _finish(self, job, status):
+        job.status, job.finished_at = status, time.time()
+        if status != "succeeded":
+            job.stage = status
+        job._proc = None
+        with self._lock:
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond keep_finished (called with the lock held)."""
+        finished = [jid for jid, j in self._jobs.items() if j.status not in ACTIVE]
+        for jid in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[jid]
+
+
+# Process-wide queue behind /train_model (owned by the ingest process in multi-worker serving)
+if LIVE_STATE == "remote":
+    TRAINING_JOBS = remote("training_jobs")
+else:
+    TRAINING_JOBS = TrainingJobQueue(
+        max_workers=int(os.environ.get("TRAIN_WORKERS", "2")),
+        max_pending=int(os.environ.get("TRAIN_MAX_PENDING", "100")),
+    )
@@ -0,0 +1,104 @@
+"""
+window_features.py
+──────────────────
+Sliding-window feature extraction shared by training (train_idle_model.py)
+and inference (anomaly_model.detect_anomalies), so the two can't drift.
+
+Every window of `window` consecutive rows, taken every `step` rows, becomes
+one 24-value vector: mean, std, max, min of each of the 6 FEATURES. Windows
+are NumPy strided views over the rows, reduced a block of windows at a time,
+so there is no per-window Python loop and temporary memory stays bounded by
+`chunk_windows`, whatever the history length.
+
+Aggregates are computed on RAW values; scale_aggregates() maps them into the
+StandardScaler space. Scaling is affine (x - mean) / scale, so this equals
+scaling every row first and aggregating afterwards.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+WINDOW_ROWS = 60        # rows per window (12 s at 5 Hz)
+WINDOW_STEP = 10        # rows between window starts
+CHUNK_WINDOWS = 4096    # windows reduced per block; bounds temporary memory
+
+
+def sliding_window_aggregates(X, window=WINDOW_ROWS, step=WINDOW_STEP, chunk_windows=CHUNK_WINDOWS):
+    """Raw (n_windows, 4 * n_features) aggregates for windows starting at rows 0, step, 2*step, ..."""
+    X = np.asarray(X, dtype=np.float64)
+    n_features = X.shape[1]
+    if len(X) < window:
+        return np.empty((0, 4 * n_features))
+
+    views = sliding_window_view(X, window, axis=0)[::step]     # (n_windows, n_features, window), no copy
+    out = np.empty((len(views), 4 * n_features))
+    for start in range(0, len(views), chunk_windows):
+        block = views[start:start + chunk_windows]
+        rows = slice(start, start + len(block))
+        out[rows, :n_features] = block.mean(axis=2)
+        out[rows, n_features:2 * n_features] = block.std(axis=2)
+        out[rows, 2 * n_features:3 * n_features] = block.max(axis=2)
+        out[rows, 3 * n_features:] = block.min(axis=2)
+    return out
+
+
+def reservoir_update(reservoir, seen, new, rng, capacity):
+    """Algorithm R over the rows of `new`; returns (reservoir, seen)."""
+    fill = min(max(capacity - len(reservoir), 0), len(new))
+    reservoir = np.vstack([reservoir, new[:fill]]) if len(reservoir) else new[:fill].copy()
+    rest = new[fill:]
+    if len(rest):
+        # Row k of `rest` is item number seen+fill+k; it replaces a random slot with prob capacity/(n+1)
+        slots = rng.integers(0, seen + fill + np.arange(len(rest)) + 1)
+        keep = slots < capacity
+        reservoir[slots[keep]] = rest[keep]      # later rows overwrite earlier ones, as in the sequential form
+    return reservoir, seen + len(new)
+
+
+def whole_window_aggregate(X):
+    """Single aggregate over all rows (the window shorter than WINDOW_ROWS case)."""
+    X = np.asarray(X, dtype=np.float64)
+    return np.hstack([X.mean(axis=0), X.std(axis=0), X.max(axis=0), X.min(axis=0)]).reshape(1, -1)
+
+
+def scale_aggregates(raw_aggs, scaler):
+    """Map raw window aggregates into the scaled space the model is trained on."""
+    n = len(scaler.mean_)
+    mu, sd = scaler.mean_, scaler.scale_
+    return np.hstack([
+        (raw_aggs[:, :n] - mu) / sd,
+        raw_aggs[:, n:2 * n] / sd,
+        (raw_aggs[:, 2 * n:3 * n] - mu) / sd,
+        (raw_aggs[:, 3 * n:] - mu) / sd,
+    ])
+
+
+class WindowAggregator:
+    """
+    Streaming form of sliding_window_aggregates: feed row chunks in order and
+    get the aggregates of every window completed so far. Only the rows of the
+    next, still incomplete window are carried between chunks, and the object
+    can be pickled to resume later (incremental training).
+    """
+
+    def __init__(self, window=WINDOW_ROWS, step=WINDOW_STEP):
+        self.window = window
+        self.step = step
+        self._carry = None      # rows not yet covered by a complete window
+        self._skip = 0          # rows to drop before the next window start (step > window)
+
+    def feed(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self._skip:
+            dropped = min(self._skip, len(X))
+            X, self._skip = X[dropped:], self._skip - dropped
+        if self._carry is not None and len(self._carry):
+            X = np.vstack([self._carry, X])
+
+        aggs = sliding_window_aggregates(X, self.window, self.step)
+        consumed = len(aggs) * self.step           # start row of the next window
+        if consumed > len(X):
+            self._skip = consumed - len(X)
+            consumed = len(X)
+        self._carry = X[consumed:].copy()
+        return aggs
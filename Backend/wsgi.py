@@ -0,0 +1,18 @@
+"""
+wsgi.py
+───────
+Entry point for serving the API with several worker processes:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Each worker imports server.py with LIVE_STATE=remote, so the MQTT-fed state
+(live windows, rollups, SSE streams, alerts, collectors, training jobs) is
+read from the one ingest process (ingest.py) instead of every worker
+subscribing to MQTT itself. gunicorn.conf.py starts that process.
+"""
+
+import os
+
+os.environ.setdefault("LIVE_STATE", "remote")
+
+from server import app  # noqa: E402
@@ -1,5 +1,4 @@
   import React, { useEffect, useState, useCallback } from "react";
-  import mqtt from "mqtt";
   import { useNavigate } from "react-router-dom";
   import { Line } from "react-chartjs-2";
   import axios from "axios";
@@ -96,61 +95,76 @@ import "react-toastify/dist/ReactToastify.css";
       }));
     }, []);
 
+    // Live OBD data pushed by the backend (SSE, filtered to this motorcycle server-side)
     useEffect(() => {
-          const client = mqtt.connect("wss://broker.hivemq.com:8884/mqtt", {
-        reconnectPeriod: 5000,
-        keepalive: 60,
-      });
-
-      client.on("connect", () => {
-        console.log("Connected to MQTT broker");
-        client.subscribe("obd/data");
-      });
+      if (!motorcycle?.id) return;
+      const params = new URLSearchParams({ motorcycle_id: motorcycle.id });
+      const source = new EventSource(`http://localhost:5000/obd-stream?${params}`);
 
-      client.on("message", (topic, message) => {
-        if (topic === "obd/data") {
-          const rawMessage = message.toString();
-          console.log("Raw MQTT message:", rawMessage);
-
-          try {
-            const payload = JSON.parse(rawMessage);
-            console.log("Parsed payload:", payload);
-
-            if (payload.motorcycle_id === String(motorcycle?.id)) {
-              const data = payload.data || {};
+      source.onmessage = (event) => {
+        try {
+          const payload = JSON.parse(event.data);
+          const data = payload.data || {};
 
-              // Match exact keys from MQTT data
-              const normalizedData = {
+          // Match exact keys from the collector's data
+          const normalizedData = {
             RPM: data.RPM || 0,
             COOLANT_TEMP: data.COOLANT_TEMP || 0,
             ELM_VOLTAGE: data.ELM_VOLTAGE || 0,
             ENGINE_LOAD: data.ENGINE_LOAD || 0,
             THROTTLE_POS: data.THROTTLE_POS ?? 0,
             LONG_TERM_FUEL_TRIM: data.LONG_FUEL_TRIM_1 ?? 0, // <-- map it here
-  };
+          };
+
+          setObdData(normalizedData);
+          updateChartData(normalizedData);
+        } catch (error) {
+          console.error("OBD stream parse error:", error);
+        }
+      };
+
+      return () => {
+        source.close();
+      };
+    }, [motorcycle, updateChartData]);
 
+    // Warning / critical alerts pushed by the backend's online detector
+    useEffect(() => {
+      if (!motorcycle?.id) return;
+      const params = new URLSearchParams({
+        motorcycle_id: motorcycle.id,
+        brand: motorcycle.brand || "",
+        model: motorcycle.model || "",
+      });
+      const source = new EventSource(`http://localhost:5000/alerts-stream?${params}`);
 
-              setObdData(normalizedData);
-              updateChartData(normalizedData);
-            } else {
-              console.log("Received data for another motorcycle:", payload.motorcycle_id);
-            }
-          } catch (error) {
-            console.error("MQTT parse error:", error);
+      source.onmessage = (event) => {
+        try {
+          const alert = JSON.parse(event.data);
+          if (alert.level === "critical") {
+            toast.error(`🔴 ${alert.message}`, { toastId: `${alert.feature}-critical` });
+          } else if (alert.level === "warning") {
+            toast.warn(`🟡 ${alert.message}`, { toastId: `${alert.feature}-warning` });
+          } else {
+            toast.success(`🟢 ${alert.feature} back to normal.`);
           }
+        } catch (error) {
+          console.error("Alert parse error:", error);
         }
-      });
+      };
 
       return () => {
-        client.end();
+        source.close();
       };
-    }, [motorcycle, updateChartData]);
+    }, [motorcycle]);
 
 const handleStartOBD = async () => {
   toast.info("🔄 Starting OBD connection...");
   try {
     const res = await axios.post("http://localhost:5000/start-obd", {
       motorcycle_id: motorcycle?.id,
+      brand: motorcycle?.brand,
+      model: motorcycle?.model,
     });
 
     const msg = res.data?.message || "";
@@ -192,7 +206,10 @@ const handleStartOBD = async () => {
 const handleStopOBD = async () => {
   toast.info("🛑 Stopping OBD connection...");
   try {
-    const res = await axios.get("http://localhost:5000/stop-obd");
+    // Only this bike's collector; other bays may be collecting at the same time
+    const res = await axios.get("http://localhost:5000/stop-obd", {
+      params: { motorcycle_id: motorcycle?.id },
+    });
     const msg = res.data?.message || "";
 
     if (msg.includes("stopped")) {
@@ -28,6 +28,23 @@ import normalRangesData from "./normal_ranges.json";
 
 import "./PredictiveMaintenance.css";
 
+const RECENT_DATA_PAGE_ROWS = 5000;
+
+// {"_time": [ms], rpm: [...], ...} → [{_time, rpm, ...}], times formatted like the row format's
+const columnsToRows = (columns) => {
+  const names = Object.keys(columns);
+  const count = names.length ? columns[names[0]].length : 0;
+  const rows = new Array(count);
+  for (let i = 0; i < count; i++) {
+    const row = {};
+    for (const name of names) {
+      row[name] = name === "_time" ? new Date(columns[name][i]).toUTCString() : columns[name][i];
+    }
+    rows[i] = row;
+  }
+  return rows;
+};
+
 function PredictiveMaintenance() {
   const navigate = useNavigate();
   const [minutes, setMinutes] = useState(30);
@@ -37,6 +54,7 @@ function PredictiveMaintenance() {
   const [sidebarOpen, setSidebarOpen] = useState(false);
   const [uploadedFile, setUploadedFile] = useState(null);
   const [useUploadedFile, setUseUploadedFile] = useState(false);
+  const [trainingJobId, setTrainingJobId] = useState(null);
 
 
   useEffect(() => {
@@ -52,14 +70,23 @@ function PredictiveMaintenance() {
   const fetchRows = async (motorcycle_id, mins, { silent = false } = {}) => {
     if (!silent) setLoading(true);
     try {
-      const { data } = await axios.post("http://localhost:5000/recent-data", {
-        motorcycle_id,
-        minutes: mins,
-      });
-      if (data.status === "ok") {
-        setRows(data.rows);
-        setAnalysis(null);
-      }
+      // Columnar pages are a fraction of the size of one object per row
+      const collected = [];
+      let cursor = null;
+      do {
+        const { data } = await axios.post("http://localhost:5000/recent-data", {
+          motorcycle_id,
+          minutes: mins,
+          format: "columnar",
+          limit: RECENT_DATA_PAGE_ROWS,
+          ...(cursor && { cursor }),
+        });
+        if (data.status !== "ok") return;
+        collected.push(...columnsToRows(data.columns));
+        cursor = data.next_cursor;
+      } while (cursor);
+      setRows(collected);
+      setAnalysis(null);
     } catch (err) {
       console.error(err);
       toast.error("❌ Failed to load data.");
@@ -75,6 +102,33 @@ useEffect(() => {
   }
 }, [useUploadedFile]);
 
+// Training runs in the background; poll the job until it finishes (stops on unmount too)
+useEffect(() => {
+  if (!trainingJobId) return;
+  const poll = setInterval(async () => {
+    try {
+      const { data } = await axios.get(`http://localhost:5000/train_model/jobs/${trainingJobId}`);
+      const status = data?.job?.status;
+      if (status === "succeeded") {
+        setTrainingJobId(null);
+        toast.success("✅ Model trained successfully!");
+      } else if (status === "failed" || status === "cancelled") {
+        setTrainingJobId(null);
+        console.error(data?.job?.error);
+        toast.error("❌ Training failed. Not enough Data");
+      }
+    } catch (err) {
+      setTrainingJobId(null);
+      console.error(err);
+      toast.error("❌ Lost track of the training job.");
+    }
+  }, 3000);
+
+  return () => {
+    clearInterval(poll);
+  };
+}, [trainingJobId]);
+
 
   const runPrediction = async () => {
   const selected = JSON.parse(localStorage.getItem("selectedMotorcycle"));
@@ -184,8 +238,14 @@ const saveRecentDataAsCSV = () => {
       brand,
     });
 
-    toast.success("✅ Model trained successfully!");
+    const jobId = res.data?.job?.job_id;
     console.log(res.data.message);
+    if (!jobId) {
+      toast.error("❌ Training could not be queued.");
+      return;
+    }
+    toast.info("🧠 Training started. This may take a few minutes...");
+    setTrainingJobId(jobId);
   } catch (err) {
     console.error(err);
     toast.error("❌ Training failed. Not enough Data");